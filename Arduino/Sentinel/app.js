@@ -31,6 +31,8 @@ let latestDetailAnalysis = null;
 let detailAnnotationReady = false;
 let vendorDb = null;
 const ouiVendors = new Map();
+const collectorVendors = new Map();
+let collectorVendorIndex = true;
 const BLE_COMPANIES = {
   "0x0000": "Ericsson AB", "0x0001": "Nokia Mobile Phones", "0x0002": "Intel Corp.",
   "0x0004": "Toshiba Corp.", "0x0006": "Microsoft", "0x0008": "Motorola",
@@ -107,12 +109,31 @@ function wifiVendorInfo(mac) {
   const first = parseInt(compact.slice(0, 2), 16);
   if (Number.isFinite(first) && (first & 2))
     return { name: null, source: "Locally administered address", confidence: "Vendor lookup unavailable" };
-  const prefix = normalizeOui(mac), name = ouiVendors.get(prefix) || null;
+  const prefix = normalizeOui(mac), imported = ouiVendors.get(prefix) || null;
+  const name = imported || collectorVendors.get(prefix) || null;
   return {
-    name, source: name ? `Imported IEEE OUI ${prefix}` : "No matching imported OUI",
+    name, source: imported ? `Imported IEEE OUI ${prefix}` :
+      name ? `Collector OUI index ${prefix}` : "No matching imported OUI",
     confidence: name ? "Likely interface vendor; product unknown" : "Unknown"
   };
 }
+// Asks the collector's on-flash OUI index (/api/vendor) for prefixes the
+// imported database does not cover, so no CSV import is needed.
+async function lookupCollectorVendors(macs) {
+  if (!collectorVendorIndex) return;
+  const prefixes = [...new Set(macs.map(normalizeOui))].filter(prefix =>
+    prefix.length === 6 && !(parseInt(prefix.slice(0, 2), 16) & 2) &&
+    !ouiVendors.has(prefix) && !collectorVendors.has(prefix));
+  try {
+    for (let index = 0; index < prefixes.length; index += 32) {
+      const batch = prefixes.slice(index, index + 32);
+      const response = await fetch(`/api/vendor?mac=${batch.join(",")}`, { cache: "no-store" });
+      if (!response.ok) { collectorVendorIndex = false; return; }
+      for (const [prefix, , name] of (await response.json()).items) collectorVendors.set(prefix, name);
+    }
+  } catch (error) { return; }
+  if (prefixes.length) { wifiDirty = true; dirty = true; }
+}
 function openVendorDatabase() {
   return new Promise((resolve, reject) => {
     const request = indexedDB.open("RyancitoSentinalVendors", 1);
@@ -485,6 +506,7 @@ worker.onmessage = event => {
       }
       wifiNetworks = message.networks;
       wifiScanNumber = message.scan;
+      lookupCollectorVendors(wifiNetworks.map(network => network.bssid));
       wifiDirty = true; dirty = true;
     }
     if (message.manual) {
@@ -549,6 +571,7 @@ function openBleDetail(device) {
   $("#detailFields").innerHTML = fieldRows({
     "Address": device.mac,
     "Address type": addressType(device.addrType),
+    "OUI vendor": device.vendor || (device.addrType === 0 ? "Unknown" : "Not applicable (random address)"),
     "Signal trend": movement[0],
     "Signal band": distance[0],
     "First seen": formatDate(device.firstSeen),
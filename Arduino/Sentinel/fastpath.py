@@ -0,0 +1,47 @@
+# RyancitoSentinel viper fast paths
+#
+# Optional. main.py imports this module at boot and keeps its pure-Python
+# payload_fingerprint/format_mac when the file is missing, fails to compile
+# (a port without the viper emitter), or disagrees with them on its
+# self-check vectors. The explicit uint() casts wrap at 32 bits in viper and
+# let tools/check_fastpaths.py run the same code under CPython.
+
+import micropython
+
+_HEX = b"0123456789ABCDEF"
+
+
+@micropython.viper
+def payload_fingerprint(payload) -> uint:
+    # FNV-1a, identical to main.payload_fingerprint_py
+    data = ptr8(payload)
+    length = int(len(payload))
+    value = uint(2166136261)
+    i = 0
+    while i < length:
+        value = uint((value ^ uint(data[i])) * uint(16777619))
+        i += 1
+    return value
+
+
+@micropython.viper
+def _mac_into(addr, out):
+    source = ptr8(addr)
+    target = ptr8(out)
+    digits = ptr8(_HEX)
+    i = 0
+    j = 0
+    while i < 6:
+        byte = source[i]
+        target[j] = digits[byte >> 4]
+        target[j + 1] = digits[byte & 15]
+        if i < 5:
+            target[j + 2] = 58  # ":"
+        i += 1
+        j += 3
+
+
+def format_mac(addr):
+    out = bytearray(17)
+    _mac_into(addr, out)
+    return str(out, "ascii")
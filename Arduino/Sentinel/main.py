@@ -4,12 +4,15 @@
 # The ESP32 collects bounded BLE evidence and serves a small sequence API.
 # Aggregation, storage, filtering, visualization, and exporting live in-browser.
 
+import array
 import bluetooth
+import errno
 import gc
 import machine
 import network
 import os
 import socket
+import struct
 import sys
 import time
 import ubinascii
@@ -20,6 +23,20 @@ try:
 except ImportError:
     import select
 
+try:
+    import uasyncio as asyncio
+except ImportError:
+    try:
+        import asyncio
+    except ImportError:
+        asyncio = None
+
+try:
+    import fastpath
+except Exception:
+    # Missing, or this port has no viper emitter (SyntaxError at import).
+    fastpath = None
+
 try:
     import secret
     # DEFAULT_* replaces HOME_*. The fallback keeps older secret.py files
@@ -38,19 +55,39 @@ except ImportError:
 
 # ----------------------------- configuration -----------------------------
 HTTP_PORT = 80
+SERVER_MODE = "poll"  # "poll" (serve_forever) or "asyncio" (serve_async)
 CONNECT_TIMEOUT_MS = 12_000
 
 RAW_RING_SIZE = 96
-EVIDENCE_RING_SIZE = 512
-MAX_TRACKED_DEVICES = 160
+EVIDENCE_RING_SIZE = 2048
+EVIDENCE_ARENA_BYTES = 57_344  # payload bytes; ~28 per record on average
+EVIDENCE_MAX_PAYLOAD = 255
+MAX_TRACKED_DEVICES = 1024
 DEFAULT_API_LIMIT = 50
 MAX_API_LIMIT = 100
+LONG_POLL_MAX_MS = 20_000
+MAX_LONG_POLLS = 4
+MAX_EVENT_STREAMS = 2
+SSE_KEEPALIVE_MS = 15_000
+MAX_HTTP_CONNECTIONS = 8
+HTTP_MAX_REQUEST = 1024
+HTTP_IO_CHUNK = 1024
+HTTP_READ_TIMEOUT_MS = 2_000
+HTTP_STALL_MS = 10_000
+LOOP_IDLE_MS = 5
+DRAIN_SLICE_US = 3_000     # time one drain may take at normal pressure
+DRAIN_LOW_WATER = 4        # at or below this, take the ring and yield
+DRAIN_FULL_PERCENT = 75    # at or above this fill, empty the ring
+DRAIN_MIN_ITEMS = 4
 
 MIN_RSSI = -100
 RSSI_DELTA_DB = 5
 HEARTBEAT_MS = 1_000
 WIFI_SCAN_MIN_INTERVAL_MS = 30_000
 FORCED_WIFI_MIN_INTERVAL_MS = 5_000
+WIFI_QUIET_ADV_PER_S = 20        # BLE ingress at or below this is quiet
+WIFI_SCAN_MAX_DEFER_MS = 10_000  # longest wait for a quiet moment
+FORCED_WIFI_MAX_DEFER_MS = 2_000
 PROXIMITY_STALE_MS = 5_000
 RSSI_IMMEDIATE = -50
 RSSI_STRONG = -70
@@ -61,6 +98,26 @@ SCAN_INTERVAL_US = 30_000
 SCAN_WINDOW_US = 30_000
 ACTIVE_SCAN = True
 
+# Optional scan governor (see govern_scan). It moves between the profiles
+# below, (interval_us, window_us, active), from quietest to lightest load;
+# SCAN_PROFILE_DEFAULT is the configured scan above.
+SCAN_GOVERNOR = False
+GOVERNOR_PERIOD_MS = 10_000
+GOVERNOR_FILL_HIGH_PERCENT = 50  # period peak ring fill counted as pressure
+GOVERNOR_FILL_LOW_PERCENT = 15   # below this, with no drops, step back
+GOVERNOR_QUIET_ADV_PER_S = 5     # full-duty rate below which to idle
+SCAN_PROFILES = (
+    (120_000, 30_000, True),   # quiet: 25% duty, active
+    (SCAN_INTERVAL_US, SCAN_WINDOW_US, ACTIVE_SCAN),
+    (30_000, 30_000, False),   # passive: no scan requests or responses
+    (60_000, 30_000, False),   # 50% duty, passive
+    (120_000, 30_000, False),  # 25% duty, passive
+)
+SCAN_PROFILE_DEFAULT = 1
+
+OUI_INDEX_FILE = "oui.bin"  # built by tools/build_oui_index.py; optional
+VENDOR_BATCH_MAX = 32
+
 LOG_LEVEL = 1  # 0=quiet, 1=status, 2=debug
 FIRMWARE_NAME = "RyancitoSentinal Collector"
 FIRMWARE_VERSION = "3.0.0"
@@ -71,9 +128,56 @@ RGB_GREEN_PIN = 0
 RGB_BLUE_PIN = 45
 # -----------------------------------------------------------------------
 
+# /api/updates.bin framing, little endian. A header, then per item a fixed
+# record followed by payload_length raw advertisement bytes.
+UPDATES_MAGIC = b"RSB1"
+UPDATES_HEADER = "<4sIIIBH"     # magic, from, to, dropped, reset, count
+UPDATES_RECORD = "<IiB6sbBBH"   # seq, elapsed_ms, addr_type, mac, rssi,
+                                # adv_type, flags, payload_length
+UPDATES_HEADER_SIZE = struct.calcsize(UPDATES_HEADER)
+UPDATES_RECORD_SIZE = struct.calcsize(UPDATES_RECORD)
+# With ?vendor=1 the frame is tagged UPDATES_MAGIC_VENDOR and every record
+# carries a u16 vendor id (see oui_lookup) between the record and payload.
+UPDATES_MAGIC_VENDOR = b"RSB2"
+UPDATES_VENDOR_SIZE = 2
+
+# Evidence slab record. The first EVIDENCE_SHARED_SIZE bytes have the same
+# layout as the start of an UPDATES_RECORD, so the binary API copies them.
+EVIDENCE_RECORD = "<IiB6sbBBIBH"  # seq, elapsed_ms, addr_type, mac, rssi,
+                                  # adv_type, flags, payload offset/length,
+                                  # vendor id
+EVIDENCE_RECORD_SIZE = struct.calcsize(EVIDENCE_RECORD)
+EVIDENCE_SHARED_SIZE = UPDATES_RECORD_SIZE - 2
+_EVIDENCE_OFFSET = EVIDENCE_SHARED_SIZE
+_EVIDENCE_LENGTH = EVIDENCE_SHARED_SIZE + 4
+_EVIDENCE_VENDOR = EVIDENCE_SHARED_SIZE + 5
+
+# OUI vendor index: header, then a fence table holding the first prefix of
+# every block of block_records records (3 bytes each), then the records,
+# sorted by prefix, then the vendor names as u8 length + UTF-8 bytes.
+OUI_MAGIC = b"OUI1"
+OUI_HEADER = "<4sIII"  # magic, count, block_records, names_offset
+OUI_HEADER_SIZE = struct.calcsize(OUI_HEADER)
+OUI_RECORD_SIZE = 6    # prefix (MAC byte order), name offset (u24 LE)
+
+# Scan profile changes are written to the evidence ring as marker records:
+# addr_type SCAN_MARKER_ADDR_TYPE, zero MAC, rssi 0, adv_type = profile
+# level, flags SCAN_CHANGE_FLAG, payload SCAN_CHANGE_PAYLOAD.
+SCAN_MARKER_ADDR_TYPE = 255
+SCAN_MARKER_MAC = bytes(6)
+SCAN_CHANGE_FLAG = 16
+SCAN_CHANGE_PAYLOAD = "<IIBB"   # interval_us, window_us, active, reason
+SCAN_CHANGE_REASONS = (
+    "start", "drops", "occupancy", "headroom", "quiet", "activity")
+
 _IRQ_SCAN_RESULT = const(5)
 _IRQ_SCAN_DONE = const(6)
 
+_CONN_READING = const(0)    # collecting the request head
+_CONN_WRITING = const(1)    # draining a response, then closing
+_CONN_PARKED = const(2)     # long poll waiting for evidence
+_CONN_STREAMING = const(3)  # event stream, written whenever events exist
+
 BOOT_MS = time.ticks_ms()
 
 orange = machine.Pin(ORANGE_PIN, machine.Pin.OUT)
@@ -95,21 +199,125 @@ raw_write = 0
 raw_count = 0
 raw_dropped = 0
 raw_high_water = 0
-
-# Evidence ring. Index is sequence modulo capacity.
-evidence_ring = [None] * EVIDENCE_RING_SIZE
+raw_received = 0
+raw_period_peak = 0  # high water since the last govern_scan period
+
+# Evidence ring, kept in preallocated slabs rather than Python objects.
+# evidence_meta holds one EVIDENCE_RECORD per slot (sequence modulo
+# capacity). evidence_arena holds payload bytes written circularly in
+# sequence order, so the payloads that get overwritten are always the
+# oldest ones; payload_oldest is the oldest sequence whose payload is
+# intact. evidence_overwritten counts every record that left the readable
+# window, whether its slot or its payload bytes were reused first.
+# Appending allocates nothing.
+evidence_meta = bytearray(EVIDENCE_RING_SIZE * EVIDENCE_RECORD_SIZE)
+evidence_arena = bytearray(EVIDENCE_ARENA_BYTES)
+arena_head = 0
+payload_oldest = 1
 next_sequence = 1
 evidence_overwritten = 0
 
-# Bounded deduplication state keyed by "address-type:MAC".
-device_state = {}
+# Bounded deduplication state. device_slot maps a device key
+# (address type << 48 | 48-bit MAC, see device_key) to a slot in the
+# preallocated parallel arrays below, so updating a known device stores
+# into arrays instead of building strings and tuples. Slots are doubly
+# linked in last-seen order (lru_head is the oldest, lru_tail the newest),
+# so refreshing a device and evicting the oldest one are both O(1).
+device_slot = {}
+slot_key = [0] * MAX_TRACKED_DEVICES
+slot_fingerprint = array.array("I", [0] * MAX_TRACKED_DEVICES)
+slot_rssi = array.array("b", [0] * MAX_TRACKED_DEVICES)
+slot_emit_ms = array.array("i", [0] * MAX_TRACKED_DEVICES)
+slot_seen_ms = array.array("i", [0] * MAX_TRACKED_DEVICES)
+slot_vendor = array.array("H", [0] * MAX_TRACKED_DEVICES)
+lru_prev = array.array("h", [-1] * MAX_TRACKED_DEVICES)
+lru_next = array.array("h", [-1] * MAX_TRACKED_DEVICES)
+lru_head = -1
+lru_tail = -1
+slots_used = 0
 wifi_cache = []
 wifi_scan_number = 0
 wifi_last_scan_ms = time.ticks_add(BOOT_MS, -WIFI_SCAN_MIN_INTERVAL_MS)
 wifi_scan_duration_ms = 0
 wifi_last_forced_ms = time.ticks_add(BOOT_MS, -FORCED_WIFI_MIN_INTERVAL_MS)
+
+# Wi-Fi scan scheduler (see schedule_wifi_scan). HTTP only marks a scan
+# pending; the main loop runs it when BLE ingress is quiet. The blind
+# window is the time BLE scanning is paused for it.
+wifi_scan_pending = False
+wifi_scan_forced = False
+wifi_scan_requested_ms = BOOT_MS
+wifi_scan_wait_ms = 0
+wifi_blind_count = 0
+wifi_blind_last_ms = 0
+wifi_blind_max_ms = 0
+wifi_blind_total_ms = 0
+ble_ingress_per_s = 0
+ingress_sampled_ms = BOOT_MS
+ingress_sampled_received = 0
 http_request_count = 0
 
+# HTTP clients, keyed by socket and driven by the poll loop in
+# serve_forever. accepting is False while the connection table is full and
+# the listening socket is left out of the poll set.
+poller = select.poll()
+http_server = None
+connections = {}
+accepting = True
+http_timeouts = 0
+
+# Connections held open until there is evidence to push: long polls are
+# [connection, after, limit, deadline_ms, binary, vendor] and event
+# streams are [connection, cursor, last_write_ms, vendor].
+long_polls = []
+event_streams = []
+
+# OUI vendor index, read from flash by oui_lookup. Only the fence table is
+# held in RAM; a lookup reads one block of records into oui_block.
+oui_file = None
+oui_count = 0
+oui_block_records = 0
+oui_records_offset = 0
+oui_names_offset = 0
+oui_fences = None
+oui_block = None
+oui_lookups = 0
+
+# Current scan profile and the governor's last decision and baselines.
+scan_level = SCAN_PROFILE_DEFAULT
+scan_changes = 0
+scan_change_reason = 0
+scan_changed_ms = BOOT_MS
+governor_last_ms = BOOT_MS
+governor_dropped = 0
+governor_received = 0
+
+# Set in asyncio mode: raw_ready wakes the drain task from the BLE IRQ and
+# push_ready wakes client tasks waiting on a long poll or event stream.
+raw_ready = None
+push_ready = None
+
+# Age of the oldest record in each process_raw batch, i.e. how long
+# advertisements wait in the IRQ ring before becoming evidence.
+ingest_lag_last_ms = 0
+ingest_lag_max_ms = 0
+
+# drain_budget() decisions. drain_item_us is a moving average of the
+# process_raw cost per record, seeded with a conservative guess.
+drain_item_us = 250
+drain_budget_last = 0
+drain_decision = "yield"
+drain_seen_high_water = 0
+drain_yields = 0
+drain_slices = 0
+drain_flushes = 0
+
+# Heap cost of process_raw and GC pause times, reported by /api/status.
+process_heap_bytes = 0
+process_heap_items = 0
+gc_last_us = 0
+gc_max_us = 0
+
 
 def log(level, *parts):
     if LOG_LEVEL >= level:
@@ -131,12 +339,16 @@ def led_off():
     set_rgb(0, 0, 0)
 
 
-def format_mac(addr):
+def format_mac_py(addr):
     value = ubinascii.hexlify(addr).decode().upper()
     return ":".join(value[i:i + 2] for i in range(0, 12, 2))
 
 
-def payload_fingerprint(payload):
+def device_key(addr_type, addr):
+    return (addr_type << 48) | int.from_bytes(addr, "big")
+
+
+def payload_fingerprint_py(payload):
     # Small FNV-1a implementation; performed outside the BLE IRQ.
     value = 2166136261
     for byte in payload:
@@ -145,8 +357,33 @@ def payload_fingerprint(payload):
     return value
 
 
+def fast_paths_agree(module):
+    # Boot-time self-check: the fast paths must match the references exactly.
+    try:
+        for sample in (b"", b"\x00", b"\xff" * 31, bytes(range(62))):
+            if module.payload_fingerprint(sample) != payload_fingerprint_py(
+                    sample):
+                return False
+        for addr in (b"\x00" * 6, b"\xff" * 6, b"\x01\x23\x45\x67\x89\xab"):
+            if module.format_mac(addr) != format_mac_py(addr):
+                return False
+    except Exception:
+        return False
+    return True
+
+
+payload_fingerprint = payload_fingerprint_py
+format_mac = format_mac_py
+fast_path_mode = "python"
+if fastpath is not None and fast_paths_agree(fastpath):
+    payload_fingerprint = fastpath.payload_fingerprint
+    format_mac = fastpath.format_mac
+    fast_path_mode = "viper"
+
+
 def ble_irq(event, data):
     global raw_write, raw_count, raw_dropped, raw_high_water
+    global raw_received, raw_period_peak
     if event != _IRQ_SCAN_RESULT:
         return
 
@@ -166,8 +403,13 @@ def ble_irq(event, data):
     )
     raw_write = (raw_write + 1) % RAW_RING_SIZE
     raw_count += 1
-    if raw_count > raw_high_water:
-        raw_high_water = raw_count
+    raw_received += 1
+    if raw_count > raw_period_peak:
+        raw_period_peak = raw_count
+        if raw_count > raw_high_water:
+            raw_high_water = raw_count
+    if raw_ready is not None:
+        raw_ready.set()
 
 
 def pop_raw():
@@ -181,31 +423,116 @@ def pop_raw():
     return item
 
 
+def lru_unlink(slot):
+    global lru_head, lru_tail
+    previous = lru_prev[slot]
+    following = lru_next[slot]
+    if previous >= 0:
+        lru_next[previous] = following
+    else:
+        lru_head = following
+    if following >= 0:
+        lru_prev[following] = previous
+    else:
+        lru_tail = previous
+
+
+def lru_append(slot):
+    global lru_head, lru_tail
+    lru_prev[slot] = lru_tail
+    lru_next[slot] = -1
+    if lru_tail >= 0:
+        lru_next[lru_tail] = slot
+    else:
+        lru_head = slot
+    lru_tail = slot
+
+
 def evict_oldest_device():
-    if not device_state:
-        return
-    oldest_key = None
-    oldest_ms = None
-    for key, state in device_state.items():
-        seen_ms = state[3]
-        if oldest_ms is None or time.ticks_diff(seen_ms, oldest_ms) < 0:
-            oldest_key = key
-            oldest_ms = seen_ms
-    if oldest_key is not None:
-        del device_state[oldest_key]
-
-
-def append_evidence(item):
-    global next_sequence, evidence_overwritten
+    # Observations are processed in arrival order, so the list head is the
+    # device with the oldest last-seen time.
+    slot = lru_head
+    if slot < 0:
+        return -1
+    lru_unlink(slot)
+    del device_slot[slot_key[slot]]
+    return slot
+
+
+def allocate_device(key):
+    global slots_used
+    if slots_used < MAX_TRACKED_DEVICES:
+        slot = slots_used
+        slots_used += 1
+    else:
+        slot = evict_oldest_device()
+    device_slot[key] = slot
+    slot_key[slot] = key
+    lru_append(slot)
+    return slot
+
+
+def evidence_base(sequence):
+    return ((sequence - 1) % EVIDENCE_RING_SIZE) * EVIDENCE_RECORD_SIZE
+
+
+def evidence_payload(base):
+    meta = evidence_meta
+    offset = (meta[base + _EVIDENCE_OFFSET] |
+              meta[base + _EVIDENCE_OFFSET + 1] << 8 |
+              meta[base + _EVIDENCE_OFFSET + 2] << 16 |
+              meta[base + _EVIDENCE_OFFSET + 3] << 24)
+    return offset, meta[base + _EVIDENCE_LENGTH]
+
+
+def release_payloads(start, end, sequence):
+    # Give up the oldest payloads overlapping arena[start:end]. Records
+    # still in the ring that this skips are lost to arena pressure and are
+    # counted here; append_evidence then does not count them again when
+    # their slot is reused.
+    global payload_oldest, evidence_overwritten
+    while payload_oldest < sequence:
+        if payload_oldest > sequence - EVIDENCE_RING_SIZE:
+            offset, length = evidence_payload(evidence_base(payload_oldest))
+            if length and offset < end and start < offset + length:
+                payload_oldest += 1
+            elif length:
+                break
+            else:
+                payload_oldest += 1  # empty payloads hold no arena bytes
+            evidence_overwritten += 1
+        else:
+            payload_oldest += 1  # record slot already reused
+
+
+def append_evidence(elapsed_ms, addr_type, addr, rssi, adv_type, flags,
+                    payload, vendor=0):
+    global next_sequence, evidence_overwritten, arena_head
     sequence = next_sequence
     next_sequence += 1
-    index = (sequence - 1) % EVIDENCE_RING_SIZE
-    if evidence_ring[index] is not None:
-        evidence_overwritten += 1
-    evidence_ring[index] = (sequence,) + item
+    if payload_oldest <= sequence - EVIDENCE_RING_SIZE:
+        evidence_overwritten += 1  # not already lost to arena pressure
+    length = len(payload)
+    if length > EVIDENCE_MAX_PAYLOAD:
+        length = EVIDENCE_MAX_PAYLOAD
+        payload = memoryview(payload)[:length]
+    start = arena_head
+    if length:
+        if start + length > EVIDENCE_ARENA_BYTES:
+            # Wrap; everything left past the head is older, so drop it first.
+            release_payloads(start, EVIDENCE_ARENA_BYTES, sequence)
+            start = 0
+        release_payloads(start, start + length, sequence)
+        evidence_arena[start:start + length] = payload
+        arena_head = start + length
+    struct.pack_into(
+        EVIDENCE_RECORD, evidence_meta, evidence_base(sequence), sequence,
+        elapsed_ms, addr_type, addr, rssi, adv_type, flags, start, length,
+        vendor)
 
 
 def process_raw(max_items=32):
+    global ingest_lag_last_ms, ingest_lag_max_ms
     processed = 0
     while processed < max_items:
         raw = pop_raw()
@@ -214,69 +541,143 @@ def process_raw(max_items=32):
         processed += 1
 
         addr_type, addr, adv_type, rssi, payload, observed_ms = raw
+        if processed == 1:
+            ingest_lag_last_ms = time.ticks_diff(time.ticks_ms(), observed_ms)
+            if ingest_lag_last_ms > ingest_lag_max_ms:
+                ingest_lag_max_ms = ingest_lag_last_ms
         if rssi < MIN_RSSI:
             continue
 
-        mac = format_mac(addr)
-        key = "{}:{}".format(addr_type, mac)
+        key = device_key(addr_type, addr)
         fingerprint = payload_fingerprint(payload)
-        previous = device_state.get(key)
+        slot = device_slot.get(key)
 
         emit = False
         flags = 0
-        if previous is None:
-            if len(device_state) >= MAX_TRACKED_DEVICES:
-                evict_oldest_device()
+        if slot is None:
+            slot = allocate_device(key)
+            slot_vendor[slot] = device_vendor(addr_type, addr)
             emit = True
             flags |= 1  # first seen
         else:
-            previous_fingerprint, previous_rssi, previous_emit_ms, _ = previous
-            if fingerprint != previous_fingerprint:
+            if slot != lru_tail:
+                lru_unlink(slot)
+                lru_append(slot)
+            if fingerprint != slot_fingerprint[slot]:
                 emit = True
                 flags |= 2  # advertisement changed
-            if abs(rssi - previous_rssi) >= RSSI_DELTA_DB:
+            if abs(rssi - slot_rssi[slot]) >= RSSI_DELTA_DB:
                 emit = True
                 flags |= 4  # significant RSSI change
-            if time.ticks_diff(observed_ms, previous_emit_ms) >= HEARTBEAT_MS:
+            if time.ticks_diff(observed_ms, slot_emit_ms[slot]) >= HEARTBEAT_MS:
                 emit = True
                 flags |= 8  # periodic heartbeat
 
         if emit:
-            elapsed_ms = time.ticks_diff(observed_ms, BOOT_MS)
-            # Compact evidence tuple:
-            # seq is prepended by append_evidence.
-            # [elapsed_ms, addr_type, mac, rssi, adv_type, flags, adv_hex]
-            append_evidence((
-                elapsed_ms,
+            # The MAC and payload are stored as raw bytes and only
+            # formatted by evidence_row() when served.
+            append_evidence(
+                time.ticks_diff(observed_ms, BOOT_MS),
                 addr_type,
-                mac,
+                addr,
                 rssi,
                 adv_type,
                 flags,
-                ubinascii.hexlify(payload).decode(),
-            ))
-            last_emit_ms = observed_ms
-        else:
-            last_emit_ms = previous[2]
-
-        device_state[key] = (
-            fingerprint,
-            rssi,
-            last_emit_ms,
-            observed_ms,
-        )
+                payload,
+                slot_vendor[slot],
+            )
+            slot_emit_ms[slot] = observed_ms
+
+        slot_fingerprint[slot] = fingerprint
+        slot_rssi[slot] = rssi
+        slot_seen_ms[slot] = observed_ms
     return processed
 
 
+def start_scan():
+    interval_us, window_us, active = SCAN_PROFILES[scan_level]
+    ble.gap_scan(0, interval_us, window_us, active)
+
+
+def set_scan_level(level, reason):
+    # Restarts scanning with SCAN_PROFILES[level] and records the change
+    # as a marker record, so the evidence stream carries its own sampling
+    # conditions. reason indexes SCAN_CHANGE_REASONS.
+    global scan_level, scan_changes, scan_change_reason, scan_changed_ms
+    scan_level = level
+    scan_changes += 1
+    scan_change_reason = reason
+    scan_changed_ms = time.ticks_ms()
+    interval_us, window_us, active = SCAN_PROFILES[level]
+    try:
+        ble.gap_scan(None)
+    except Exception:
+        pass
+    start_scan()
+    append_evidence(
+        time.ticks_diff(scan_changed_ms, BOOT_MS), SCAN_MARKER_ADDR_TYPE,
+        SCAN_MARKER_MAC, 0, level, SCAN_CHANGE_FLAG,
+        struct.pack(
+            SCAN_CHANGE_PAYLOAD, interval_us, window_us, int(active), reason))
+
+
+def govern_scan(now):
+    # Once per GOVERNOR_PERIOD_MS, compares drops and the period's peak ring
+    # fill with the set points. Drops or a fill at GOVERNOR_FILL_HIGH_PERCENT
+    # step to a lighter profile. A low fill steps back towards the default,
+    # and drops to the quiet profile while the advertisement rate (scaled
+    # to full duty) stays under GOVERNOR_QUIET_ADV_PER_S. Activity leaves
+    # the quiet profile whatever the fill, since its light duty keeps the
+    # ring nearly empty even when the room is busy.
+    global governor_last_ms, governor_dropped, governor_received
+    global raw_period_peak
+    elapsed = time.ticks_diff(now, governor_last_ms)
+    if elapsed < GOVERNOR_PERIOD_MS:
+        return
+    dropped = raw_dropped - governor_dropped
+    received = raw_received - governor_received
+    fill = raw_period_peak * 100 // RAW_RING_SIZE
+    governor_last_ms = now
+    governor_dropped = raw_dropped
+    governor_received = raw_received
+    raw_period_peak = raw_count
+
+    interval_us, window_us, _ = SCAN_PROFILES[scan_level]
+    rate = received * 1000 * interval_us // (elapsed * window_us)
+    level = scan_level
+    reason = 0
+    if dropped or fill >= GOVERNOR_FILL_HIGH_PERCENT:
+        if scan_level < len(SCAN_PROFILES) - 1:
+            level = scan_level + 1
+            reason = 1 if dropped else 2
+    elif (scan_level < SCAN_PROFILE_DEFAULT and
+            rate >= GOVERNOR_QUIET_ADV_PER_S * 2):
+        level = SCAN_PROFILE_DEFAULT
+        reason = 5
+    elif fill < GOVERNOR_FILL_LOW_PERCENT:
+        if scan_level > SCAN_PROFILE_DEFAULT:
+            level = scan_level - 1
+            reason = 3
+        elif (scan_level == SCAN_PROFILE_DEFAULT and
+                rate < GOVERNOR_QUIET_ADV_PER_S):
+            level = 0
+            reason = 4
+    if level != scan_level:
+        log(1, "Scan profile", level, SCAN_CHANGE_REASONS[reason])
+        set_scan_level(level, reason)
+
+
 def update_proximity_led():
     now = time.ticks_ms()
     strongest_rssi = None
-    for state in device_state.values():
-        rssi = state[1]
-        last_seen_ms = state[3]
-        if time.ticks_diff(now, last_seen_ms) <= PROXIMITY_STALE_MS:
-            if strongest_rssi is None or rssi > strongest_rssi:
-                strongest_rssi = rssi
+    # Walk newest to oldest and stop at the first stale device.
+    slot = lru_tail
+    while slot >= 0 and time.ticks_diff(
+            now, slot_seen_ms[slot]) <= PROXIMITY_STALE_MS:
+        rssi = slot_rssi[slot]
+        if strongest_rssi is None or rssi > strongest_rssi:
+            strongest_rssi = rssi
+        slot = lru_prev[slot]
 
     if strongest_rssi is None or strongest_rssi < RSSI_WEAK:
         set_rgb(28, 28, 28)       # gray: stale or very weak
@@ -291,10 +692,41 @@ def update_proximity_led():
 
 
 def oldest_sequence():
-    return max(1, next_sequence - EVIDENCE_RING_SIZE)
-
-
-def get_updates(after, limit):
+    return max(1, next_sequence - EVIDENCE_RING_SIZE, payload_oldest)
+
+
+def record_heap_use(heap_before, processed):
+    global process_heap_bytes, process_heap_items
+    used = gc.mem_alloc() - heap_before
+    if used >= 0:  # negative means a collection ran mid-batch; skip it
+        process_heap_bytes += used
+        process_heap_items += processed
+
+
+def evidence_row(sequence, vendor=False):
+    # API item: [seq, elapsed_ms, addr_type, mac, rssi, adv_type, flags,
+    # adv_hex], plus vendor_id when vendor is set.
+    (sequence, elapsed_ms, addr_type, addr, rssi, adv_type, flags, offset,
+     length, vendor_id) = struct.unpack_from(
+        EVIDENCE_RECORD, evidence_meta, evidence_base(sequence))
+    row = [
+        sequence,
+        elapsed_ms,
+        addr_type,
+        format_mac(addr),
+        rssi,
+        adv_type,
+        flags,
+        ubinascii.hexlify(evidence_arena[offset:offset + length]).decode(),
+    ]
+    if vendor:
+        row.append(vendor_id)
+    return row
+
+
+def select_updates(after, limit):
+    # Returns (after, dropped, reset, first, last) for one API batch; every
+    # sequence from first to last is held in the slabs.
     newest = next_sequence - 1
     oldest = oldest_sequence()
     reset = after > newest and after > 0
@@ -307,23 +739,158 @@ def get_updates(after, limit):
         requested_start = oldest
 
     end = min(newest, requested_start + limit - 1)
-    items = []
-    sequence = requested_start
-    while sequence <= end:
-        item = evidence_ring[(sequence - 1) % EVIDENCE_RING_SIZE]
-        if item is not None and item[0] == sequence:
-            items.append(item)
-        sequence += 1
+    return after, dropped, reset, requested_start, end
+
 
+def get_updates(after, limit, vendor=False):
+    after, dropped, reset, first, last = select_updates(after, limit)
+    items = [evidence_row(sequence, vendor)
+             for sequence in range(first, last + 1)]
     return {
-        "from": items[0][0] if items else after + 1,
-        "to": items[-1][0] if items else after,
+        "from": first if items else after + 1,
+        "to": last if items else after,
         "dropped": dropped,
         "reset": reset,
         "items": items,
     }
 
 
+def get_updates_bin(after, limit, vendor=False):
+    # Same batch as get_updates, copied from the slabs into one buffer.
+    after, dropped, reset, first, last = select_updates(after, limit)
+    count = max(0, last - first + 1)
+    record_size = UPDATES_RECORD_SIZE
+    if vendor:
+        record_size += UPDATES_VENDOR_SIZE
+    size = UPDATES_HEADER_SIZE + count * record_size
+    for sequence in range(first, last + 1):
+        size += evidence_meta[evidence_base(sequence) + _EVIDENCE_LENGTH]
+    body = bytearray(size)
+    struct.pack_into(
+        UPDATES_HEADER, body, 0,
+        UPDATES_MAGIC_VENDOR if vendor else UPDATES_MAGIC,
+        first if count else after + 1, last if count else after,
+        dropped, 1 if reset else 0, count)
+    meta = memoryview(evidence_meta)
+    arena = memoryview(evidence_arena)
+    position = UPDATES_HEADER_SIZE
+    for sequence in range(first, last + 1):
+        base = evidence_base(sequence)
+        offset, length = evidence_payload(base)
+        body[position:position + EVIDENCE_SHARED_SIZE] = (
+            meta[base:base + EVIDENCE_SHARED_SIZE])
+        body[position + EVIDENCE_SHARED_SIZE] = length
+        if vendor:
+            body[position + UPDATES_RECORD_SIZE] = meta[base + _EVIDENCE_VENDOR]
+            body[position + UPDATES_RECORD_SIZE + 1] = (
+                meta[base + _EVIDENCE_VENDOR + 1])
+        position += record_size
+        body[position:position + length] = arena[offset:offset + length]
+        position += length
+    return body
+
+
+def load_oui_index(filename=OUI_INDEX_FILE):
+    # Opens the index written by tools/build_oui_index.py and keeps it open;
+    # collection works the same without it, just with vendor id 0.
+    global oui_file, oui_count, oui_block_records, oui_records_offset
+    global oui_names_offset, oui_fences, oui_block
+    try:
+        index = open(filename, "rb")
+    except OSError:
+        return False
+    header = index.read(OUI_HEADER_SIZE)
+    count = block_records = 0
+    if len(header) == OUI_HEADER_SIZE and header[:4] == OUI_MAGIC:
+        _, count, block_records, names_offset = struct.unpack(
+            OUI_HEADER, header)
+    if not count or not block_records:
+        index.close()
+        log(1, "Ignoring", filename, "(not an OUI index)")
+        return False
+    blocks = (count + block_records - 1) // block_records
+    raw = index.read(blocks * 3)
+    fences = array.array("I", [0] * blocks)
+    for block in range(blocks):
+        fences[block] = (raw[block * 3] << 16 | raw[block * 3 + 1] << 8 |
+                         raw[block * 3 + 2])
+    oui_file = index
+    oui_count = count
+    oui_block_records = block_records
+    oui_records_offset = OUI_HEADER_SIZE + blocks * 3
+    oui_names_offset = names_offset
+    oui_fences = fences
+    oui_block = bytearray(block_records * OUI_RECORD_SIZE)
+    log(1, "OUI index:", count, "prefixes")
+    return True
+
+
+def oui_lookup(prefix):
+    # Vendor id (1-based record number) of a 24-bit OUI, or 0. A binary
+    # search over the fences picks the block, one readinto loads it, and a
+    # second binary search runs in RAM.
+    global oui_lookups
+    if oui_file is None or prefix < oui_fences[0]:
+        return 0
+    oui_lookups += 1
+    low = 0
+    high = len(oui_fences) - 1
+    while low < high:
+        middle = (low + high + 1) // 2
+        if oui_fences[middle] <= prefix:
+            low = middle
+        else:
+            high = middle - 1
+    first = low * oui_block_records
+    count = min(oui_block_records, oui_count - first)
+    oui_file.seek(oui_records_offset + first * OUI_RECORD_SIZE)
+    oui_file.readinto(memoryview(oui_block)[:count * OUI_RECORD_SIZE])
+    records = oui_block
+    low = 0
+    high = count - 1
+    while low <= high:
+        middle = (low + high) // 2
+        base = middle * OUI_RECORD_SIZE
+        value = records[base] << 16 | records[base + 1] << 8 | records[base + 2]
+        if value == prefix:
+            return first + middle + 1
+        if value < prefix:
+            low = middle + 1
+        else:
+            high = middle - 1
+    return 0
+
+
+def oui_name(vendor_id):
+    if oui_file is None or not 0 < vendor_id <= oui_count:
+        return None
+    oui_file.seek(
+        oui_records_offset + (vendor_id - 1) * OUI_RECORD_SIZE + 3)
+    raw = oui_file.read(3)
+    oui_file.seek(oui_names_offset + (raw[0] | raw[1] << 8 | raw[2] << 16))
+    length = oui_file.read(1)[0]
+    return oui_file.read(length).decode()
+
+
+def oui_prefix(text):
+    # "AA:BB:CC:DD:EE:FF", "AA-BB-CC" or "AABBCC" -> 0xAABBCC, else None.
+    digits = text.replace(":", "").replace("-", "")
+    if len(digits) < 6:
+        return None
+    try:
+        return int(digits[:6], 16)
+    except ValueError:
+        return None
+
+
+def device_vendor(addr_type, addr):
+    # Only public addresses carry an IEEE OUI; random ones and locally
+    # administered addresses get 0.
+    if oui_file is None or addr_type != 0 or addr[0] & 2:
+        return 0
+    return oui_lookup(addr[0] << 16 | addr[1] << 8 | addr[2])
+
+
 def wifi_security(authmode):
     return {
         0: "Open",
@@ -337,18 +904,62 @@ def wifi_security(authmode):
     }.get(authmode, "Unknown ({})".format(authmode))
 
 
-def scan_wifi_if_due(force=False):
-    global wifi_cache, wifi_scan_number, wifi_last_scan_ms
-    global wifi_scan_duration_ms, wifi_last_forced_ms
+def request_wifi_scan(force=False):
+    # Marks a scan pending for schedule_wifi_scan. Returns False when a
+    # forced scan is refused by the cooldown, None when the cache is fresh
+    # and True when a scan is pending.
+    global wifi_scan_pending, wifi_scan_forced, wifi_scan_requested_ms
+    global wifi_last_forced_ms
     now = time.ticks_ms()
-    if (force and time.ticks_diff(now, wifi_last_forced_ms) <
-            FORCED_WIFI_MIN_INTERVAL_MS):
-        return False
-    if (not force and wifi_cache and
+    if force:
+        if (time.ticks_diff(now, wifi_last_forced_ms) <
+                FORCED_WIFI_MIN_INTERVAL_MS):
+            return False
+        wifi_last_forced_ms = now
+        wifi_scan_forced = True
+    elif (not wifi_scan_pending and wifi_cache and
             time.ticks_diff(now, wifi_last_scan_ms) <
             WIFI_SCAN_MIN_INTERVAL_MS):
+        return None
+    if not wifi_scan_pending:
+        wifi_scan_pending = True
+        wifi_scan_requested_ms = now
+    return True
+
+
+def wifi_scan_defer_limit():
+    return FORCED_WIFI_MAX_DEFER_MS if wifi_scan_forced else WIFI_SCAN_MAX_DEFER_MS
+
+
+def schedule_wifi_scan(now):
+    # Called every 100 ms. Tracks the BLE ingress rate and starts a pending
+    # scan once it is at or below WIFI_QUIET_ADV_PER_S, or when the scan
+    # has waited wifi_scan_defer_limit(), so the blind window is both
+    # placed in a lull and bounded in when it can happen.
+    global ble_ingress_per_s, ingress_sampled_ms, ingress_sampled_received
+    elapsed = time.ticks_diff(now, ingress_sampled_ms)
+    if elapsed > 0:
+        sample = (raw_received - ingress_sampled_received) * 1000 // elapsed
+        ble_ingress_per_s = (ble_ingress_per_s * 3 + sample) // 4
+        ingress_sampled_ms = now
+        ingress_sampled_received = raw_received
+    if not wifi_scan_pending:
+        return
+    waited = time.ticks_diff(now, wifi_scan_requested_ms)
+    if (ble_ingress_per_s > WIFI_QUIET_ADV_PER_S and
+            waited < wifi_scan_defer_limit()):
         return
+    run_wifi_scan(waited)
 
+
+def run_wifi_scan(waited_ms):
+    global wifi_cache, wifi_scan_number, wifi_last_scan_ms
+    global wifi_scan_duration_ms, wifi_scan_pending, wifi_scan_forced
+    global wifi_scan_wait_ms, wifi_blind_count, wifi_blind_last_ms
+    global wifi_blind_max_ms, wifi_blind_total_ms
+    wifi_scan_pending = False
+    wifi_scan_forced = False
+    wifi_scan_wait_ms = waited_ms
     started = time.ticks_ms()
     # ESP32-S3 shares its 2.4 GHz radio. Pause BLE intentionally instead of
     # letting the IRQ ingress ring overflow during the blocking WLAN scan.
@@ -356,7 +967,8 @@ def scan_wifi_if_due(force=False):
         ble.gap_scan(None)
     except Exception:
         pass
-    process_raw(RAW_RING_SIZE)
+    # Scanning is paused, so this empties the ring.
+    drain_ble(raw_count)
 
     results = []
     try:
@@ -384,12 +996,16 @@ def scan_wifi_if_due(force=False):
         wifi_cache = results
         wifi_scan_number += 1
         wifi_last_scan_ms = time.ticks_ms()
-        if force:
-            wifi_last_forced_ms = wifi_last_scan_ms
+    except Exception as e:
+        print_exception("Wi-Fi scan failed:", e)
     finally:
-        ble.gap_scan(0, SCAN_INTERVAL_US, SCAN_WINDOW_US, ACTIVE_SCAN)
+        start_scan()
         wifi_scan_duration_ms = time.ticks_diff(time.ticks_ms(), started)
-    return True
+        wifi_blind_count += 1
+        wifi_blind_last_ms = wifi_scan_duration_ms
+        wifi_blind_total_ms += wifi_scan_duration_ms
+        if wifi_blind_last_ms > wifi_blind_max_ms:
+            wifi_blind_max_ms = wifi_blind_last_ms
 
 
 def connect_default():
@@ -470,41 +1086,299 @@ def request_path(target):
     return target.split("?", 1)[0]
 
 
-def send_headers(client, status, content_type, length, cache=False):
+class Connection:
+    # One client. The request head accumulates in request; the response is
+    # the unsent part of out, refilled from asset in HTTP_IO_CHUNK pieces
+    # once it drains. sock is the non-blocking socket in poll mode and None
+    # in asyncio mode, where serve_client does the I/O.
+    def __init__(self, sock, now):
+        self.sock = sock
+        self.mode = _CONN_READING
+        self.request = b""
+        self.out = b""
+        self.sent = 0
+        self.asset = None
+        self.asset_buffer = None
+        self.deadline_ms = time.ticks_add(now, HTTP_READ_TIMEOUT_MS)
+
+
+def watch(connection):
+    if connection.mode == _CONN_READING:
+        mask = select.POLLIN
+    elif connection.sent < len(connection.out) or connection.asset:
+        mask = select.POLLOUT
+    else:
+        # Parked or idle stream: only a hang-up is of interest.
+        mask = select.POLLIN
+    poller.modify(connection.sock, mask)
+
+
+def queue_output(connection, data):
+    if isinstance(data, str):
+        data = data.encode()
+    if connection.sent < len(connection.out):
+        data = bytes(connection.out[connection.sent:]) + data
+    else:
+        connection.deadline_ms = time.ticks_add(time.ticks_ms(), HTTP_STALL_MS)
+    connection.out = memoryview(data)
+    connection.sent = 0
+    if connection.mode != _CONN_STREAMING:
+        connection.mode = _CONN_WRITING
+    if connection.sock is not None:
+        watch(connection)
+
+
+def response_headers(status, content_type, length, cache=False):
     cache_header = (
         "Cache-Control: public, max-age=86400\r\n"
         if cache else
         "Cache-Control: no-store\r\n"
     )
-    headers = (
+    return (
         "HTTP/1.1 {}\r\n"
         "Content-Type: {}\r\n"
         "Content-Length: {}\r\n"
         "{}"
         "Connection: close\r\n\r\n"
-    ).format(status, content_type, length, cache_header)
-    client.sendall(headers.encode())
+    ).format(status, content_type, length, cache_header).encode()
 
 
-def send_bytes(client, status, content_type, body, cache=False):
+def send_bytes(connection, status, content_type, body, cache=False):
     if isinstance(body, str):
         body = body.encode()
-    send_headers(client, status, content_type, len(body), cache)
-    client.sendall(body)
+    queue_output(
+        connection,
+        response_headers(status, content_type, len(body), cache) + body)
 
 
-def send_file(client, filename, content_type, cache=True):
+def send_file(connection, filename, content_type, cache=True):
+    # The file is streamed by write_connection, one chunk per socket step.
     try:
         length = os.stat(filename)[6]
-        send_headers(client, "200 OK", content_type, length, cache)
-        with open(filename, "rb") as asset:
-            while True:
-                chunk = asset.read(1024)
-                if not chunk:
-                    break
-                client.sendall(chunk)
+        asset = open(filename, "rb")
     except OSError:
-        send_bytes(client, "404 Not Found", "text/plain", "Missing asset\n")
+        send_bytes(connection, "404 Not Found", "text/plain", "Missing asset\n")
+        return
+    connection.asset = asset
+    connection.asset_buffer = bytearray(HTTP_IO_CHUNK)
+    queue_output(
+        connection, response_headers("200 OK", content_type, length, cache))
+
+
+def close_client(client):
+    try:
+        client.close()
+    except Exception:
+        pass
+
+
+def release_connection(connection):
+    for waiting in (long_polls, event_streams):
+        for entry in waiting:
+            if entry[0] is connection:
+                waiting.remove(entry)
+                break
+    if connection.asset:
+        connection.asset.close()
+        connection.asset = None
+
+
+def refill_from_asset(connection):
+    # Moves the next asset chunk into out; False once the file is done.
+    count = connection.asset.readinto(connection.asset_buffer)
+    if count:
+        connection.out = memoryview(connection.asset_buffer)[:count]
+        connection.sent = 0
+        return True
+    connection.asset.close()
+    connection.asset = None
+    connection.asset_buffer = None
+    return False
+
+
+def close_connection(connection):
+    global accepting
+    connections.pop(connection.sock, None)
+    try:
+        poller.unregister(connection.sock)
+    except Exception:
+        pass
+    release_connection(connection)
+    close_client(connection.sock)
+    if not accepting and len(connections) < MAX_HTTP_CONNECTIONS:
+        poller.modify(http_server, select.POLLIN)
+        accepting = True
+
+
+def accept_clients(now):
+    global accepting
+    while len(connections) < MAX_HTTP_CONNECTIONS:
+        try:
+            client, _ = http_server.accept()
+        except OSError:
+            return
+        client.setblocking(False)
+        connections[client] = Connection(client, now)
+        poller.register(client, select.POLLIN)
+    # Full: leave further clients in the listen backlog.
+    poller.modify(http_server, 0)
+    accepting = False
+
+
+def read_connection(connection):
+    try:
+        data = connection.sock.recv(HTTP_MAX_REQUEST)
+    except OSError as e:
+        if e.args[0] != errno.EAGAIN:
+            close_connection(connection)
+        return
+    if connection.mode != _CONN_READING:
+        # Parked and streaming clients only ever send a hang-up.
+        if not data:
+            close_connection(connection)
+        return
+    request = connection.request + data
+    if data and b"\r\n\r\n" not in request and len(request) < HTTP_MAX_REQUEST:
+        connection.request = request
+        return
+    connection.request = b""
+    if request:
+        handle_http(connection, request[:HTTP_MAX_REQUEST])
+    if connection.mode == _CONN_READING:
+        close_connection(connection)
+
+
+def write_connection(connection):
+    if connection.sent < len(connection.out):
+        try:
+            sent = connection.sock.send(
+                connection.out[connection.sent:connection.sent + HTTP_IO_CHUNK])
+        except OSError as e:
+            if e.args[0] != errno.EAGAIN:
+                close_connection(connection)
+            return
+        if sent:
+            connection.sent += sent
+            connection.deadline_ms = time.ticks_add(
+                time.ticks_ms(), HTTP_STALL_MS)
+        if connection.sent < len(connection.out):
+            return
+    if connection.asset and refill_from_asset(connection):
+        return
+    connection.out = b""
+    connection.sent = 0
+    if connection.mode == _CONN_STREAMING:
+        watch(connection)
+    else:
+        close_connection(connection)
+
+
+def expire_connections(now):
+    # Reading clients get HTTP_READ_TIMEOUT_MS to send their request;
+    # clients with unsent output get HTTP_STALL_MS per step of progress.
+    global http_timeouts
+    for connection in list(connections.values()):
+        if connection.mode == _CONN_PARKED:
+            continue
+        if (connection.mode == _CONN_STREAMING and
+                connection.sent >= len(connection.out)):
+            continue
+        if time.ticks_diff(now, connection.deadline_ms) > 0:
+            http_timeouts += 1
+            close_connection(connection)
+
+
+def header_value(request, name):
+    # name is a lower-case bytes header name, e.g. b"last-event-id"
+    for line in request.split(b"\r\n")[1:]:
+        if not line:
+            break
+        key, _, value = line.partition(b":")
+        if key.strip().lower() == name:
+            return value.strip().decode()
+    return None
+
+
+def send_updates(connection, after, limit, binary, vendor):
+    if binary:
+        send_bytes(
+            connection, "200 OK", "application/octet-stream",
+            get_updates_bin(after, limit, vendor))
+    else:
+        send_bytes(
+            connection, "200 OK", "application/json",
+            ujson.dumps(get_updates(after, limit, vendor)))
+
+
+def open_event_stream(connection, after, vendor):
+    if len(event_streams) >= MAX_EVENT_STREAMS:
+        send_bytes(
+            connection, "503 Service Unavailable", "text/plain",
+            "Too many event streams\n")
+        return
+    connection.mode = _CONN_STREAMING
+    queue_output(
+        connection,
+        b"HTTP/1.1 200 OK\r\n"
+        b"Content-Type: text/event-stream\r\n"
+        b"Cache-Control: no-store\r\n"
+        b"Connection: keep-alive\r\n\r\n"
+        b"retry: 2000\n\n")
+    event_streams.append([connection, after, time.ticks_ms(), vendor])
+
+
+def service_long_polls(now):
+    # Returns the number of parked requests answered.
+    newest = next_sequence - 1
+    answered = 0
+    index = 0
+    while index < len(long_polls):
+        connection, after, limit, deadline_ms, binary, vendor = (
+            long_polls[index])
+        if newest == after and time.ticks_diff(deadline_ms, now) > 0:
+            index += 1
+            continue
+        long_polls.pop(index)
+        send_updates(connection, after, limit, binary, vendor)
+        answered += 1
+    return answered
+
+
+def service_event_streams(now):
+    # Each stream holds at most one unsent event; a slow reader falls
+    # behind on its cursor and is told about dropped records instead of
+    # buffering more. Returns the number of events queued.
+    newest = next_sequence - 1
+    queued = 0
+    for stream in event_streams:
+        connection, cursor, last_write_ms, vendor = stream
+        if connection.sent < len(connection.out):
+            continue
+        if newest != cursor:
+            packet = get_updates(cursor, MAX_API_LIMIT, vendor)
+            queue_output(
+                connection,
+                "id: {}\nevent: updates\ndata: {}\n\n".format(
+                    packet["to"], ujson.dumps(packet)))
+            stream[1] = packet["to"]
+            stream[2] = now
+            queued += 1
+        elif time.ticks_diff(now, last_write_ms) >= SSE_KEEPALIVE_MS:
+            queue_output(connection, b": keepalive\n\n")
+            stream[2] = now
+            queued += 1
+    return queued
+
+
+def service_push():
+    # True when output was queued for a parked or streaming client.
+    now = time.ticks_ms()
+    queued = 0
+    if long_polls:
+        queued += service_long_polls(now)
+    if event_streams:
+        queued += service_event_streams(now)
+    return queued > 0
 
 
 def diagnostics():
@@ -523,13 +1397,56 @@ def diagnostics():
         "raw_dropped": raw_dropped,
         "raw_buffer_high_water": raw_high_water,
         "evidence_capacity": EVIDENCE_RING_SIZE,
+        "evidence_arena_bytes": EVIDENCE_ARENA_BYTES,
         "evidence_overwritten": evidence_overwritten,
-        "tracked_devices": len(device_state),
+        "tracked_devices": len(device_slot),
+        "device_capacity": MAX_TRACKED_DEVICES,
+        "fast_paths": fast_path_mode,
+        "oui_index_entries": oui_count,
+        "oui_lookups": oui_lookups,
+        "process_heap_bytes_per_adv": (
+            process_heap_bytes // process_heap_items
+            if process_heap_items else 0),
+        "drain_budget_last": drain_budget_last,
+        "drain_decision": drain_decision,
+        "drain_item_us": drain_item_us,
+        "drain_yields": drain_yields,
+        "drain_slices": drain_slices,
+        "drain_flushes": drain_flushes,
+        "gc_last_us": gc_last_us,
+        "gc_max_us": gc_max_us,
         "wifi_scan_number": wifi_scan_number,
         "wifi_networks": len(wifi_cache),
         "wifi_scan_duration_ms": wifi_scan_duration_ms,
+        "wifi_scan_pending": wifi_scan_pending,
+        "wifi_scan_wait_ms": wifi_scan_wait_ms,
+        "wifi_blind_count": wifi_blind_count,
+        "wifi_blind_last_ms": wifi_blind_last_ms,
+        "wifi_blind_max_ms": wifi_blind_max_ms,
+        "wifi_blind_total_ms": wifi_blind_total_ms,
+        "ble_ingress_per_s": ble_ingress_per_s,
         "http_request_count": http_request_count,
+        "server_mode": (
+            "asyncio" if raw_ready is not None else "poll"),
+        "ingest_lag_last_ms": ingest_lag_last_ms,
+        "ingest_lag_max_ms": ingest_lag_max_ms,
+        "http_connections": len(connections),
+        "http_max_connections": MAX_HTTP_CONNECTIONS,
+        "http_timeouts": http_timeouts,
+        "long_polls": len(long_polls),
+        "event_streams": len(event_streams),
+        "long_poll_max_ms": LONG_POLL_MAX_MS,
         "free_heap": gc.mem_free(),
+        "scan_profile": {
+            "governor": SCAN_GOVERNOR,
+            "level": scan_level,
+            "interval_us": SCAN_PROFILES[scan_level][0],
+            "window_us": SCAN_PROFILES[scan_level][1],
+            "active": SCAN_PROFILES[scan_level][2],
+            "changes": scan_changes,
+            "reason": SCAN_CHANGE_REASONS[scan_change_reason],
+            "changed_ms": time.ticks_diff(scan_changed_ms, BOOT_MS),
+        },
         "config": {
             "min_rssi": MIN_RSSI,
             "rssi_delta_db": RSSI_DELTA_DB,
@@ -546,58 +1463,118 @@ def diagnostics():
     }
 
 
-def handle_http(client):
+def handle_http(connection, request):
+    # Queues a response on the connection, or parks it as a long poll or
+    # event stream; a connection left in _CONN_READING is closed.
     global http_request_count
     try:
         http_request_count += 1
-        client.settimeout(2)
-        request = client.recv(1024)
-        if not request:
-            return
         first_line = request.split(b"\r\n", 1)[0].split()
         if len(first_line) < 2:
-            send_bytes(client, "400 Bad Request", "text/plain", "Bad request\n")
+            send_bytes(connection, "400 Bad Request", "text/plain", "Bad request\n")
             return
         method = first_line[0].decode()
         target = first_line[1].decode()
         path = request_path(target)
         if method != "GET":
             send_bytes(
-                client, "405 Method Not Allowed", "text/plain", "GET only\n")
+                connection, "405 Method Not Allowed", "text/plain", "GET only\n")
             return
 
-        if path == "/api/updates":
+        if path == "/api/updates" or path == "/api/updates.bin":
             try:
                 after = max(0, int(query_value(target, "after", "0")))
                 limit = int(query_value(
                     target, "limit", str(DEFAULT_API_LIMIT)))
                 limit = max(1, min(MAX_API_LIMIT, limit))
+                wait_ms = max(0, min(LONG_POLL_MAX_MS, int(
+                    query_value(target, "wait", "0"))))
+            except ValueError:
+                send_bytes(
+                    connection, "400 Bad Request", "application/json",
+                    '{"error":"invalid query"}')
+                return
+            binary = path == "/api/updates.bin"
+            vendor = query_value(target, "vendor", "0") == "1"
+            if (wait_ms and after == next_sequence - 1 and
+                    len(long_polls) < MAX_LONG_POLLS):
+                connection.mode = _CONN_PARKED
+                connection.deadline_ms = time.ticks_add(
+                    time.ticks_ms(), wait_ms)
+                long_polls.append([
+                    connection, after, limit, connection.deadline_ms, binary,
+                    vendor])
+                return
+            send_updates(connection, after, limit, binary, vendor)
+            return
+
+        if path == "/api/stream":
+            try:
+                after = max(0, int(query_value(
+                    target, "after",
+                    header_value(request, b"last-event-id") or "0")))
             except ValueError:
                 send_bytes(
-                    client, "400 Bad Request", "application/json",
+                    connection, "400 Bad Request", "application/json",
                     '{"error":"invalid query"}')
                 return
+            open_event_stream(
+                connection, after, query_value(target, "vendor", "0") == "1")
+            return
+
+        if path == "/api/vendor":
+            # ?mac=AABBCC,11:22:33:44:55:66&id=17 -> [[query, id, name], ...]
+            if oui_file is None:
+                send_bytes(
+                    connection, "404 Not Found", "application/json",
+                    '{"error":"no OUI index"}')
+                return
+            items = []
+            for text in query_value(target, "mac", "").split(","):
+                if text and len(items) < VENDOR_BATCH_MAX:
+                    prefix = oui_prefix(text)
+                    vendor_id = 0 if prefix is None else oui_lookup(prefix)
+                    items.append([text, vendor_id, oui_name(vendor_id)])
+            for text in query_value(target, "id", "").split(","):
+                if text and len(items) < VENDOR_BATCH_MAX:
+                    try:
+                        vendor_id = int(text)
+                    except ValueError:
+                        vendor_id = 0
+                    if not 0 < vendor_id <= oui_count:
+                        vendor_id = 0
+                    items.append([text, vendor_id, oui_name(vendor_id)])
             send_bytes(
-                client, "200 OK", "application/json",
-                ujson.dumps(get_updates(after, limit)))
+                connection, "200 OK", "application/json",
+                ujson.dumps({"entries": oui_count, "items": items}))
             return
 
         if path == "/api/status":
             send_bytes(
-                client, "200 OK", "application/json",
+                connection, "200 OK", "application/json",
                 ujson.dumps(diagnostics()))
             return
 
         if path == "/api/wifi":
+            # Answered from the cache at once; a pending scan completes as
+            # survey number "token", which clients poll for.
             force = query_value(target, "force", "0") == "1"
-            performed = scan_wifi_if_due(force=force)
+            performed = request_wifi_scan(force=force)
+            due_in_ms = 0
+            if wifi_scan_pending:
+                due_in_ms = max(0, wifi_scan_defer_limit() - time.ticks_diff(
+                    time.ticks_ms(), wifi_scan_requested_ms))
             send_bytes(
-                client, "200 OK", "application/json",
+                connection, "200 OK", "application/json",
                 ujson.dumps({
                     "scan": wifi_scan_number,
                     "captured_ms": time.ticks_diff(wifi_last_scan_ms, BOOT_MS),
                     "duration_ms": wifi_scan_duration_ms,
                     "performed": performed,
+                    "pending": wifi_scan_pending,
+                    "token": wifi_scan_number + (1 if wifi_scan_pending else 0),
+                    "due_in_ms": due_in_ms,
+                    "blind_ms": wifi_blind_last_ms,
                     "forced_cooldown_ms": FORCED_WIFI_MIN_INTERVAL_MS,
                     "items": wifi_cache,
                 }))
@@ -612,82 +1589,298 @@ def handle_http(client):
         }
         asset = assets.get(path)
         if asset:
-            send_file(client, asset[0], asset[1], asset[2])
+            send_file(connection, asset[0], asset[1], asset[2])
             return
         if path == "/favicon.ico":
-            send_bytes(client, "204 No Content", "image/x-icon", b"")
+            send_bytes(connection, "204 No Content", "image/x-icon", b"")
             return
-        send_bytes(client, "404 Not Found", "text/plain", "Not found\n")
+        send_bytes(connection, "404 Not Found", "text/plain", "Not found\n")
     except Exception as e:
         if LOG_LEVEL >= 2:
             print_exception("HTTP error:", e)
 
 
-def serve_forever():
-    address = socket.getaddrinfo("0.0.0.0", HTTP_PORT)[0][-1]
-    server = socket.socket()
-    try:
-        server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-    except Exception:
-        pass
-    server.bind(address)
-    server.listen(2)
-    server.setblocking(False)
+def collect_garbage():
+    global gc_last_us, gc_max_us
+    started = time.ticks_us()
+    gc.collect()
+    gc_last_us = time.ticks_diff(time.ticks_us(), started)
+    if gc_last_us > gc_max_us:
+        gc_max_us = gc_last_us
+
+
+def drain_budget():
+    # Sizes the next process_raw call from ring pressure. A nearly empty
+    # ring is taken whole, so the loop gets back to HTTP at once. Past
+    # DRAIN_FULL_PERCENT, or at a new raw_high_water, a burst is outrunning
+    # the drain and the ring is emptied regardless of cost. Otherwise the
+    # budget is what fits in DRAIN_SLICE_US at the measured cost per record.
+    global drain_budget_last, drain_decision, drain_seen_high_water
+    global drain_yields, drain_slices, drain_flushes
+    pending = raw_count
+    if pending <= DRAIN_LOW_WATER:
+        budget = pending
+        drain_decision = "yield"
+        if pending:
+            drain_yields += 1
+    elif (pending * 100 >= RAW_RING_SIZE * DRAIN_FULL_PERCENT or
+            raw_high_water > drain_seen_high_water):
+        budget = pending
+        drain_decision = "flush"
+        drain_flushes += 1
+    else:
+        budget = min(pending, max(
+            DRAIN_MIN_ITEMS, DRAIN_SLICE_US // drain_item_us))
+        drain_decision = "slice"
+        drain_slices += 1
+    drain_seen_high_water = raw_high_water
+    drain_budget_last = budget
+    return budget
+
+
+def drain_ble(max_items=None):
+    global drain_item_us
+    if max_items is None:
+        max_items = drain_budget()
+    if not max_items:
+        return 0
+    heap_before = gc.mem_alloc()
+    started = time.ticks_us()
+    processed = process_raw(max_items)
+    if processed:
+        elapsed = time.ticks_diff(time.ticks_us(), started)
+        drain_item_us = max(
+            1, (drain_item_us * 7 + elapsed // processed) // 8)
+        record_heap_use(heap_before, processed)
+    return processed
+
 
+def start_collection():
     ip = active_interface.ifconfig()[0]
     print("RyancitoSentinal Collector -> http://{}/".format(ip))
 
     ble.active(True)
     ble.irq(ble_irq)
-    ble.gap_scan(0, SCAN_INTERVAL_US, SCAN_WINDOW_US, ACTIVE_SCAN)
+    if SCAN_GOVERNOR:
+        # Starts the scan and records the profile it starts with
+        set_scan_level(scan_level, 0)
+    else:
+        start_scan()
     orange.value(1)
     set_rgb(0, 20, 45)
 
+
+def serve_forever():
+    # Single-threaded poll loop. Every socket step reads or writes at most
+    # one chunk and is followed by a drain sized by drain_budget, so a slow
+    # client delays BLE processing by one step rather than a whole request.
+    global http_server
+    address = socket.getaddrinfo("0.0.0.0", HTTP_PORT)[0][-1]
+    http_server = socket.socket()
+    try:
+        http_server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    except Exception:
+        pass
+    http_server.bind(address)
+    http_server.listen(4)
+    http_server.setblocking(False)
+    poller.register(http_server, select.POLLIN)
+
+    start_collection()
+
     last_gc_ms = time.ticks_ms()
     last_led_ms = time.ticks_ms()
     while True:
-        process_raw(48)
-        try:
-            client, _ = server.accept()
-        except OSError:
-            client = None
-        if client is not None:
+        drain_ble()
+        # Push to parked clients right after new evidence was appended.
+        service_push()
+        # Block in poll only when the IRQ ring is empty.
+        for event in poller.poll(0 if raw_count else LOOP_IDLE_MS):
+            sock, flags = event[0], event[1]
+            if sock is http_server:
+                accept_clients(time.ticks_ms())
+                continue
+            connection = connections.get(sock)
+            if connection is None:
+                continue
             try:
-                handle_http(client)
-            finally:
-                try:
-                    client.close()
-                except Exception:
-                    pass
+                if flags & select.POLLIN:
+                    read_connection(connection)
+                elif flags & select.POLLOUT:
+                    write_connection(connection)
+                elif flags & (select.POLLHUP | select.POLLERR):
+                    close_connection(connection)
+            except Exception as e:
+                if LOG_LEVEL >= 2:
+                    print_exception("HTTP error:", e)
+                close_connection(connection)
+            drain_ble()
 
         now = time.ticks_ms()
         if time.ticks_diff(now, last_led_ms) >= 100:
             update_proximity_led()
+            expire_connections(now)
+            schedule_wifi_scan(now)
+            if SCAN_GOVERNOR:
+                govern_scan(now)
             last_led_ms = now
         if time.ticks_diff(now, last_gc_ms) >= 5_000:
-            gc.collect()
+            collect_garbage()
             last_gc_ms = now
-        time.sleep_ms(5)
+
+
+async def drain_task():
+    # Sleeps until ble_irq sets raw_ready, then drains the ring in batches
+    # sized by drain_budget, yielding to HTTP tasks between them.
+    while True:
+        await raw_ready.wait()
+        while drain_ble():
+            service_push()
+            push_ready.set()
+            push_ready.clear()
+            await asyncio.sleep_ms(0)
+
+
+async def led_task():
+    while True:
+        update_proximity_led()
+        await asyncio.sleep_ms(100)
+
+
+async def governor_task():
+    while True:
+        await asyncio.sleep_ms(GOVERNOR_PERIOD_MS)
+        govern_scan(time.ticks_ms())
+
+
+async def wifi_task():
+    # sta.scan() blocks the whole event loop; schedule_wifi_scan keeps that
+    # to quiet moments.
+    while True:
+        await asyncio.sleep_ms(100)
+        schedule_wifi_scan(time.ticks_ms())
+
+
+async def gc_task():
+    while True:
+        await asyncio.sleep_ms(5_000)
+        collect_garbage()
+
+
+async def read_request(reader):
+    request = b""
+    while b"\r\n\r\n" not in request and len(request) < HTTP_MAX_REQUEST:
+        data = await reader.read(HTTP_MAX_REQUEST - len(request))
+        if not data:
+            break
+        request += data
+    return request[:HTTP_MAX_REQUEST]
+
+
+async def write_output(connection, writer):
+    while connection.sent < len(connection.out) or connection.asset:
+        if connection.sent < len(connection.out):
+            writer.write(connection.out[connection.sent:])
+            connection.sent = len(connection.out)
+            await asyncio.wait_for(writer.drain(), HTTP_STALL_MS / 1000)
+        if connection.asset:
+            refill_from_asset(connection)
+    connection.out = b""
+    connection.sent = 0
+
+
+async def serve_client(reader, writer):
+    # asyncio counterpart of the poll loop's per-connection state machine:
+    # the same handle_http queues output, this task writes it, and parked
+    # or streaming clients sleep on push_ready between pushes.
+    global http_timeouts
+    connection = Connection(None, time.ticks_ms())
+    connections[writer] = connection
+    try:
+        if len(connections) > MAX_HTTP_CONNECTIONS:
+            return
+        request = await asyncio.wait_for(
+            read_request(reader), HTTP_READ_TIMEOUT_MS / 1000)
+        if request:
+            handle_http(connection, request)
+        while True:
+            await write_output(connection, writer)
+            if (connection.mode != _CONN_PARKED and
+                    connection.mode != _CONN_STREAMING):
+                break
+            # Evidence may have arrived while this client was writing;
+            # wake the other parked clients if it answered any of them.
+            if service_push():
+                push_ready.set()
+                push_ready.clear()
+            if connection.sent < len(connection.out):
+                continue
+            if connection.mode == _CONN_STREAMING:
+                wait_ms = SSE_KEEPALIVE_MS
+            else:
+                wait_ms = max(0, time.ticks_diff(
+                    connection.deadline_ms, time.ticks_ms()))
+            try:
+                await asyncio.wait_for(push_ready.wait(), wait_ms / 1000)
+            except asyncio.TimeoutError:
+                pass
+    except asyncio.TimeoutError:
+        http_timeouts += 1
+    except Exception as e:
+        if LOG_LEVEL >= 2:
+            print_exception("HTTP error:", e)
+    finally:
+        connections.pop(writer, None)
+        release_connection(connection)
+        try:
+            writer.close()
+            await writer.wait_closed()
+        except Exception:
+            pass
+
+
+async def serve_async():
+    # Task-based alternative to serve_forever (SERVER_MODE = "asyncio").
+    # BLE draining runs as soon as the IRQ signals instead of on the next
+    # 5 ms loop pass, and each HTTP client is its own task.
+    global raw_ready, push_ready
+    raw_ready = asyncio.ThreadSafeFlag()
+    push_ready = asyncio.Event()
+    await asyncio.start_server(
+        serve_client, "0.0.0.0", HTTP_PORT, backlog=4)
+    start_collection()
+    asyncio.create_task(led_task())
+    asyncio.create_task(gc_task())
+    asyncio.create_task(wifi_task())
+    if SCAN_GOVERNOR:
+        asyncio.create_task(governor_task())
+    await drain_task()
 
 
 def main():
     orange.value(0)
     led_off()
     configure_network()
-    serve_forever()
+    load_oui_index()
+    if SERVER_MODE == "asyncio" and asyncio is not None:
+        asyncio.run(serve_async())
+    else:
+        serve_forever()
 
 
-try:
-    main()
-except KeyboardInterrupt:
-    print("Stopped.")
-except Exception as e:
-    print_exception("Fatal:", e)
-finally:
+# Guarded so host-side tools (tools/) can import this module.
+if __name__ == "__main__":
     try:
-        ble.gap_scan(None)
-        ble.active(False)
-    except Exception:
-        pass
-    orange.value(0)
-    led_off()
+        main()
+    except KeyboardInterrupt:
+        print("Stopped.")
+    except Exception as e:
+        print_exception("Fatal:", e)
+    finally:
+        try:
+            ble.gap_scan(None)
+            ble.active(False)
+        except Exception:
+            pass
+        orange.value(0)
+        led_off()
@@ -0,0 +1,139 @@
+# RyancitoSentinal host benchmark: process_raw device-table cost
+#
+# Compares the original process_raw (string "type:MAC" keys, state tuples,
+# eager MAC/hex formatting, linear-scan eviction) with the firmware's
+# integer-keyed LRU slot table. Both variants drain the same synthetic BLE
+# stream through the firmware's own ingress ring and fingerprinting. The
+# evidence each variant would serve from /api/updates is compared, so a
+# speedup cannot come from changed behavior.
+#
+#   python3 tools/bench_device_table.py [--observations 20000]
+
+import argparse
+import random
+import time
+
+from host_shim import clock, load_firmware
+
+_IRQ_SCAN_RESULT = 5
+BATCH = 48  # serve_forever() drains up to 48 raw records per pass
+
+
+def legacy_process_raw(fw, device_state, rows, capacity, max_items):
+    """process_raw() as it was before the LRU table; evidence goes to rows."""
+    processed = 0
+    while processed < max_items:
+        raw = fw.pop_raw()
+        if raw is None:
+            break
+        processed += 1
+        addr_type, addr, adv_type, rssi, payload, observed_ms = raw
+        if rssi < fw.MIN_RSSI:
+            continue
+        mac = fw.format_mac(addr)
+        key = "{}:{}".format(addr_type, mac)
+        fingerprint = fw.payload_fingerprint(payload)
+        previous = device_state.get(key)
+        emit = False
+        flags = 0
+        if previous is None:
+            if len(device_state) >= capacity:
+                oldest_key = None
+                oldest_ms = None
+                for state_key, state in device_state.items():
+                    if oldest_ms is None or time.ticks_diff(
+                            state[3], oldest_ms) < 0:
+                        oldest_key = state_key
+                        oldest_ms = state[3]
+                del device_state[oldest_key]
+            emit = True
+            flags |= 1
+        else:
+            if fingerprint != previous[0]:
+                emit = True
+                flags |= 2
+            if abs(rssi - previous[1]) >= fw.RSSI_DELTA_DB:
+                emit = True
+                flags |= 4
+            if time.ticks_diff(observed_ms, previous[2]) >= fw.HEARTBEAT_MS:
+                emit = True
+                flags |= 8
+        if emit:
+            rows.append([
+                len(rows) + 1, time.ticks_diff(observed_ms, fw.BOOT_MS),
+                addr_type, mac, rssi, adv_type, flags,
+                fw.ubinascii.hexlify(payload).decode()])
+            last_emit_ms = observed_ms
+        else:
+            last_emit_ms = previous[2]
+        device_state[key] = (fingerprint, rssi, last_emit_ms, observed_ms)
+    return processed
+
+
+def make_stream(devices, observations, seed):
+    rng = random.Random(seed)
+    pool = [(rng.randrange(2), bytes(rng.randrange(256) for _ in range(6)))
+            for _ in range(devices)]
+    stream = []
+    for _ in range(observations):
+        addr_type, addr = pool[rng.randrange(devices)]
+        payload = bytes([2, 1, 6, 3, 0xFF, rng.randrange(4), 0x4C])
+        stream.append((addr_type, addr, 0, rng.randrange(-95, -40), payload))
+    return stream
+
+
+def run(fw, stream, drain):
+    """Feed the stream through ble_irq in serve_forever()-sized batches."""
+    clock.now_ms = 0
+    elapsed = 0.0
+    for start in range(0, len(stream), BATCH):
+        for data in stream[start:start + BATCH]:
+            clock.advance(1)
+            fw.ble_irq(_IRQ_SCAN_RESULT, data)
+        began = time.perf_counter()
+        drain(BATCH)
+        elapsed += time.perf_counter() - began
+    return elapsed
+
+
+def served_evidence(fw):
+    return [list(item) for item in fw.get_updates(0, fw.next_sequence)["items"]]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--observations", type=int, default=20_000)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    print("{:>8} {:>8} {:>10} {:>12} {:>12} {:>8}".format(
+        "capacity", "devices", "workload", "legacy us/obs", "lru us/obs",
+        "speedup"))
+    for capacity in (160, 1024, 2048):
+        for workload, devices in (("steady", capacity // 2),
+                                  ("crowd", capacity * 4)):
+            stream = make_stream(devices, args.observations, args.seed)
+            # A ring large enough to keep every record for the comparison
+            overrides = {"MAX_TRACKED_DEVICES": capacity,
+                         "EVIDENCE_RING_SIZE": args.observations,
+                         "EVIDENCE_ARENA_BYTES": args.observations * 32}
+
+            legacy = load_firmware(overrides)
+            state, rows = {}, []
+            legacy_s = run(legacy, stream, lambda n: legacy_process_raw(
+                legacy, state, rows, capacity, n))
+
+            current = load_firmware(overrides)
+            lru_s = run(current, stream, current.process_raw)
+
+            if rows != served_evidence(current):
+                raise SystemExit("evidence differs at capacity {} ({})".format(
+                    capacity, workload))
+            per_obs = 1e6 / args.observations
+            print("{:>8} {:>8} {:>10} {:>12.2f} {:>12.2f} {:>7.1f}x".format(
+                capacity, devices, workload, legacy_s * per_obs,
+                lru_s * per_obs, legacy_s / lru_s))
+
+
+if __name__ == "__main__":
+    main()
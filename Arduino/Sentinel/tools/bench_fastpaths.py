@@ -0,0 +1,58 @@
+# RyancitoSentinal micro-benchmark: fingerprint and MAC formatting paths
+#
+# Times main.py's pure-Python payload_fingerprint_py/format_mac_py against
+# fastpath.py. The viper numbers only mean something on the board:
+#
+#   mpremote run tools/bench_fastpaths.py     (main.py and fastpath.py
+#                                              already on the board)
+#   python3 tools/bench_fastpaths.py          (host: emulated, logic only)
+
+import time
+
+try:
+    import fastpath
+    import main as fw
+    ON_BOARD = True
+except ImportError:
+    from host_shim import load_firmware
+    fw = load_firmware(fast_paths=True)
+    import sys
+    fastpath = sys.modules["fastpath"]
+    ON_BOARD = False
+
+ROUNDS = 2000
+PAYLOAD = bytes([0x02, 0x01, 0x06, 0x1A, 0xFF, 0x4C, 0x00, 0x02, 0x15]) + bytes(
+    range(22))
+ADDR = b"\x01\x23\x45\x67\x89\xab"
+
+
+def per_call_us(function, argument):
+    if ON_BOARD:
+        started = time.ticks_us()
+        for _ in range(ROUNDS):
+            function(argument)
+        return time.ticks_diff(time.ticks_us(), started) / ROUNDS
+    started = time.perf_counter()
+    for _ in range(ROUNDS):
+        function(argument)
+    return (time.perf_counter() - started) * 1e6 / ROUNDS
+
+
+def report(label, reference, fast, argument):
+    if reference(argument) != fast(argument):
+        raise SystemExit(label + ": fast path disagrees with the reference")
+    slow_us = per_call_us(reference, argument)
+    fast_us = per_call_us(fast, argument)
+    print("{:<22} python {:>8.2f} us   fast {:>8.2f} us   {:>5.1f}x".format(
+        label, slow_us, fast_us, slow_us / fast_us if fast_us else 0))
+
+
+def main():
+    print("firmware fast paths:", fw.fast_path_mode,
+          "(board)" if ON_BOARD else "(host emulation)")
+    report("payload_fingerprint", fw.payload_fingerprint_py,
+           fastpath.payload_fingerprint, PAYLOAD)
+    report("format_mac", fw.format_mac_py, fastpath.format_mac, ADDR)
+
+
+main()
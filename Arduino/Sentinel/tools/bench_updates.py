@@ -0,0 +1,79 @@
+# RyancitoSentinal host benchmark: /api/updates JSON vs /api/updates.bin
+#
+# Fills the firmware's evidence ring from a synthetic BLE stream, then
+# serves the same batches both ways. Reports bytes on the wire and encode
+# time per poll, and decodes every binary batch (mirroring worker.js's
+# decodeUpdates) to check it carries exactly the JSON rows.
+#
+#   python3 tools/bench_updates.py [--limit 100]
+
+import argparse
+import json
+import struct
+import time
+
+from bench_device_table import make_stream, run
+from host_shim import load_firmware
+
+
+def decode_updates(fw, body):
+    magic, first, last, dropped, reset, count = struct.unpack_from(
+        fw.UPDATES_HEADER, body, 0)
+    if magic != fw.UPDATES_MAGIC:
+        raise ValueError("bad magic")
+    items = []
+    offset = fw.UPDATES_HEADER_SIZE
+    for _ in range(count):
+        (sequence, elapsed_ms, addr_type, addr, rssi, adv_type, flags,
+         length) = struct.unpack_from(fw.UPDATES_RECORD, body, offset)
+        offset += fw.UPDATES_RECORD_SIZE
+        payload = bytes(body[offset:offset + length])
+        offset += length
+        items.append([sequence, elapsed_ms, addr_type,
+                      ":".join("{:02X}".format(b) for b in addr), rssi,
+                      adv_type, flags, payload.hex()])
+    return {"from": first, "to": last, "dropped": dropped,
+            "reset": bool(reset), "items": items}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--limit", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    fw = load_firmware()
+    run(fw, make_stream(400, 4000, args.seed), fw.process_raw)
+
+    json_bytes = bin_bytes = 0
+    json_s = bin_s = 0.0
+    polls = 0
+    after = 0
+    while True:
+        started = time.perf_counter()
+        text = json.dumps(fw.get_updates(after, args.limit))
+        json_s += time.perf_counter() - started
+        started = time.perf_counter()
+        body = fw.get_updates_bin(after, args.limit)
+        bin_s += time.perf_counter() - started
+
+        packet = json.loads(text)
+        if decode_updates(fw, body) != packet:
+            raise SystemExit("binary batch after={} differs from JSON".format(
+                after))
+        if not packet["items"]:
+            break
+        json_bytes += len(text)
+        bin_bytes += len(body)
+        polls += 1
+        after = packet["to"]
+
+    print("{} polls of up to {} items".format(polls, args.limit))
+    print("JSON   {:>8} bytes  {:>7.1f} us/poll".format(
+        json_bytes, json_s * 1e6 / polls))
+    print("binary {:>8} bytes  {:>7.1f} us/poll  ({:.1f}x smaller)".format(
+        bin_bytes, bin_s * 1e6 / polls, json_bytes / bin_bytes))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+# RyancitoSentinal build step: oui.csv -> oui.bin vendor index for the board
+#
+# The firmware answers /api/vendor and tags evidence with vendor ids by
+# binary-searching oui.bin on flash, so browsers never need the 3 MB CSV.
+# The layout constants come from main.py (OUI_*), and the finished file is
+# checked by looking every prefix up through the firmware's own oui_lookup
+# and oui_name. Upload the result next to main.py:
+#
+#   python3 tools/build_oui_index.py [oui.csv] [-o oui.bin]
+#   mpremote cp oui.bin :
+
+import argparse
+import csv
+import os
+import struct
+
+from host_shim import FIRMWARE_DIR, load_firmware
+
+BLOCK_RECORDS = 64
+
+
+def read_vendors(csv_path):
+    """Map 24-bit prefix -> vendor name from an IEEE MA-L style CSV."""
+    vendors = {}
+    with open(csv_path, newline="", encoding="utf-8") as source:
+        rows = csv.reader(source)
+        header = [value.strip().lower() for value in next(rows)]
+        prefix_index = header.index("assignment")
+        name_index = header.index("organization name")
+        for row in rows:
+            if len(row) <= max(prefix_index, name_index):
+                continue
+            assignment = row[prefix_index].strip()
+            name = row[name_index].strip()
+            if len(assignment) != 6 or not name:
+                continue
+            try:
+                vendors[int(assignment, 16)] = name
+            except ValueError:
+                continue
+    return vendors
+
+
+def encode_name(name):
+    # u8 length prefix; cut at a character boundary if it is ever exceeded.
+    data = name.encode("utf-8")[:255].decode("utf-8", "ignore").encode("utf-8")
+    return bytes([len(data)]) + data
+
+
+def build(fw, vendors, block_records=BLOCK_RECORDS):
+    prefixes = sorted(vendors)
+    if not prefixes:
+        raise ValueError("no vendor prefixes to index")
+    if len(prefixes) > 0xFFFF:
+        # Evidence records and slot_vendor carry vendor ids as u16
+        raise ValueError("{} prefixes exceed the 16-bit vendor id range"
+                         .format(len(prefixes)))
+    if block_records < 1:
+        raise ValueError("block_records must be at least 1")
+    names = bytearray()
+    name_offsets = {}
+    records = bytearray()
+    for prefix in prefixes:
+        name = vendors[prefix]
+        if name not in name_offsets:
+            name_offsets[name] = len(names)
+            names += encode_name(name)
+        offset = name_offsets[name]
+        records += prefix.to_bytes(3, "big") + offset.to_bytes(3, "little")
+    if len(names) >= 1 << 24:
+        raise ValueError("vendor names exceed the 24-bit offset range")
+    fences = bytearray()
+    for first in range(0, len(prefixes), block_records):
+        fences += prefixes[first].to_bytes(3, "big")
+    names_offset = fw.OUI_HEADER_SIZE + len(fences) + len(records)
+    header = struct.pack(
+        fw.OUI_HEADER, fw.OUI_MAGIC, len(prefixes), block_records,
+        names_offset)
+    return header + fences + records + names
+
+
+def verify(fw, path, vendors):
+    if not fw.load_oui_index(path):
+        raise SystemExit("firmware refused {}".format(path))
+    for vendor_id, prefix in enumerate(sorted(vendors), 1):
+        if fw.oui_lookup(prefix) != vendor_id:
+            raise SystemExit("lookup mismatch for {:06X}".format(prefix))
+        expected = encode_name(vendors[prefix])[1:].decode("utf-8")
+        if fw.oui_name(vendor_id) != expected:
+            raise SystemExit("name mismatch for {:06X}".format(prefix))
+    for missing in (0x000000, 0xFFFFFF, 0x123456):
+        if missing not in vendors and fw.oui_lookup(missing):
+            raise SystemExit("false hit for {:06X}".format(missing))
+    fw.oui_file.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "csv", nargs="?", default=os.path.join(FIRMWARE_DIR, "oui.csv"))
+    parser.add_argument(
+        "-o", "--output", default=os.path.join(FIRMWARE_DIR, "oui.bin"))
+    parser.add_argument("--block-records", type=int, default=BLOCK_RECORDS)
+    args = parser.parse_args()
+
+    fw = load_firmware()
+    vendors = read_vendors(args.csv)
+    data = build(fw, vendors, args.block_records)
+    with open(args.output, "wb") as output:
+        output.write(data)
+    verify(fw, args.output, vendors)
+    blocks = (len(vendors) + args.block_records - 1) // args.block_records
+    print("{}: {} prefixes, {} bytes ({} KB), {} fences ({} bytes of RAM)"
+          .format(args.output, len(vendors), len(data), len(data) // 1024,
+                  blocks, blocks * 4))
+    print("verified: every prefix resolves through main.py's oui_lookup")
+
+
+if __name__ == "__main__":
+    main()
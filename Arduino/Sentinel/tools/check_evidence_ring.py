@@ -0,0 +1,56 @@
+# RyancitoSentinal host check: slab evidence ring bookkeeping
+#
+# Appends records with random payload lengths (including empty ones) to a
+# deliberately small metadata ring and payload arena, so both wrap many
+# times. After every append it checks that /api/updates serves exactly the
+# most recent records, with the right payloads, and that the binary batch
+# agrees. Exits non-zero on the first inconsistency.
+#
+#   python3 tools/check_evidence_ring.py [--appends 20000]
+
+import argparse
+import random
+import sys
+
+from bench_updates import decode_updates
+from host_shim import load_firmware
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--appends", type=int, default=20_000)
+    parser.add_argument("--seed", type=int, default=3)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    for ring, arena in ((64, 600), (64, 4096), (300, 1000)):
+        fw = load_firmware({"EVIDENCE_RING_SIZE": ring,
+                            "EVIDENCE_ARENA_BYTES": arena})
+        expected = {}
+        for sequence in range(1, args.appends + 1):
+            addr = bytes(rng.randrange(256) for _ in range(6))
+            payload = bytes(rng.randrange(256)
+                            for _ in range(rng.choice((0, 3, 31, 62))))
+            fw.append_evidence(sequence * 10, sequence % 2, addr, -60, 0,
+                               sequence % 16, payload)
+            expected[sequence] = [sequence, sequence * 10, sequence % 2,
+                                  ":".join("{:02X}".format(b) for b in addr),
+                                  -60, 0, sequence % 16, payload.hex()]
+            expected.pop(sequence - ring, None)
+
+            oldest = fw.oldest_sequence()
+            packet = fw.get_updates(0, ring)
+            want = [expected[s] for s in range(oldest, sequence + 1)]
+            if packet["items"] != want or packet["dropped"] != oldest - 1:
+                sys.exit("ring {}/{}: mismatch after {} appends".format(
+                    ring, arena, sequence))
+            if decode_updates(fw, fw.get_updates_bin(0, ring)) != packet:
+                sys.exit("ring {}/{}: binary batch differs after {}".format(
+                    ring, arena, sequence))
+        kept = args.appends - fw.oldest_sequence() + 1
+        print("ring {:>4} arena {:>5}: ok, {} records held at the end".format(
+            ring, arena, kept))
+
+
+if __name__ == "__main__":
+    main()
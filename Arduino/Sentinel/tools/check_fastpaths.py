@@ -0,0 +1,53 @@
+# RyancitoSentinal host check: fastpath.py matches the pure-Python references
+#
+# Runs the viper fast paths as plain Python (see host_shim) against
+# main.py's payload_fingerprint_py and format_mac_py over edge cases and
+# random inputs. Exits non-zero on the first mismatch.
+#
+#   python3 tools/check_fastpaths.py [--cases 20000]
+
+import argparse
+import random
+import sys
+
+from host_shim import load_firmware
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--cases", type=int, default=20_000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    fw = load_firmware(fast_paths=True)
+    if fw.fast_path_mode != "viper":
+        sys.exit("firmware rejected fastpath.py at import")
+    fast = sys.modules["fastpath"]
+    rng = random.Random(args.seed)
+
+    payloads = [b"", b"\x00", b"\xff" * 255, bytes(range(256))]
+    payloads += [bytes(rng.randrange(256) for _ in range(rng.randrange(63)))
+                 for _ in range(args.cases)]
+    for payload in payloads:
+        expected = fw.payload_fingerprint_py(payload)
+        got = fast.payload_fingerprint(payload)
+        if got != expected:
+            sys.exit("fingerprint mismatch for {}: {} != {}".format(
+                payload.hex(), got, expected))
+
+    addrs = [b"\x00" * 6, b"\xff" * 6, bytes(range(6))]
+    addrs += [bytes(rng.randrange(256) for _ in range(6))
+              for _ in range(args.cases)]
+    for addr in addrs:
+        expected = fw.format_mac_py(addr)
+        got = fast.format_mac(addr)
+        if got != expected:
+            sys.exit("format_mac mismatch for {}: {} != {}".format(
+                addr.hex(), got, expected))
+
+    print("fastpath.py matches the references on {} payloads and {} "
+          "addresses".format(len(payloads), len(addrs)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+# RyancitoSentinal host tools: load the collector firmware under CPython
+#
+# main.py targets MicroPython on the Nano ESP32. This module installs small
+# stand-ins for the board-only modules (bluetooth, machine, network, the
+# u-prefixed aliases, const and the time.ticks_* family) so the firmware's
+# pure-Python logic can be imported, benchmarked and checked on a PC. It
+# never touches real radios; uselect.poll wraps CPython's select.poll, so
+# the HTTP loop can serve local sockets, and uasyncio is CPython's asyncio
+# plus ThreadSafeFlag and sleep_ms. Nothing here is uploaded to the board.
+#
+# The micropython stand-in makes @micropython.viper a no-op, with ptr8()
+# returning the buffer itself and uint() masking to 32 bits. That runs
+# fastpath.py's logic as plain Python, which checks the algorithm but says
+# nothing about viper speed.
+
+import asyncio
+import binascii
+import builtins
+import gc
+import json
+import os
+import re
+import select
+import sys
+import time
+import types
+
+FIRMWARE_DIR = os.path.normpath(os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), ".."))
+FIRMWARE_PATH = os.path.join(FIRMWARE_DIR, "main.py")
+
+TICKS_PERIOD = 1 << 30
+TICKS_MAX = TICKS_PERIOD - 1
+TICKS_HALF = TICKS_PERIOD // 2
+
+
+class HostClock:
+    """Manual millisecond clock behind time.ticks_ms(); tools advance it."""
+
+    def __init__(self, start_ms=0):
+        self.now_ms = start_ms
+
+    def advance(self, ms):
+        self.now_ms += ms
+
+
+clock = HostClock()
+
+
+class _Anything:
+    """Accepts any call or attribute access; stands in for board hardware."""
+
+    def __call__(self, *args, **kwargs):
+        return _Anything()
+
+    def __getattr__(self, name):
+        return _Anything()
+
+    def __getitem__(self, index):
+        return _Anything()
+
+    def __int__(self):
+        return 0
+
+
+class _Poll:
+    """uselect.poll: CPython's select.poll, returning the registered objects."""
+
+    def __init__(self):
+        self._poll = select.poll()
+        self._objects = {}
+
+    def register(self, obj, mask=select.POLLIN | select.POLLOUT):
+        self._objects[obj.fileno()] = obj
+        self._poll.register(obj.fileno(), mask)
+
+    def modify(self, obj, mask):
+        self._poll.modify(obj.fileno(), mask)
+
+    def unregister(self, obj):
+        self._objects.pop(obj.fileno(), None)
+        self._poll.unregister(obj.fileno())
+
+    def poll(self, timeout=-1):
+        return [(self._objects[fd], flags)
+                for fd, flags in self._poll.poll(timeout)
+                if fd in self._objects]
+
+
+class _ThreadSafeFlag:
+    """uasyncio.ThreadSafeFlag: set() from any thread wakes one waiter."""
+
+    def __init__(self):
+        self._event = asyncio.Event()
+        self._loop = asyncio.get_running_loop()
+
+    def set(self):
+        self._loop.call_soon_threadsafe(self._event.set)
+
+    async def wait(self):
+        await self._event.wait()
+        self._event.clear()
+
+
+def _module(name, **attrs):
+    module = types.ModuleType(name)
+    module.__dict__.update(attrs)
+    return module
+
+
+def install():
+    """Register the shims; safe to call more than once."""
+    time.ticks_ms = lambda: clock.now_ms & TICKS_MAX
+    time.ticks_us = lambda: (clock.now_ms * 1000) & TICKS_MAX
+    time.ticks_add = lambda ticks, delta: (ticks + delta) & TICKS_MAX
+    time.ticks_diff = (
+        lambda end, start: ((end - start + TICKS_HALF) & TICKS_MAX) - TICKS_HALF)
+    time.sleep_ms = clock.advance
+    builtins.const = lambda value: value
+    builtins.ptr8 = lambda buffer: buffer
+    builtins.uint = lambda value: value & 0xFFFFFFFF
+    gc.mem_free = lambda: 0
+    gc.mem_alloc = lambda: 0
+    sys.print_exception = lambda exception: print(repr(exception))
+    sys.modules.setdefault("micropython", _module(
+        "micropython", const=builtins.const, viper=lambda function: function,
+        native=lambda function: function))
+    sys.modules.setdefault("ubinascii", binascii)
+    sys.modules.setdefault("ujson", json)
+    sys.modules.setdefault("uselect", _module(
+        "uselect", poll=_Poll, POLLIN=select.POLLIN, POLLOUT=select.POLLOUT,
+        POLLHUP=select.POLLHUP, POLLERR=select.POLLERR))
+    uasyncio = _module("uasyncio", **{
+        key: value for key, value in vars(asyncio).items()
+        if not key.startswith("__")})
+    uasyncio.ThreadSafeFlag = _ThreadSafeFlag
+    uasyncio.sleep_ms = lambda ms: asyncio.sleep(ms / 1000)
+    sys.modules.setdefault("uasyncio", uasyncio)
+    sys.modules.setdefault("bluetooth", _module("bluetooth", BLE=_Anything()))
+    sys.modules.setdefault(
+        "machine", _module("machine", Pin=_Anything(), PWM=_Anything()))
+    sys.modules.setdefault("network", _module(
+        "network", WLAN=_Anything(), STA_IF=0, AP_IF=1, AUTH_WPA2_PSK=3,
+        hostname=_Anything()))
+
+
+def load_fastpath():
+    """Import a fresh copy of fastpath.py (viper code run as plain Python)."""
+    install()
+    module = types.ModuleType("fastpath")
+    path = os.path.join(FIRMWARE_DIR, "fastpath.py")
+    module.__file__ = path
+    with open(path) as source_file:
+        exec(compile(source_file.read(), path, "exec"), module.__dict__)
+    return module
+
+
+def load_firmware(overrides=None, name="sentinel_main", fast_paths=False):
+    """Import a fresh copy of main.py, optionally replacing top-level constants.
+
+    overrides maps a configuration name (e.g. MAX_TRACKED_DEVICES) to the
+    value substituted into its `NAME = ...` line before execution. The
+    host clock restarts at tick 0, as after a board reset. Unless fast_paths
+    is set, fastpath.py is hidden so timings use the pure-Python versions.
+    """
+    install()
+    clock.now_ms = 0
+    sys.modules["fastpath"] = load_fastpath() if fast_paths else None
+    with open(FIRMWARE_PATH) as source_file:
+        source = source_file.read()
+    for key, value in (overrides or {}).items():
+        source, count = re.subn(
+            r"^{} = .*$".format(key), "{} = {!r}".format(key, value),
+            source, count=1, flags=re.M)
+        if not count:
+            raise KeyError("main.py has no constant {}".format(key))
+    module = types.ModuleType(name)
+    module.__file__ = FIRMWARE_PATH
+    exec(compile(source, FIRMWARE_PATH, "exec"), module.__dict__)
+    return module
@@ -20,7 +20,23 @@ let collectorBootWall = 0;
 let sessionObservationCount = 0;
 let sessionWifiCount = 0;
 let sessionName = "";
+let binaryUpdates = true;
+let longPollMs = 0;
+let vendorIds = false;
+let scanProfiles = [];
 const devices = new Map();
+const vendorNames = new Map();
+
+// /api/updates.bin framing (little endian), mirrored from main.py.
+const UPDATES_MAGIC = 0x31425352; // "RSB1"
+const UPDATES_MAGIC_VENDOR = 0x32425352; // "RSB2": u16 vendor id after each record
+const UPDATES_HEADER_SIZE = 19;
+const UPDATES_RECORD_SIZE = 20;
+// Records flagged SCAN_CHANGE_FLAG are scan-governor markers, not sightings;
+// their payload is "<IIBB": interval_us, window_us, active, reason.
+const SCAN_CHANGE_FLAG = 16;
+const SCAN_CHANGE_REASONS = ["start", "drops", "occupancy", "headroom", "quiet", "activity"];
+const HEX = Array.from({ length: 256 }, (_, byte) => byte.toString(16).padStart(2, "0"));
 
 function uuid() {
   if (self.crypto && crypto.randomUUID) return crypto.randomUUID();
@@ -76,7 +92,7 @@ function saveSession(endTime = null) {
     id: sessionId, startTime: sessionStartTime, endTime,
     observationCount: sessionObservationCount, wifiObservationCount: sessionWifiCount,
     dropped, active: endTime === null, schemaVersion: 2, case: caseMetadata,
-    name: sessionName, lastUpdatedAt: Date.now()
+    name: sessionName, scanProfiles, lastUpdatedAt: Date.now()
   });
 }
 
@@ -84,6 +100,10 @@ async function anchorCollectorClock() {
   try {
     const status = await fetch("/api/status", { cache: "no-store" }).then(response => response.json());
     collectorBootWall = Date.now() - (status.uptime_ms || 0);
+    // Collectors that support long polling hold the request until evidence arrives.
+    longPollMs = Math.min(status.long_poll_max_ms || 0, 15000);
+    // Collectors with an OUI index (oui.bin) tag public addresses with vendor ids.
+    vendorIds = (status.oui_index_entries || 0) > 0;
   } catch (error) { collectorBootWall = 0; }
 }
 
@@ -140,7 +160,8 @@ function aggregate(observation) {
       services: fields.services, firstSeen: observationTime,
       lastSeen: observationTime, strongestRssi: observation.rssi,
       latestRssi: observation.rssi, previousRssi: observation.rssi,
-      latestAdvHex: observation.advHex, sightings: 1, flags: observation.flags
+      latestAdvHex: observation.advHex, sightings: 1, flags: observation.flags,
+      vendorId: observation.vendorId, vendor: null
     };
     created.txPower = fields.txPower; created.appearance = fields.appearance;
     created.serviceData = fields.serviceData;
@@ -163,19 +184,93 @@ function aggregate(observation) {
   return existing;
 }
 
+// Names for collector vendor ids, fetched in batches from /api/vendor?id=.
+async function resolveVendors(devicesToName) {
+  const pending = [];
+  for (const device of devicesToName) {
+    if (!device.vendorId) continue;
+    if (vendorNames.has(device.vendorId)) device.vendor = vendorNames.get(device.vendorId);
+    else if (!pending.includes(device.vendorId)) pending.push(device.vendorId);
+  }
+  if (!pending.length) return;
+  try {
+    for (let index = 0; index < pending.length; index += 32) {
+      const ids = pending.slice(index, index + 32).join(",");
+      const response = await fetch(`/api/vendor?id=${ids}`, { cache: "no-store" });
+      if (!response.ok) { vendorIds = false; return; }
+      for (const [, id, name] of (await response.json()).items) vendorNames.set(id, name);
+    }
+  } catch (error) { return; }
+  for (const device of devicesToName)
+    if (vendorNames.has(device.vendorId)) device.vendor = vendorNames.get(device.vendorId);
+}
+
+function scanProfileFromRow(row) {
+  const bytes = new Uint8Array(row[7].match(/../g).map(x => parseInt(x, 16)));
+  const view = new DataView(bytes.buffer);
+  return {
+    seq: row[0], deviceMs: row[1], level: row[5],
+    intervalUs: view.getUint32(0, true), windowUs: view.getUint32(4, true),
+    active: bytes[8] === 1, reason: SCAN_CHANGE_REASONS[bytes[9]] || "unknown"
+  };
+}
+
 function storeBatch(items) {
   if (!items.length) return;
   const store = transaction("observations", "readwrite");
   for (const item of items) store.put(item);
 }
 
+function decodeUpdates(buffer) {
+  const view = new DataView(buffer);
+  const bytes = new Uint8Array(buffer);
+  const magic = buffer.byteLength >= UPDATES_HEADER_SIZE ? view.getUint32(0, true) : 0;
+  if (magic !== UPDATES_MAGIC && magic !== UPDATES_MAGIC_VENDOR) {
+    throw new Error("Malformed binary update");
+  }
+  const recordSize = magic === UPDATES_MAGIC_VENDOR ? UPDATES_RECORD_SIZE + 2 : UPDATES_RECORD_SIZE;
+  const packet = {
+    from: view.getUint32(4, true), to: view.getUint32(8, true),
+    dropped: view.getUint32(12, true), reset: view.getUint8(16) === 1, items: []
+  };
+  const count = view.getUint16(17, true);
+  let offset = UPDATES_HEADER_SIZE;
+  for (let index = 0; index < count; index++) {
+    const length = view.getUint16(offset + 18, true);
+    let mac = HEX[bytes[offset + 9]];
+    for (let i = 10; i < 15; i++) mac += ":" + HEX[bytes[offset + i]];
+    let advHex = "";
+    const payloadStart = offset + recordSize;
+    for (let i = payloadStart; i < payloadStart + length; i++) advHex += HEX[bytes[i]];
+    // Same row layout as the JSON endpoint: MAC upper case, payload lower case.
+    packet.items.push([
+      view.getUint32(offset, true), view.getInt32(offset + 4, true), bytes[offset + 8],
+      mac.toUpperCase(), view.getInt8(offset + 15), bytes[offset + 16], bytes[offset + 17], advHex,
+      recordSize > UPDATES_RECORD_SIZE ? view.getUint16(offset + UPDATES_RECORD_SIZE, true) : 0
+    ]);
+    offset = payloadStart + length;
+  }
+  return packet;
+}
+
+async function fetchUpdates() {
+  if (binaryUpdates) {
+    const wait = (longPollMs ? `&wait=${longPollMs}` : "") + (vendorIds ? "&vendor=1" : "");
+    const response = await fetch(`/api/updates.bin?after=${after}&limit=100${wait}`, { cache: "no-store" });
+    if (response.ok) return decodeUpdates(await response.arrayBuffer());
+    if (response.status !== 404) throw new Error(`HTTP ${response.status}`);
+    binaryUpdates = false; // older collector firmware: use JSON from now on
+  }
+  const response = await fetch(`/api/updates?after=${after}&limit=100${vendorIds ? "&vendor=1" : ""}`, { cache: "no-store" });
+  if (!response.ok) throw new Error(`HTTP ${response.status}`);
+  return response.json();
+}
+
 async function poll() {
   if (!polling) return;
   const pollStarted = performance.now();
   try {
-    const response = await fetch(`/api/updates?after=${after}&limit=100`, { cache: "no-store" });
-    if (!response.ok) throw new Error(`HTTP ${response.status}`);
-    const packet = await response.json();
+    const packet = await fetchUpdates();
     if (packet.reset) {
       await anchorCollectorClock();
       await startSession("collector-reset");
@@ -184,9 +279,14 @@ async function poll() {
     }
     dropped += packet.dropped || 0;
     const receivedAt = Date.now();
-    const observations = packet.items.map(row => ({
+    const rows = [];
+    for (const row of packet.items) {
+      if (row[6] & SCAN_CHANGE_FLAG) scanProfiles.push(scanProfileFromRow(row));
+      else rows.push(row);
+    }
+    const observations = rows.map(row => ({
       sessionId, seq: row[0], deviceMs: row[1], addrType: row[2], mac: row[3],
-      rssi: row[4], advType: row[5], flags: row[6], advHex: row[7], receivedAt,
+      rssi: row[4], advType: row[5], flags: row[6], advHex: row[7], vendorId: row[8] || 0, receivedAt,
       estimatedObservedAt: collectorBootWall ? collectorBootWall + row[1] : null,
       timestampSource: collectorBootWall ? "esp32-monotonic-anchored-to-browser" : "browser-receipt",
       timingUncertaintyMs: collectorBootWall ?
@@ -197,9 +297,10 @@ async function poll() {
       const device = aggregate(observation);
       changed.set(device.id, device);
     }
+    await resolveVendors([...changed.values()]);
     storeBatch(observations);
     sessionObservationCount += observations.length;
-    if (observations.length || packet.dropped) saveSession();
+    if (packet.items.length || packet.dropped) saveSession();
     if (packet.to > after) after = packet.to;
     if (observations.length) postMessage({
       type: "dirty", updates: [...changed.values()], after, dropped
@@ -209,7 +310,10 @@ async function poll() {
       latencyMs: Math.round(performance.now() - pollStarted)
     });
     retryMs = 1000;
-    setTimeout(poll, pollMs);
+    // Re-poll at once only after a long poll (binary endpoint with wait=);
+    // one that came back empty timed out or was refused, so back off.
+    const longPolled = binaryUpdates && longPollMs;
+    setTimeout(poll, longPolled && observations.length ? 0 : pollMs);
   } catch (error) {
     postMessage({ type: "connection", state: "Retrying", error: String(error) });
     setTimeout(poll, retryMs);
@@ -222,6 +326,12 @@ function scheduleWifi(delay) {
   if (showWifi && wifiMs > 0) wifiTimer = setTimeout(pollWifi, delay);
 }
 
+async function fetchWifi(url) {
+  const response = await fetch(url, { cache: "no-store" });
+  if (!response.ok) throw new Error(`Wi-Fi HTTP ${response.status}`);
+  return response.json();
+}
+
 async function pollWifi(manual = false) {
   if (!manual && (!showWifi || wifiMs <= 0)) return;
   if (wifiBusy) {
@@ -230,12 +340,16 @@ async function pollWifi(manual = false) {
   }
   wifiBusy = true;
   try {
-    const packet = await fetch(manual ? "/api/wifi?force=1" : "/api/wifi", { cache: "no-store" }).then(response => {
-      if (!response.ok) throw new Error(`Wi-Fi HTTP ${response.status}`);
-      return response.json();
-    });
+    let packet = await fetchWifi(manual ? "/api/wifi?force=1" : "/api/wifi");
     if (manual && packet.performed === false)
       throw new Error(`Please wait ${Math.ceil((packet.forced_cooldown_ms || 5000) / 1000)} seconds between manual scans`);
+    // Collectors with a scan scheduler answer from the cache at once and run the
+    // survey at a quiet moment; wait for survey `token` to arrive.
+    const waitUntil = Date.now() + Math.max(packet.due_in_ms || 0, 0) + 15000;
+    while (packet.pending && packet.scan < packet.token && Date.now() < waitUntil) {
+      await new Promise(resolve => setTimeout(resolve, 1000));
+      packet = await fetchWifi("/api/wifi");
+    }
     wifiNetworks = packet.items.map(row => ({
       ssid: row[0], bssid: row[1], channel: row[2], rssi: row[3],
       security: row[4], hidden: row[5], scan: packet.scan,
@@ -262,7 +376,7 @@ async function startSession(reason = "new") {
   if (sessionId) saveSession(Date.now());
   sessionId = uuid(); after = 0; dropped = 0; lastWifiScan = 0; devices.clear();
   sessionObservationCount = 0; sessionWifiCount = 0;
-  sessionName = "";
+  sessionName = ""; scanProfiles = [];
   sessionStartTime = Date.now();
   saveSession();
   postMessage({ type: "session", sessionId, reason });
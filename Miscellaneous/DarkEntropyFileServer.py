@@ -11,7 +11,14 @@
 # - Imports, constants, user options (top)
 # - CSS (CYBER_CSS)
 # - HTML section functions (upload, nav, filetable, etc.)
-# - HTTP Handler class (file/folder listing, upload, view, download)
+# - HTTP Handler class (file/folder listing, upload, view, download, stats)
+# - Server stats, background jobs (checksum manifests), directory sizes, content index
+# - Digest cache, persistent directory snapshot, hot-folder hash warmer
+# - Upload write path (chunking, preallocation, fsync policy, O_DIRECT)
+# - Content-addressed upload store (dedup)
+# - Debug endpoints (stack sampler, tracemalloc diff)
+# - Pooled server mode
+# - Segmented download client (fetch)
 # - Main/server code (argparse, kill option, run server)
 #
 # Quick usage:
@@ -20,11 +27,32 @@
 #   -b/--bind <ADDR>        Bind to specific address (default 0.0.0.0)
 #   -k/--kill <PORT>        Kill process using PORT
 #   -s/--show-hidden        Show hidden files (starting with .)
+#   --index-content         Index text file contents in the background for /grep
+#   --index-db <PATH>       Content index database (default ./.darkentropy-index.sqlite)
+#   --snapshot <PATH>       Persist digests and directory sizes to PATH for fast listings after restart
+#   --warm-hashes           Pre-hash frequently listed folders in the background while idle
+#   --upload-chunk <BYTES>  Upload write size (default 1 MiB)
+#   --upload-prealloc       Reserve upload space up front with posix_fallocate
+#   --upload-fsync <POLICY> never | close | batched (default never)
+#   --upload-direct-min <BYTES> Write uploads at least this large with O_DIRECT (default 0 = off)
+#   --cas-dir <PATH>        Deduplicate uploads into a content-addressed store at PATH
+#   --debug-token <TOKEN>   Enable /debug/profile and /debug/memory for requests with X-Debug-Token: TOKEN
+#   -w/--workers <N>        Serve with a fixed pool of N workers (default 0 = thread per connection)
+#   --queue-size <N>        Pooled mode: accepted connections allowed to wait (default 64)
+#   --header-timeout <SEC>  Pooled mode: deadline for request line + headers (default 10)
+#   --body-timeout <SEC>    Pooled mode: deadline for reading a request body (default 300)
+#   --keepalive-timeout <SEC> Pooled mode: idle time allowed between requests (default 5)
+#
+#   python3 DarkEntropyFileServer.py fetch URL [-c 8] [-o FILE]
+#                           Parallel ranged download with resume and SHA-256 check
 # ==========================================================
 
 
 import http.server, socketserver, os, sys, socket, argparse, threading, html, shutil, stat, subprocess, platform, signal, time
-from urllib.parse import urlparse, parse_qs
+import json, queue, heapq, itertools, hashlib, uuid, concurrent.futures, struct, functools, re, array, bisect, tempfile
+import hmac, collections, tracemalloc, mmap, errno
+from urllib.parse import urlparse, parse_qs, urlsplit, urlencode
+import http.client
 
 try:
     import pwd, grp
@@ -38,9 +66,88 @@ try:
 except ImportError:
     HAS_CGI = False
 
+try:
+    import fcntl
+    HAS_FCNTL = True
+except ImportError:
+    HAS_FCNTL = False
+
+try:
+    import sqlite3
+    HAS_SQLITE = True
+except ImportError:
+    HAS_SQLITE = False
+
 DEFAULT_PORT = 9000
 DEFAULT_HASH = "md5"
-HASH_OPTIONS = ["md5", "sha1", "sha224", "sha256", "sha384", "sha512"]
+HASH_OPTIONS = ["md5", "sha1", "sha224", "sha256", "sha384", "sha512", "quick"]
+HASH_LABELS = {"quick": "QUICK (sampled, non-crypto)"}
+HASH_CHUNK = 1024 * 1024     # streaming read size for full digests
+QUICK_BLOCK = 64 * 1024      # bytes per sample in the quick fingerprint
+QUICK_SAMPLES = 8            # evenly spaced samples between head and tail
+QUICK_FULL_HASH = "sha256"   # digest offered per row when listing in quick mode
+STREAM_BATCH = 16 * 1024     # bytes buffered per write when streaming /list
+
+# Background jobs (checksum manifests)
+JOB_HASH_WORKERS = min(8, os.cpu_count() or 1)
+JOB_HISTORY = 50             # finished jobs kept for polling
+JOB_REPORT_LIMIT = 1000      # max paths listed per failure category in a verify report
+
+# Recursive directory sizes (/dirsize)
+DIRSIZE_WORKERS = 8          # parallel scandir threads
+DIRSIZE_TTL = 30.0           # seconds an unwatched (no inotify) total counts as fresh
+
+# Digest cache and persistent snapshot (opt-in with --snapshot)
+DIGEST_CACHE_MAX = 200_000   # cached (path, alg) digests kept in memory
+SNAPSHOT_INTERVAL = 300.0    # seconds between snapshot saves when something changed
+
+# Hot-folder hash warmer (opt-in with --warm-hashes)
+WARM_HALF_LIFE = 600.0       # seconds for a folder's access score to halve
+WARM_MIN_SCORE = 1.5         # decayed /list hits before a folder counts as hot (~2 recent)
+WARM_FOLDERS = 8             # hottest folders warmed per pass
+WARM_ALGS = 2                # most-used algorithms warmed per folder
+WARM_TRACKED = 256           # folders remembered
+WARM_IDLE = 1.0              # seconds without requests before warming (re)starts
+WARM_INTERVAL = 5.0          # seconds between passes
+WARM_NICE = 19
+
+# Full-text content index (/grep, opt-in with --index-content)
+INDEX_DB_NAME = ".darkentropy-index.sqlite"
+INDEX_RESCAN_INTERVAL = 60.0 # seconds between incremental passes
+INDEX_MAX_FILE_BYTES = 8 * 1024 * 1024
+INDEX_SNIFF_BYTES = 8192
+GREP_MAX_FILES = 50
+GREP_MAX_SNIPPETS = 3
+GREP_SNIPPET_CHARS = 200
+
+# Upload write path (see UploadWriter)
+UPLOAD_CHUNK = 1024 * 1024
+UPLOAD_FSYNC_POLICIES = ("never", "close", "batched")
+UPLOAD_FSYNC_INTERVAL = 1.0  # seconds between batched fsync passes
+UPLOAD_DIRECT_ALIGN = 4096   # O_DIRECT buffer/length alignment
+
+# Content-addressed upload store (opt-in with --cas-dir)
+CAS_CHUNK = 1024 * 1024
+FICLONE = 0x40049409         # Linux ioctl: reflink a whole file
+
+# Debug endpoints (opt-in with --debug-token)
+PROFILE_MAX_SECONDS = 60
+PROFILE_INTERVAL = 0.01      # stack sampling period (100 Hz)
+MEMORY_TOP = 25
+
+# Segmented download client (fetch)
+FETCH_CONNECTIONS = 8
+FETCH_CHUNK = 256 * 1024
+FETCH_RETRIES = 5            # attempts per segment before giving up (state is kept for resume)
+FETCH_TIMEOUT = 30.0
+FETCH_HASH_TIMEOUT = 600.0     # /hash reads the whole file before answering
+
+# Pooled server mode defaults (see PooledHTTPServer)
+DEFAULT_WORKERS = 0          # 0 = classic ThreadingTCPServer, one thread per connection
+DEFAULT_QUEUE_SIZE = 64
+DEFAULT_HEADER_TIMEOUT = 10.0
+DEFAULT_BODY_TIMEOUT = 300.0
+DEFAULT_KEEPALIVE_TIMEOUT = 5.0
 
 # ========================== CSS ===========================
 CYBER_CSS = """
@@ -186,6 +293,10 @@ body {
 .files-table .hash {
   background: #14171f; color: #43fff7; font-family: monospace; border-radius: 6px; padding: 2px 8px;
 }
+.files-table .full-hash {
+  background: none; color: #1bf6ff; border: 1px solid #14d4ec; border-radius: 5px;
+  font-size: .8em; margin-left: 6px; padding: 1px 6px; cursor: pointer;
+}
 .files-table .ownergrp {
   color:#a8e6f7;
 }
@@ -248,7 +359,7 @@ body {
 
 def upload_header_row_html(pid, hash_alg):
     hash_select = ''.join(
-        f'<option value="{opt}" {"selected" if hash_alg==opt else ""}>{opt.upper()}</option>'
+        f'<option value="{opt}" {"selected" if hash_alg==opt else ""}>{HASH_LABELS.get(opt, opt.upper())}</option>'
         for opt in HASH_OPTIONS
     )
     return f"""
@@ -283,104 +394,230 @@ def upload_drawer_html():
     </div>
     """
 
-def get_file_table_html(folder, hash_alg, show_hidden=False):
-    import hashlib
+def _pread(f, size, offset):
+    if hasattr(os, "pread"):
+        return os.pread(f.fileno(), size, offset)
+    f.seek(offset)
+    return f.read(size)
+
+def quick_fingerprint(path):
+    """Sampled fingerprint: size plus head, tail and QUICK_SAMPLES evenly spaced blocks.
+
+    NOT a cryptographic digest: files that differ only between samples
+    collide. Cost is bounded by QUICK_SAMPLES + 2 block reads whatever the
+    file size, so it is cheap enough to show on every row.
+    """
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        h = hashlib.blake2b(digest_size=16)
+        h.update(size.to_bytes(8, "little"))
+        if size <= QUICK_BLOCK * (QUICK_SAMPLES + 2):
+            h.update(f.read())
+        else:
+            span = size - QUICK_BLOCK
+            for i in range(QUICK_SAMPLES + 2):
+                h.update(_pread(f, QUICK_BLOCK, span * i // (QUICK_SAMPLES + 1)))
+    return h.hexdigest()
+
+def file_digest(path, hash_alg, on_chunk=None):
+    """Hex digest of a file, streamed in HASH_CHUNK reads ('quick' is sampled).
+
+    on_chunk(n) is called after each chunk; background jobs use it for
+    progress and raise from it to cancel.
+    """
+    if hash_alg == "quick":
+        return quick_fingerprint(path)
+    h = hashlib.new(hash_alg if hash_alg in HASH_OPTIONS else DEFAULT_HASH)
+    buf = bytearray(HASH_CHUNK)
+    view = memoryview(buf)
+    with open(path, "rb", buffering=0) as f:
+        while True:
+            n = f.readinto(buf)
+            if not n:
+                break
+            h.update(view[:n])
+            if on_chunk:
+                on_chunk(n)
+    return h.hexdigest()
+
+TABLE_HEADER = ("<tr>"
+                "<th></th>"
+                "<th>Name</th>"
+                "<th>Owner:Group</th>"
+                "<th>Size (MB)</th>"
+                "<th>Hash</th>"
+                "<th>Date Created</th>"
+                "<th></th>"
+                "</tr>")
+
+LIST_FIELDS = ("name", "path", "type", "size", "mtime", "ctime", "owner", "group", "mode", "hash")
+LIST_SORTS = ("name", "type", "size", "mtime", "ctime")
+DEFAULT_LIST_FIELDS = ("name", "type", "size", "mtime")
+
+@functools.lru_cache(maxsize=256)
+def _owner_name(uid):
     try:
-        items = sorted(os.listdir(folder), key=lambda x: (not os.path.isdir(os.path.join(folder,x)), x.lower()))
-        if not show_hidden:
-            items = [i for i in items if not i.startswith('.')]
-    except Exception as e:
-        return f'<div class="upload-error">Error: {html.escape(str(e))}</div>'
+        return pwd.getpwuid(uid).pw_name
+    except Exception:
+        return str(uid)
+
+@functools.lru_cache(maxsize=256)
+def _group_name(gid):
+    try:
+        return grp.getgrgid(gid).gr_name
+    except Exception:
+        return str(gid)
+
+def _sort_key(sort, name, is_dir, is_file, st):
+    if sort is None:
+        return (not is_dir, name.lower())
+    if sort == "name":
+        return (name.lower(),)
+    if sort == "type":
+        return (0 if is_dir else 1 if is_file else 2, name.lower())
+    value = getattr(st, "st_" + sort, -1) if st is not None else -1
+    if sort == "size" and not is_file:
+        value = -1
+    return (value, name.lower())
+
+def scan_entries(folder, fields, show_hidden=False, sort=None, descending=False, limit=None, hash_alg=DEFAULT_HASH):
+    """List a folder as dicts holding only the requested fields.
 
+    The folder is scanned eagerly (so OSError is raised here): one scandir
+    pass collects type, lstat and a precomputed sort key per entry, then
+    sorting, or a heap top-N when limit is set, picks the rows. The returned
+    generator computes requested fields only for the picked rows, so owner
+    lookups and hashing cost nothing unless asked for. sort=None keeps the
+    table order: folders first, then case-insensitive name.
+    """
     rows = []
+    with os.scandir(folder) as it:
+        for index, de in enumerate(it):
+            if not show_hidden and de.name.startswith('.'):
+                continue
+            try:
+                is_dir, is_file = de.is_dir(), de.is_file()
+                st, error = de.stat(follow_symlinks=False), None
+            except OSError as e:
+                is_dir = is_file = False
+                st, error = None, e
+            rows.append((_sort_key(sort, de.name, is_dir, is_file, st), index, de, is_dir, is_file, st, error))
+    if limit is not None and limit < len(rows):
+        rows = heapq.nlargest(limit, rows) if descending else heapq.nsmallest(limit, rows)
+    else:
+        rows.sort(reverse=descending)
+    return (_entry_fields(row[2:], fields, hash_alg) for row in rows)
+
+def _entry_fields(row, fields, hash_alg):
+    de, is_dir, is_file, st, error = row
+    if error is not None:
+        return {"name": de.name, "path": de.path, "error": str(error)}
+    entry = {}
+    for field in fields:
+        if field == "name":
+            entry["name"] = de.name
+        elif field == "path":
+            entry["path"] = de.path
+        elif field == "type":
+            entry["type"] = "dir" if is_dir else "file" if is_file else "other"
+        elif field == "size":
+            entry["size"] = st.st_size if is_file else None
+        elif field == "mtime":
+            entry["mtime"] = st.st_mtime
+        elif field == "ctime":
+            entry["ctime"] = st.st_ctime
+        elif field == "owner":
+            entry["owner"] = _owner_name(st.st_uid)
+        elif field == "group":
+            entry["group"] = _group_name(st.st_gid)
+        elif field == "mode":
+            entry["mode"] = stat.filemode(st.st_mode)
+        elif field == "hash":
+            try:
+                entry["hash"] = DIGESTS.digest(de.path, hash_alg, st) if is_file else None
+            except OSError:
+                entry["hash"] = None
+    return entry
+
+TABLE_FIELDS = ("name", "path", "type", "size", "ctime", "owner", "group", "hash")
+
+def iter_file_table_html(folder, hash_alg, show_hidden=False):
+    """Yield the file table as HTML pieces: search box and header first, then one row at a time."""
+    try:
+        entries = scan_entries(folder, TABLE_FIELDS, show_hidden, hash_alg=hash_alg)
+    except Exception as e:
+        yield f'<div class="upload-error">Error: {html.escape(str(e))}</div>'
+        return
+
+    yield f"""
+    <div style="margin-bottom: 8px;">
+      <input type="search" id="searchBox" oninput="filterFiles()" onkeydown="if (event.key == 'Enter') grepContent()" placeholder="Search files or folders... (Enter: search contents)">
+    </div>
+    <table class="files-table" id="fileTable">{TABLE_HEADER}"""
 
     # Always add Up one level row
     parent_folder = os.path.abspath(os.path.join(folder, '..'))
-    rows.append(
+    yield (
         f"<tr><td class='icon'><i class='fa fa-level-up-alt'></i></td>"
         f"<td><span class='dir-name' onclick='changeFolder(\"{html.escape(parent_folder)}\", this)'>.. (Up one level)</span></td>"
         f"<td></td><td></td><td></td><td></td><td></td></tr>"
     )
 
-    for item in items:
-        full = os.path.join(folder, item)
-        try:
-            st = os.lstat(full)
-            size = st.st_size if os.path.isfile(full) else "-"
-            # Use creation time where possible, fallback to modified time
-            try:
-                created = st.st_ctime
-            except Exception:
-                created = st.st_mtime
-            created_str = time.strftime("%Y/%m/%d", time.localtime(created))
-            try:
-                owner = pwd.getpwuid(st.st_uid).pw_name
-                group = grp.getgrgid(st.st_gid).gr_name
-                ownergrp = f"{owner}:{group}"
-            except Exception:
-                ownergrp = f"{st.st_uid}:{st.st_gid}"
-            is_dir = os.path.isdir(full)
-            icon = '<i class="fa fa-folder"></i>' if is_dir else '<i class="fa fa-file"></i>'
-            name_class = "dir-name" if is_dir else "file-name"
-            hash_val = "-"
-            if not is_dir:
-                try:
-                    with open(full, "rb") as f:
-                        data = f.read()
-                        if hash_alg == "sha1":
-                            hash_val = hashlib.sha1(data).hexdigest()
-                        elif hash_alg == "sha224":
-                            hash_val = hashlib.sha224(data).hexdigest()
-                        elif hash_alg == "sha256":
-                            hash_val = hashlib.sha256(data).hexdigest()
-                        elif hash_alg == "sha384":
-                            hash_val = hashlib.sha384(data).hexdigest()
-                        elif hash_alg == "sha512":
-                            hash_val = hashlib.sha512(data).hexdigest()
-                        else:
-                            hash_val = hashlib.md5(data).hexdigest()
-                except Exception:
-                    hash_val = "-"
-            size_str = "-" if size == "-" else "{:.2f}".format(float(size)/1024/1024)
-            name_display = f'<span class="{name_class}" onclick="{"changeFolder" if is_dir else "viewFile"}(\'{html.escape(full)}\', this)">{html.escape(item) + ("/" if is_dir else "")}</span>'
-            dl = f'<a class="download-link" href="/download?file={html.escape(full)}" onclick="event.stopPropagation()">Download</a>' if not is_dir else ''
-            rows.append(
-                f"<tr>"
-                f"<td class='icon'>{icon}</td>"
-                f"<td>{name_display}</td>"
-                f"<td class='ownergrp'>{ownergrp}</td>"
-                f"<td class='size'>{size_str}</td>"
-                f"<td class='hash'>{hash_val}</td>"
-                f"<td class='time'>{created_str}</td>"
-                f"<td>{dl}</td>"
-                f"</tr>"
-            )
-        except Exception as e:
-            rows.append(f"<tr><td colspan='7' class='upload-error'>{html.escape(str(e))}</td></tr>")
-
-    header = ("<tr>"
-              "<th></th>"
-              "<th>Name</th>"
-              "<th>Owner:Group</th>"
-              "<th>Size (MB)</th>"
-              "<th>Hash</th>"
-              "<th>Date Created</th>"
-              "<th></th>"
-              "</tr>")
-    return f"""
-    <div style="margin-bottom: 8px;">
-      <input type="search" id="searchBox" oninput="filterFiles()" placeholder="Search files or folders...">
-    </div>
-    <table class="files-table" id="fileTable">{header}{''.join(rows)}</table>
+    for entry in entries:
+        if "error" in entry:
+            yield f"<tr><td colspan='7' class='upload-error'>{html.escape(entry['error'])}</td></tr>"
+            continue
+        item, full = entry["name"], entry["path"]
+        size = entry["size"]
+        created_str = time.strftime("%Y/%m/%d", time.localtime(entry["ctime"]))
+        ownergrp = f"{entry['owner']}:{entry['group']}"
+        is_dir = entry["type"] == "dir"
+        icon = '<i class="fa fa-folder"></i>' if is_dir else '<i class="fa fa-file"></i>'
+        name_class = "dir-name" if is_dir else "file-name"
+        hash_val = "-"
+        if not is_dir:
+            hash_val = entry["hash"] or "-"
+            if hash_alg == "quick" and hash_val != "-":
+                hash_val = (f"<span title='Sampled fingerprint, not cryptographic'>{hash_val}</span>"
+                            f"<button class='full-hash' onclick='fullHash(\"{html.escape(full)}\", this, event)'>"
+                            f"{QUICK_FULL_HASH.upper()}</button>")
+        size_str = "-" if size is None else "{:.2f}".format(float(size)/1024/1024)
+        name_display = f'<span class="{name_class}" onclick="{"changeFolder" if is_dir else "viewFile"}(\'{html.escape(full)}\', this)">{html.escape(item) + ("/" if is_dir else "")}</span>'
+        dl = f'<a class="download-link" href="/download?file={html.escape(full)}" onclick="event.stopPropagation()">Download</a>' if not is_dir else ''
+        size_cell = (f"<td class='size dirsize' data-dir='{html.escape(full)}'>&hellip;</td>" if is_dir
+                     else f"<td class='size'>{size_str}</td>")
+        yield (
+            f"<tr>"
+            f"<td class='icon'>{icon}</td>"
+            f"<td>{name_display}</td>"
+            f"<td class='ownergrp'>{ownergrp}</td>"
+            f"{size_cell}"
+            f"<td class='hash'>{hash_val}</td>"
+            f"<td class='time'>{created_str}</td>"
+            f"<td>{dl}</td>"
+            f"</tr>"
+        )
+
+    yield """</table>
     """
 
-def render_table_card(folder, hash_alg, show_hidden):
-    return f'''
+def get_file_table_html(folder, hash_alg, show_hidden=False):
+    return ''.join(iter_file_table_html(folder, hash_alg, show_hidden))
+
+def iter_table_card(folder, hash_alg, show_hidden):
+    pieces = iter_file_table_html(folder, hash_alg, show_hidden)
+    # Card opening travels with the table header so the first flush is useful
+    yield '''
     <div class="table-card" id="mainTableCard">
-      {get_file_table_html(folder, hash_alg, show_hidden)}
+      ''' + next(pieces, '')
+    yield from pieces
+    yield '''
     </div>
     '''
 
+def render_table_card(folder, hash_alg, show_hidden):
+    return ''.join(iter_table_card(folder, hash_alg, show_hidden))
+
 # ====================== MAIN HTML TEMPLATE ===================
 MAIN_TEMPLATE = lambda pid, hash_alg, show_hidden: f"""<!DOCTYPE html>
 <html lang="en"><head>
@@ -438,9 +675,44 @@ function reloadTable() {{
     .then(r => r.text())
     .then(html => {{
       document.getElementById("mainTableCard").outerHTML = html;
+      loadDirSizes();
     }});
 }}
 
+// Fill directory sizes lazily from /dirsize, a few requests at a time
+function loadDirSizes() {{
+  let cells = [...document.querySelectorAll("#fileTable td.dirsize")];
+  let active = 0;
+  let worker = () => {{
+    let td = cells.shift();
+    if (!td) {{ active--; return; }}
+    if (!td.isConnected) return worker();
+    fetch(`/dirsize?folder=${{encodeURIComponent(td.dataset.dir)}}`)
+      .then(r => r.json())
+      .then(res => {{
+        if (res.bytes != null) td.textContent = (res.bytes / 1024 / 1024).toFixed(2);
+        if (res.state == "pending" || res.state == "refreshing") setTimeout(() => {{
+          cells.push(td);
+          if (active < 4) {{ active++; worker(); }}
+        }}, 1000);
+      }})
+      .catch(() => {{}})
+      .then(worker);
+  }};
+  while (active < 4 && cells.length) {{ active++; worker(); }}
+}}
+document.addEventListener('DOMContentLoaded', loadDirSizes);
+
+// Compute a full digest for one row on demand (quick mode)
+function fullHash(file, el, e) {{
+  e.stopPropagation();
+  el.disabled = true;
+  fetch(`/hash?file=${{encodeURIComponent(file)}}&alg={QUICK_FULL_HASH}`)
+    .then(r => r.json())
+    .then(res => {{ el.parentNode.textContent = res.digest || res.error; }})
+    .catch(() => {{ el.disabled = false; }});
+}}
+
 // View file contents modal
 function viewFile(file, el) {{
   fetch(`/viewfile?file=${{encodeURIComponent(file)}}`)
@@ -508,6 +780,19 @@ function filterFiles() {{
   }}
 }}
 
+// Full-text search over indexed file contents
+function grepContent() {{
+  let q = document.getElementById("searchBox").value;
+  if (!q) return;
+  fetch(`/grep?q=${{encodeURIComponent(q)}}&folder=${{encodeURIComponent(curFolder)}}`)
+    .then(r => r.json())
+    .then(res => {{
+      if (res.error) return showModal(res.error);
+      let out = res.results.map(f => f.matches.map(m => `${{f.path}}:${{m.line}}: ${{m.text}}`).join("\n")).join("\n\n");
+      showModal(out || `No matches for "${{q}}" (${{res.indexed_files}} files indexed)`);
+    }});
+}}
+
 // Table row hover highlight
 document.addEventListener("mouseover", e => {{
   let r = e.target.closest("tr");
@@ -523,11 +808,224 @@ document.addEventListener("mouseout", e => {{
 
 # ========== HTTP SERVER CLASS ==========
 
+def tracks_activity(method):
+    """Count a request handler as in flight so background work can yield to it."""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        STATS.request_started()
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            STATS.request_finished()
+    return wrapper
+
 class DarkEntropyFileServerHandler(http.server.SimpleHTTPRequestHandler):
     server_version = "DarkEntropyFileServer/1.8"
     show_hidden = False  # set by CLI option
 
+    def send_json(self, obj, status=200):
+        body = json.dumps(obj).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_stream(self, pieces, content_type="text/html"):
+        """Stream str pieces, encoded into one reused buffer and flushed every STREAM_BATCH bytes.
+
+        The first piece is flushed on its own so the page header arrives
+        before any row is rendered. HTTP/1.1 clients get
+        Transfer-Encoding: chunked; HTTP/1.0 responses end when the
+        connection closes.
+        """
+        chunked = self.request_version == "HTTP/1.1" and self.protocol_version == "HTTP/1.1"
+        self.send_response(200)
+        self.send_header("Content-type", content_type)
+        if chunked:
+            self.send_header("Transfer-Encoding", "chunked")
+        else:
+            self.close_connection = True
+        self.end_headers()
+        buf = bytearray(STREAM_BATCH)
+        view = memoryview(buf)
+        pos = 0
+        first = True
+        for piece in pieces:
+            data = piece.encode('utf-8')
+            if pos + len(data) > STREAM_BATCH:
+                self._write_chunk(view[:pos], chunked)
+                pos = 0
+            if len(data) > STREAM_BATCH:
+                self._write_chunk(data, chunked)
+            else:
+                view[pos:pos + len(data)] = data
+                pos += len(data)
+            if first:
+                self._write_chunk(view[:pos], chunked)
+                pos = 0
+                first = False
+        if pos:
+            self._write_chunk(view[:pos], chunked)
+        if chunked:
+            self.wfile.write(b"0\r\n\r\n")
+
+    def _write_chunk(self, data, chunked):
+        if not len(data):
+            return
+        if chunked:
+            self.wfile.write(b"%x\r\n" % len(data))
+            self.wfile.write(data)
+            self.wfile.write(b"\r\n")
+        else:
+            self.wfile.write(data)
+
+    def send_download(self, file_path, head=False):
+        """Send a file as an attachment, honouring a single byte Range (206/416) and If-Range."""
+        try:
+            f = open(file_path, 'rb')
+        except OSError as e:
+            self.send_error(404, f"File not found or error: {e}")
+            return
+        with f:
+            st = os.fstat(f.fileno())
+            size = st.st_size
+            etag = f'"{st.st_mtime_ns:x}-{size:x}"'
+            start, end, status = 0, size - 1, 200
+            range_header = self.headers.get('Range')
+            if range_header and self.headers.get('If-Range', etag) == etag:
+                try:
+                    byte_range = parse_byte_range(range_header, size)
+                except ValueError:
+                    byte_range = (start, end)   # malformed or multi-range: send the whole file
+                else:
+                    if byte_range is None:
+                        self.send_response(416)
+                        self.send_header('Content-Range', f'bytes */{size}')
+                        self.send_header('Content-Length', '0')
+                        self.end_headers()
+                        return
+                    status = 206
+                start, end = byte_range
+            length = end - start + 1
+            self.send_response(status)
+            self.send_header('Content-Disposition', f'attachment; filename="{os.path.basename(file_path)}"')
+            self.send_header('Content-Type', 'application/octet-stream')
+            self.send_header('Content-Length', str(length))
+            self.send_header('Accept-Ranges', 'bytes')
+            self.send_header('ETag', etag)
+            self.send_header('Last-Modified', self.date_time_string(st.st_mtime))
+            if status == 206:
+                self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+            self.end_headers()
+            if head or length <= 0:
+                return
+            self.connection.sendfile(f, start, length)
+            STATS.incr("download_bytes", length)
+
+    def handle_api_list(self, query):
+        """GET /api/list: NDJSON rows with only the requested fields."""
+        folder = query.get('folder', ['.'])[0]
+        fields = [f for f in query.get('fields', [','.join(DEFAULT_LIST_FIELDS)])[0].split(',') if f]
+        sort = query.get('sort', [None])[0]
+        descending = query.get('order', ['asc'])[0].lower() == 'desc'
+        hash_alg = query.get('hash', [DEFAULT_HASH])[0].lower()
+        show_hidden = query.get('showHidden', ['false'])[0].lower() == 'true' or self.show_hidden
+        unknown = [f for f in fields if f not in LIST_FIELDS]
+        if unknown:
+            self.send_json({"error": f"unknown fields: {', '.join(unknown)}", "fields": LIST_FIELDS}, 400)
+            return
+        if sort is not None and sort not in LIST_SORTS:
+            self.send_json({"error": f"cannot sort by {sort}", "sorts": LIST_SORTS}, 400)
+            return
+        if hash_alg not in HASH_OPTIONS:
+            self.send_json({"error": f"unknown hash {hash_alg}"}, 400)
+            return
+        try:
+            limit = int(query['limit'][0]) if query.get('limit', [''])[0] else None
+        except ValueError:
+            self.send_json({"error": "limit must be an integer"}, 400)
+            return
+        if WARMER and "hash" in fields:
+            WARMER.record(folder, hash_alg)
+        try:
+            entries = scan_entries(folder, fields, show_hidden, sort, descending, limit, hash_alg)
+        except OSError as e:
+            self.send_json({"error": str(e)}, 404)
+            return
+        self.send_stream((json.dumps(entry) + "\n" for entry in entries), "application/x-ndjson")
+
+    def handle_debug(self, path, query):
+        """GET /debug/profile and /debug/memory; 404 unless --debug-token was given and matches.
+
+        The token is only read from the X-Debug-Token header: the request
+        line, query string included, is written to the access log.
+        """
+        token = self.headers.get('X-Debug-Token')
+        if DEBUG_TOKEN is None:
+            self.send_error(404, "Debug endpoints are disabled")
+            return
+        if not token or not hmac.compare_digest(token.encode(), DEBUG_TOKEN.encode()):
+            self.send_error(403, "Debug token required")
+            return
+        try:
+            seconds = min(PROFILE_MAX_SECONDS, max(0.1, float(query.get('seconds', ['10'])[0])))
+            if path == '/debug/profile':
+                interval = max(0.001, float(query.get('interval', [PROFILE_INTERVAL])[0]))
+                body = sample_stacks(seconds, interval)
+            elif path == '/debug/memory':
+                body = memory_diff(seconds, int(query.get('top', [MEMORY_TOP])[0]))
+            else:
+                self.send_error(404, "Unknown debug endpoint")
+                return
+        except ValueError as e:
+            self.send_error(400, str(e))
+            return
+        data = body.encode('utf-8')
+        self.send_response(200)
+        self.send_header("Content-type", "text/plain; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def handle_job_post(self, path, query):
+        """POST /jobs/manifest, /jobs/verify and /jobs/<id>/cancel."""
+        if path == "/jobs/manifest":
+            folder = query.get('folder', ['.'])[0]
+            hash_alg = query.get('alg', ['sha256'])[0].lower()
+            if hash_alg not in HASH_OPTIONS or hash_alg == "quick":
+                self.send_json({"error": f"unsupported manifest hash {hash_alg}"}, 400)
+                return
+            if not os.path.isdir(folder):
+                self.send_json({"error": "folder not found"}, 404)
+                return
+            out = query.get('manifest', [os.path.join(folder, f"MANIFEST.{hash_alg}")])[0]
+            job = JOBS.submit("manifest", {"folder": folder, "manifest": out, "alg": hash_alg}, run_manifest_job)
+        elif path == "/jobs/verify":
+            manifest = query.get('manifest', [None])[0]
+            if not manifest or not os.path.isfile(manifest):
+                self.send_json({"error": "manifest not found"}, 404)
+                return
+            folder = query.get('folder', [os.path.dirname(manifest) or '.'])[0]
+            hash_alg = query.get('alg', [manifest_alg(manifest)])[0].lower()
+            if hash_alg not in HASH_OPTIONS or hash_alg == "quick":
+                self.send_json({"error": f"unsupported manifest hash {hash_alg}"}, 400)
+                return
+            job = JOBS.submit("verify", {"folder": folder, "manifest": manifest, "alg": hash_alg}, run_verify_job)
+        elif path.endswith("/cancel"):
+            job = JOBS.get(path[len("/jobs/"):-len("/cancel")])
+            if not job:
+                self.send_json({"error": "no such job"}, 404)
+                return
+            job.cancel()
+        else:
+            self.send_json({"error": "unknown job endpoint"}, 404)
+            return
+        self.send_json(job.status(), 202)
+
+    @tracks_activity
     def do_GET(self):
+        STATS.incr("requests")
         parsed_path = urlparse(self.path)
         path = parsed_path.path
         query = parse_qs(parsed_path.query)
@@ -541,11 +1039,12 @@ class DarkEntropyFileServerHandler(http.server.SimpleHTTPRequestHandler):
             folder = query.get('folder', ['.'])[0]
             hash_alg = query.get('hash', [DEFAULT_HASH])[0].lower()
             show_hidden = query.get('showHidden', ['false'])[0].lower() == 'true' or self.show_hidden
-            html_fragment = render_table_card(folder, hash_alg, show_hidden)
-            self.send_response(200)
-            self.send_header("Content-type", "text/html")
-            self.end_headers()
-            self.wfile.write(html_fragment.encode('utf-8'))
+            if WARMER:
+                WARMER.record(folder, hash_alg)
+            self.send_stream(iter_table_card(folder, hash_alg, show_hidden))
+            return
+        elif path == '/api/list':
+            self.handle_api_list(query)
             return
         elif path == '/viewfile':
             file_path = query.get('file', [None])[0]
@@ -565,20 +1064,61 @@ class DarkEntropyFileServerHandler(http.server.SimpleHTTPRequestHandler):
         elif path == '/download':
             file_path = query.get('file', [None])[0]
             if file_path and os.path.isfile(file_path):
-                try:
-                    with open(file_path, 'rb') as f:
-                        content = f.read()
-                    self.send_response(200)
-                    self.send_header('Content-Disposition', f'attachment; filename="{os.path.basename(file_path)}"')
-                    self.send_header('Content-Type', 'application/octet-stream')
-                    self.send_header('Content-Length', str(len(content)))
-                    self.end_headers()
-                    self.wfile.write(content)
-                except Exception as e:
-                    self.send_error(500, f"Error reading file: {e}")
+                self.send_download(file_path)
             else:
                 self.send_error(404, "File not found")
             return
+        elif path == '/hash':
+            file_path = query.get('file', [None])[0]
+            hash_alg = query.get('alg', [QUICK_FULL_HASH])[0].lower()
+            if hash_alg not in HASH_OPTIONS:
+                self.send_json({"error": f"unknown hash {hash_alg}"}, 400)
+            elif not file_path or not os.path.isfile(file_path):
+                self.send_json({"error": "file not found"}, 404)
+            else:
+                try:
+                    self.send_json({"file": file_path, "alg": hash_alg, "digest": DIGESTS.digest(file_path, hash_alg)})
+                except OSError as e:
+                    self.send_json({"error": str(e)}, 500)
+            return
+        elif path == '/jobs':
+            self.send_json([job.status() for job in JOBS.list()])
+            return
+        elif path.startswith('/jobs/'):
+            job = JOBS.get(path[len('/jobs/'):])
+            if job:
+                self.send_json(job.status())
+            else:
+                self.send_json({"error": "no such job"}, 404)
+            return
+        elif path == '/dirsize':
+            folder = query.get('folder', ['.'])[0]
+            if os.path.isdir(folder):
+                self.send_json(DIRSIZE.lookup(folder))
+            else:
+                self.send_json({"error": "folder not found"}, 404)
+            return
+        elif path == '/grep':
+            q = query.get('q', [''])[0]
+            if CONTENT_INDEX is None:
+                self.send_json({"error": "Content search is disabled; start the server with --index-content"}, 404)
+                return
+            try:
+                limit = max(1, min(GREP_MAX_FILES, int(query.get('limit', [GREP_MAX_FILES])[0])))
+                self.send_json(CONTENT_INDEX.search(q, limit, query.get('folder', [None])[0]))
+            except ValueError as e:
+                self.send_json({"error": str(e)}, 400)
+            return
+        elif path.startswith('/debug/'):
+            self.handle_debug(path, query)
+            return
+        elif path == '/stats':
+            stats = STATS.snapshot()
+            gauges = getattr(self.server, 'gauges', None)
+            if gauges:
+                stats.update(gauges())
+            self.send_json(stats)
+            return
         else:
             # fallback for favicon or other static
             if path == '/favicon.ico':
@@ -588,7 +1128,22 @@ class DarkEntropyFileServerHandler(http.server.SimpleHTTPRequestHandler):
             # else fallback to parent
             super().do_GET()
 
+    @tracks_activity
+    def do_HEAD(self):
+        STATS.incr("requests")
+        parsed_path = urlparse(self.path)
+        if parsed_path.path == '/download':
+            file_path = parse_qs(parsed_path.query).get('file', [None])[0]
+            if file_path and os.path.isfile(file_path):
+                self.send_download(file_path, head=True)
+            else:
+                self.send_error(404, "File not found")
+            return
+        super().do_HEAD()
+
+    @tracks_activity
     def do_POST(self):
+        STATS.incr("requests")
         parsed_path = urlparse(self.path)
         if parsed_path.path == "/upload":
             ctype, pdict = cgi.parse_header(self.headers.get('content-type'))
@@ -614,8 +1169,11 @@ class DarkEntropyFileServerHandler(http.server.SimpleHTTPRequestHandler):
                         if fileitem.filename:
                             filename = os.path.basename(fileitem.filename)
                             safe_path = os.path.join(folder, filename)
-                            with open(safe_path, 'wb') as f:
-                                shutil.copyfileobj(fileitem.file, f)
+                            if CAS_STORE:
+                                if CAS_STORE.store(fileitem.file, safe_path):
+                                    filename += " (deduplicated)"
+                            else:
+                                UPLOADS.save(fileitem.file, safe_path)
                             saved_files.append(filename)
                     msg = f"Uploaded: {', '.join(saved_files)}" if saved_files else "No files uploaded."
                 except Exception as e:
@@ -629,6 +1187,9 @@ class DarkEntropyFileServerHandler(http.server.SimpleHTTPRequestHandler):
                 self.end_headers()
                 self.wfile.write(b"Invalid upload request.")
             return
+        elif parsed_path.path.startswith("/jobs/"):
+            self.handle_job_post(parsed_path.path, parse_qs(parsed_path.query))
+            return
         elif parsed_path.path == "/kill":
             self.send_response(200)
             self.send_header("Content-type", "text/plain")
@@ -642,6 +1203,2013 @@ class DarkEntropyFileServerHandler(http.server.SimpleHTTPRequestHandler):
             self.wfile.write(b"Unsupported POST path.")
             return
 
+# ========== SERVER STATS ==========
+
+class ServerStats:
+    """Thread-safe counters served as JSON by /stats."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self.active = 0
+        self._last_active = time.monotonic()
+
+    def incr(self, name, amount=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    def request_started(self):
+        with self._lock:
+            self.active += 1
+
+    def request_finished(self):
+        with self._lock:
+            self.active -= 1
+            self._last_active = time.monotonic()
+
+    def idle_for(self):
+        """Seconds since the last request finished, or 0 while any is in flight."""
+        with self._lock:
+            return 0.0 if self.active else time.monotonic() - self._last_active
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._counters)
+
+STATS = ServerStats()
+
+# ========== BACKGROUND JOBS ==========
+
+class JobCancelled(Exception):
+    pass
+
+class Job:
+    """State of one background job, polled through /jobs/<id>."""
+
+    def __init__(self, kind, params):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.params = params
+        self.state = "queued"   # queued, scanning, running, done, failed, cancelled
+        self.files_total = self.files_done = 0
+        self.bytes_total = self.bytes_done = 0
+        self.created = time.time()
+        self.started = self.finished = None
+        self.result = None
+        self.error = None
+        self._cancel = threading.Event()
+        self._lock = threading.Lock()
+
+    def cancel(self):
+        self._cancel.set()
+
+    def check_cancel(self):
+        if self._cancel.is_set():
+            raise JobCancelled()
+
+    def add_bytes(self, n):
+        self.check_cancel()
+        with self._lock:
+            self.bytes_done += n
+
+    def status(self):
+        with self._lock:
+            done, total = self.bytes_done, self.bytes_total
+        elapsed = ((self.finished or time.time()) - self.started) if self.started else 0
+        rate = done / elapsed if elapsed > 0 else 0
+        eta = (total - done) / rate if rate and self.state == "running" else None
+        return {
+            "id": self.id, "kind": self.kind, "params": self.params, "state": self.state,
+            "files_total": self.files_total, "files_done": self.files_done,
+            "bytes_total": total, "bytes_done": done,
+            "progress": round(done / total, 4) if total else (1.0 if self.state == "done" else 0.0),
+            "rate_bytes_per_sec": int(rate), "eta_seconds": round(eta, 1) if eta is not None else None,
+            "elapsed_seconds": round(elapsed, 1), "result": self.result, "error": self.error,
+        }
+
+class JobManager:
+    """Runs each job on its own thread so request threads only submit and poll."""
+
+    def __init__(self):
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, kind, params, target):
+        job = Job(kind, params)
+        with self._lock:
+            finished = [j for j in self._jobs.values() if j.finished]
+            for old in sorted(finished, key=lambda j: j.finished)[:max(0, len(finished) - JOB_HISTORY)]:
+                del self._jobs[old.id]
+            self._jobs[job.id] = job
+        threading.Thread(target=self._run, args=(job, target), name=f"job-{job.id}", daemon=True).start()
+        STATS.incr("jobs_started")
+        return job
+
+    def _run(self, job, target):
+        job.started = time.time()
+        try:
+            job.result = target(job)
+            job.state = "done"
+        except JobCancelled:
+            job.state = "cancelled"
+        except Exception as e:
+            job.state = "failed"
+            job.error = str(e)
+        job.finished = time.time()
+        STATS.incr(f"jobs_{job.state}")
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self):
+        with self._lock:
+            return list(self._jobs.values())
+
+JOBS = JobManager()
+
+def _walk_files(root, skip=()):
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for name in sorted(filenames):
+            full = os.path.join(dirpath, name)
+            if os.path.abspath(full) in skip:
+                continue
+            try:
+                st = os.stat(full)
+            except OSError:
+                continue
+            if stat.S_ISREG(st.st_mode):
+                yield full, st.st_size
+
+def _hash_files(job, paths, hash_alg):
+    """Hash paths on a JOB_HASH_WORKERS pool; returns {path: digest or OSError}."""
+    results = {}
+    window = JOB_HASH_WORKERS * 4
+    pending = {}
+    it = iter(paths)
+    with concurrent.futures.ThreadPoolExecutor(JOB_HASH_WORKERS) as pool:
+        try:
+            while True:
+                while len(pending) < window:
+                    path = next(it, None)
+                    if path is None:
+                        break
+                    pending[pool.submit(file_digest, path, hash_alg, job.add_bytes)] = path
+                if not pending:
+                    break
+                done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for fut in done:
+                    path = pending.pop(fut)
+                    try:
+                        results[path] = fut.result()
+                    except OSError as e:
+                        results[path] = e
+                    job.files_done += 1
+        except BaseException:
+            job.cancel()
+            pool.shutdown(cancel_futures=True)
+            raise
+    return results
+
+def _manifest_path(path):
+    return path.replace(os.sep, "/")
+
+def run_manifest_job(job):
+    root, out, hash_alg = job.params["folder"], job.params["manifest"], job.params["alg"]
+    job.state = "scanning"
+    files = []
+    for path, size in _walk_files(root, skip={os.path.abspath(out), os.path.abspath(out + ".part")}):
+        job.check_cancel()
+        files.append(path)
+        job.files_total += 1
+        job.bytes_total += size
+    job.state = "running"
+    digests = _hash_files(job, files, hash_alg)
+    errors = []
+    tmp = out + ".part"
+    with open(tmp, "w", encoding="utf-8") as manifest:
+        for path in files:
+            digest = digests[path]
+            if isinstance(digest, OSError):
+                errors.append(f"{path}: {digest}")
+                continue
+            manifest.write(f"{digest}  {_manifest_path(os.path.relpath(path, root))}\n")
+    os.replace(tmp, out)
+    return {"manifest": out, "files": len(files) - len(errors), "bytes": job.bytes_total,
+            "errors": errors[:JOB_REPORT_LIMIT]}
+
+def parse_manifest(path):
+    """Yield (digest, relative path) from a sha256sum-style manifest."""
+    with open(path, "r", encoding="utf-8") as manifest:
+        for line in manifest:
+            line = line.rstrip("\n")
+            if not line or line.startswith("#"):
+                continue
+            digest, _, name = line.partition(" ")
+            if name.startswith((" ", "*")):
+                name = name[1:]
+            yield digest.lower(), name
+
+def run_verify_job(job):
+    root, hash_alg = job.params["folder"], job.params["alg"]
+    job.state = "scanning"
+    expected = {}
+    missing = []
+    listed = set()
+    for digest, name in parse_manifest(job.params["manifest"]):
+        job.check_cancel()
+        listed.add(name)
+        path = os.path.join(root, *name.split("/"))
+        try:
+            size = os.stat(path).st_size
+        except OSError:
+            missing.append(name)
+            continue
+        expected[path] = (digest, name)
+        job.files_total += 1
+        job.bytes_total += size
+    # Files in the tree that the manifest does not list
+    manifest = os.path.abspath(job.params["manifest"])
+    added = []
+    for path, _ in _walk_files(root, skip={manifest, manifest + ".part"}):
+        job.check_cancel()
+        name = _manifest_path(os.path.relpath(path, root))
+        if name not in listed:
+            added.append(name)
+    job.state = "running"
+    digests = _hash_files(job, list(expected), hash_alg)
+    ok, mismatched, errors = 0, [], []
+    for path, (digest, name) in expected.items():
+        actual = digests[path]
+        if isinstance(actual, OSError):
+            errors.append(f"{name}: {actual}")
+        elif actual == digest:
+            ok += 1
+        else:
+            mismatched.append(name)
+    return {"ok": ok, "mismatched_count": len(mismatched), "missing_count": len(missing),
+            "added_count": len(added), "error_count": len(errors),
+            "mismatched": mismatched[:JOB_REPORT_LIMIT], "missing": missing[:JOB_REPORT_LIMIT],
+            "added": added[:JOB_REPORT_LIMIT], "errors": errors[:JOB_REPORT_LIMIT]}
+
+def manifest_alg(path, default="sha256"):
+    ext = os.path.splitext(path)[1].lstrip(".").lower()
+    return ext if ext in HASH_OPTIONS and ext != "quick" else default
+
+# ========== DIRECTORY SIZES ==========
+
+class InotifyWatcher:
+    """Minimal ctypes inotify binding (Linux); calls on_change(dir) for each event.
+
+    on_change(None) means the kernel queue overflowed and every watch is suspect.
+    """
+    IN_MODIFY = 0x2
+    IN_MOVED_FROM = 0x40
+    IN_MOVED_TO = 0x80
+    IN_CREATE = 0x100
+    IN_DELETE = 0x200
+    IN_DELETE_SELF = 0x400
+    IN_MOVE_SELF = 0x800
+    IN_Q_OVERFLOW = 0x4000
+    IN_IGNORED = 0x8000
+    IN_ONLYDIR = 0x1000000
+    IN_CLOEXEC = 0o2000000
+    MASK = (IN_MODIFY | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE |
+            IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+    EVENT = struct.Struct("iIII")
+
+    def __init__(self, on_change):
+        import ctypes, ctypes.util
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self._get_errno = ctypes.get_errno
+        self.fd = self._libc.inotify_init1(self.IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.exhausted = False   # set once the watch limit or kernel memory runs out
+        self._on_change = on_change
+        self._paths = {}
+        self._wds = {}
+        self._lock = threading.Lock()
+        threading.Thread(target=self._run, name="inotify", daemon=True).start()
+
+    def watch(self, path):
+        with self._lock:
+            if path in self._wds:
+                return True
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), self.MASK)
+        if wd < 0:
+            # EACCES or ENOENT only affect this directory; it falls back to the TTL
+            if self._get_errno() in (errno.ENOSPC, errno.ENOMEM):
+                self.exhausted = True
+            return False
+        with self._lock:
+            old = self._paths.get(wd)
+            if old is not None:
+                self._wds.pop(old, None)
+            self._paths[wd] = path
+            self._wds[path] = wd
+        return True
+
+    def is_watched(self, path):
+        with self._lock:
+            return path in self._wds
+
+    def _run(self):
+        while True:
+            data = os.read(self.fd, 64 * 1024)
+            offset = 0
+            while offset < len(data):
+                wd, mask, _cookie, length = self.EVENT.unpack_from(data, offset)
+                offset += self.EVENT.size + length
+                if mask & self.IN_Q_OVERFLOW:
+                    self._on_change(None)
+                    continue
+                with self._lock:
+                    path = self._paths.get(wd)
+                    if mask & self.IN_IGNORED and path is not None:
+                        del self._paths[wd]
+                        self._wds.pop(path, None)
+                if path is not None:
+                    self._on_change(path)
+
+class _DirEntry:
+    __slots__ = ("mtime_ns", "own_bytes", "own_files", "subdirs", "total_bytes", "total_files", "checked", "stale")
+
+    def __init__(self, mtime_ns, own_bytes, own_files, subdirs, previous=None):
+        self.mtime_ns = mtime_ns
+        self.own_bytes = own_bytes
+        self.own_files = own_files
+        self.subdirs = subdirs
+        # Keep the last known total visible while the new one is computed
+        self.total_bytes = previous.total_bytes if previous else None
+        self.total_files = previous.total_files if previous else None
+        self.checked = 0.0
+        self.stale = True
+
+class DirSizeCache:
+    """Recursive directory sizes (apparent bytes) from a parallel scandir walk.
+
+    Each directory's own file total is cached against its mtime and totals
+    are summed bottom-up, so a refresh only rescans directories that changed.
+    With inotify, cached totals are trusted until an event marks the
+    directory and its ancestors stale. Without it they are revalidated after
+    DIRSIZE_TTL, and a file growing in place is only noticed once its
+    directory's mtime changes.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._dirty = set()
+        self._queued = set()
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._pool = None
+        self._watcher = None
+        self.version = 0
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._pool:
+                return
+            self._pool = concurrent.futures.ThreadPoolExecutor(DIRSIZE_WORKERS, thread_name_prefix="dirsize")
+        if platform.system() == "Linux":
+            try:
+                self._watcher = InotifyWatcher(self._invalidate)
+            except (OSError, AttributeError):
+                self._watcher = None
+        threading.Thread(target=self._run, name="dirsize", daemon=True).start()
+
+    def lookup(self, folder):
+        """Cached total for folder; schedules a background refresh when not fresh."""
+        self._ensure_started()
+        path = os.path.abspath(folder)
+        with self._lock:
+            entry = self._entries.get(path)
+        if entry is None:
+            entry = self._seed(path)
+        with self._lock:
+            fresh = entry is not None and self._fresh(path, entry)
+            result = {"folder": path,
+                      "bytes": entry.total_bytes if entry else None,
+                      "files": entry.total_files if entry else None}
+        if fresh:
+            result["state"] = "ready"
+        else:
+            result["state"] = "refreshing" if result["bytes"] is not None else "pending"
+            self._enqueue(path)
+        return result
+
+    def _seed(self, path, st=None):
+        """Rebuild an entry from the persisted snapshot while the directory's mtime still matches."""
+        record = SNAPSHOT.dir_record(path) if SNAPSHOT else None
+        if record is None:
+            return None
+        try:
+            st = st or os.stat(path)
+        except OSError:
+            return None
+        if record["mtime_ns"] != st.st_mtime_ns:
+            return None
+        entry = _DirEntry(record["mtime_ns"], record["own_bytes"], record["own_files"],
+                          [os.path.join(path, name) for name in record["subdirs"]])
+        if record["total_bytes"] >= 0:
+            entry.total_bytes, entry.total_files = record["total_bytes"], record["total_files"]
+        with self._lock:
+            return self._entries.setdefault(path, entry)
+
+    def export(self):
+        """(path, mtime_ns, own_bytes, own_files, total_bytes, total_files, subdir names) per valid entry."""
+        with self._lock:
+            return [(path, e.mtime_ns, e.own_bytes, e.own_files,
+                     -1 if e.total_bytes is None else e.total_bytes,
+                     -1 if e.total_files is None else e.total_files,
+                     [os.path.basename(sub) for sub in e.subdirs])
+                    for path, e in self._entries.items() if e.mtime_ns is not None]
+
+    def _fresh(self, path, entry):
+        if entry.stale or entry.total_bytes is None:
+            return False
+        if self._watcher and not self._watcher.exhausted and self._watcher.is_watched(path):
+            return True
+        return time.monotonic() - entry.checked < DIRSIZE_TTL
+
+    def _enqueue(self, path):
+        with self._lock:
+            if path in self._queued:
+                return
+            self._queued.add(path)
+        self._queue.put(path)
+
+    def _invalidate(self, path):
+        with self._lock:
+            if path is None:
+                for entry in self._entries.values():
+                    entry.mtime_ns = None
+                    entry.stale = True
+                return
+            self._dirty.add(path)
+            entry = self._entries.get(path)
+            if entry is not None:
+                entry.mtime_ns = None
+            while entry is not None and not entry.stale:
+                entry.stale = True
+                parent = os.path.dirname(path)
+                if parent == path:
+                    break
+                path = parent
+                entry = self._entries.get(path)
+
+    def _run(self):
+        while True:
+            path = self._queue.get()
+            try:
+                self._refresh(path)
+                STATS.incr("dirsize_refreshes")
+            except Exception:
+                STATS.incr("dirsize_errors")
+            finally:
+                with self._lock:
+                    self._queued.discard(path)
+
+    def _refresh(self, root):
+        order, fresh = [], set()
+        frontier = [root]
+        while frontier:
+            order.extend(frontier)
+            next_frontier = []
+            for path, subdirs in zip(frontier, self._pool.map(self._scan_dir, frontier)):
+                if subdirs is None:
+                    fresh.add(path)
+                else:
+                    next_frontier.extend(subdirs)
+            frontier = next_frontier
+        now = time.monotonic()
+        with self._lock:
+            for path in reversed(order):
+                entry = self._entries.get(path)
+                if entry is None or path in fresh:
+                    continue
+                total_bytes, total_files = entry.own_bytes, entry.own_files
+                stale = entry.mtime_ns is None
+                for child in entry.subdirs:
+                    sub = self._entries.get(child)
+                    if sub is not None and sub.total_bytes is not None:
+                        total_bytes += sub.total_bytes
+                        total_files += sub.total_files
+                        stale = stale or sub.stale
+                entry.total_bytes, entry.total_files = total_bytes, total_files
+                entry.checked = now
+                entry.stale = stale
+            self.version += 1
+
+    def _forget(self, path):
+        """Drop path and everything cached below it; caller holds the lock."""
+        prefix = path + os.sep
+        for key in [k for k in self._entries if k == path or k.startswith(prefix)]:
+            del self._entries[key]
+
+    def _scan_dir(self, path):
+        """Revalidate one directory; returns subdirs to descend into, or None if fresh."""
+        try:
+            st = os.stat(path)
+        except (FileNotFoundError, NotADirectoryError):
+            with self._lock:
+                self._forget(path)
+            return []
+        except OSError:
+            with self._lock:
+                self._entries.pop(path, None)
+            return []
+        with self._lock:
+            seeded = path in self._entries
+        if not seeded:
+            self._seed(path, st)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and self._fresh(path, entry):
+                return None
+            if entry is not None and entry.mtime_ns == st.st_mtime_ns:
+                return entry.subdirs
+            self._dirty.discard(path)
+        if self._watcher:
+            self._watcher.watch(path)
+        own_bytes = own_files = 0
+        subdirs = []
+        try:
+            with os.scandir(path) as it:
+                for de in it:
+                    try:
+                        if de.is_dir(follow_symlinks=False):
+                            subdirs.append(de.path)
+                        elif de.is_file(follow_symlinks=False):
+                            own_bytes += de.stat(follow_symlinks=False).st_size
+                            own_files += 1
+                    except OSError:
+                        continue
+        except (FileNotFoundError, NotADirectoryError):
+            with self._lock:
+                self._forget(path)
+            return []
+        except OSError:
+            with self._lock:
+                self._entries.pop(path, None)
+            return []
+        STATS.incr("dirsize_dirs_scanned")
+        new = _DirEntry(st.st_mtime_ns, own_bytes, own_files, subdirs, entry)
+        with self._lock:
+            if path in self._dirty:
+                new.mtime_ns = None   # changed while we were scanning
+            if entry is not None:
+                for gone in set(entry.subdirs) - set(subdirs):
+                    self._forget(gone)
+            self._entries[path] = new
+        return subdirs
+
+DIRSIZE = DirSizeCache()
+
+# ========== CONTENT INDEX ==========
+
+WORD_RE = re.compile(r"\w{2,64}")
+TEXT_BYTES = bytes({7, 8, 9, 10, 12, 13, 27} | set(range(0x20, 0x100)) - {0x7f})
+
+def looks_binary(sample):
+    """Cheap sniff: any NUL, or more than 30% bytes outside printable text, means binary."""
+    if b"\0" in sample:
+        return True
+    return bool(sample) and len(sample.translate(None, TEXT_BYTES)) / len(sample) > 0.3
+
+class ContentIndex:
+    """Background full-text index of text files under root, stored in SQLite.
+
+    postings holds one row per (token, file) with the byte offsets of the
+    lines containing the token; files keeps each file's mtime/size and its
+    line-start table so offsets map back to line numbers. A pass only
+    re-reads files whose mtime or size changed, and drops vanished ones.
+    Queries intersect postings rarest token first, then re-read just the
+    candidate lines to confirm the whole phrase and build snippets.
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS files (id INTEGER PRIMARY KEY, path TEXT UNIQUE, mtime_ns INTEGER, size INTEGER, lines BLOB);
+    CREATE TABLE IF NOT EXISTS postings (token TEXT, file_id INTEGER, offsets BLOB, PRIMARY KEY (token, file_id)) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS postings_file ON postings(file_id);
+    """
+
+    def __init__(self, root, db_path, show_hidden=False):
+        self.root = os.path.abspath(root)
+        self.db_path = os.path.abspath(db_path)
+        self.show_hidden = show_hidden
+        self._connect().close()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(self.SCHEMA)
+        return conn
+
+    def start(self):
+        threading.Thread(target=self._run, name="content-index", daemon=True).start()
+
+    def _run(self):
+        conn = self._connect()
+        while True:
+            try:
+                self._pass(conn)
+                STATS.incr("index_passes")
+            except Exception:
+                STATS.incr("index_errors")
+            time.sleep(INDEX_RESCAN_INTERVAL)
+
+    def _pass(self, conn):
+        known = {path: (file_id, mtime_ns, size) for path, file_id, mtime_ns, size in
+                 conn.execute("SELECT path, id, mtime_ns, size FROM files")}
+        seen = set()
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            if not self.show_hidden:
+                dirnames[:] = [d for d in dirnames if not d.startswith('.')]
+            for name in filenames:
+                if not self.show_hidden and name.startswith('.'):
+                    continue
+                path = os.path.join(dirpath, name)
+                if path.startswith(self.db_path):
+                    continue
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                if not stat.S_ISREG(st.st_mode):
+                    continue
+                seen.add(path)
+                old = known.get(path)
+                if old and old[1] == st.st_mtime_ns and old[2] == st.st_size:
+                    continue
+                self._index_file(conn, path, st, old[0] if old else None)
+        with conn:
+            for path in known.keys() - seen:
+                conn.execute("DELETE FROM postings WHERE file_id=?", (known[path][0],))
+                conn.execute("DELETE FROM files WHERE id=?", (known[path][0],))
+
+    def _index_file(self, conn, path, st, file_id):
+        postings = {}
+        line_starts = array.array('I')
+        if st.st_size <= INDEX_MAX_FILE_BYTES:
+            try:
+                with open(path, "rb") as f:
+                    if not looks_binary(f.read(INDEX_SNIFF_BYTES)):
+                        f.seek(0)
+                        offset = 0
+                        for raw in f:
+                            line_starts.append(offset)
+                            for token in set(WORD_RE.findall(raw.decode("utf-8", "replace").lower())):
+                                postings.setdefault(token, array.array('I')).append(offset)
+                            offset += len(raw)
+            except OSError:
+                return
+        # Binary and oversized files are recorded without postings so they are not re-sniffed every pass
+        lines = line_starts.tobytes() if line_starts else None
+        with conn:
+            if file_id is None:
+                file_id = conn.execute("INSERT INTO files (path, mtime_ns, size, lines) VALUES (?, ?, ?, ?)",
+                                       (path, st.st_mtime_ns, st.st_size, lines)).lastrowid
+            else:
+                conn.execute("DELETE FROM postings WHERE file_id=?", (file_id,))
+                conn.execute("UPDATE files SET mtime_ns=?, size=?, lines=? WHERE id=?",
+                             (st.st_mtime_ns, st.st_size, lines, file_id))
+            conn.executemany("INSERT INTO postings (token, file_id, offsets) VALUES (?, ?, ?)",
+                             ((token, file_id, offsets.tobytes()) for token, offsets in postings.items()))
+        if postings:
+            STATS.incr("index_files_indexed")
+
+    def search(self, q, limit=GREP_MAX_FILES, folder=None):
+        started = time.monotonic()
+        tokens = set(WORD_RE.findall(q.lower()))
+        if not tokens:
+            raise ValueError("Query needs at least one word of two or more characters")
+        prefix = os.path.join(os.path.abspath(folder), "") if folder else None
+        needle = q.lower()
+        conn = sqlite3.connect(self.db_path, timeout=5)
+        try:
+            counts = {t: conn.execute("SELECT COUNT(*) FROM postings WHERE token=?", (t,)).fetchone()[0] for t in tokens}
+            candidates = None
+            for token in sorted(tokens, key=counts.get):
+                found = {}
+                for file_id, blob in conn.execute("SELECT file_id, offsets FROM postings WHERE token=?", (token,)):
+                    if candidates is not None and file_id not in candidates:
+                        continue
+                    offsets = array.array('I')
+                    offsets.frombytes(blob)
+                    found[file_id] = set(offsets) if candidates is None else candidates[file_id] & set(offsets)
+                candidates = {file_id: offs for file_id, offs in found.items() if offs}
+                if not candidates:
+                    break
+            results = []
+            for file_id, offsets in sorted(candidates.items(), key=lambda kv: -len(kv[1])):
+                if len(results) >= limit:
+                    break
+                path, lines = conn.execute("SELECT path, lines FROM files WHERE id=?", (file_id,)).fetchone()
+                if prefix and not path.startswith(prefix):
+                    continue
+                matches = self._confirm(path, lines, sorted(offsets), needle)
+                if matches:
+                    results.append({"path": path, "score": len(matches), "matches": matches[:GREP_MAX_SNIPPETS]})
+            indexed = conn.execute("SELECT COUNT(*) FROM files WHERE lines IS NOT NULL").fetchone()[0]
+        finally:
+            conn.close()
+        results.sort(key=lambda r: (-r["score"], r["path"]))
+        return {"query": q, "indexed_files": indexed, "results": results,
+                "elapsed_ms": round((time.monotonic() - started) * 1000, 1)}
+
+    @staticmethod
+    def _confirm(path, lines, offsets, needle):
+        """Re-read candidate lines; keep those containing the whole query (the file may have changed)."""
+        line_starts = array.array('I')
+        line_starts.frombytes(lines or b"")
+        matches = []
+        try:
+            with open(path, "rb") as f:
+                for offset in offsets:
+                    f.seek(offset)
+                    text = f.readline().decode("utf-8", "replace")
+                    if needle in text.lower():
+                        matches.append({"line": bisect.bisect_right(line_starts, offset),
+                                        "text": text.strip()[:GREP_SNIPPET_CHARS]})
+        except OSError:
+            return []
+        return matches
+
+CONTENT_INDEX = None   # set by run_server when --index-content is given
+
+# ========== DIGEST CACHE AND SNAPSHOT ==========
+
+class DigestCache:
+    """Digests keyed by (path, alg), valid while the file's size and mtime_ns are unchanged.
+
+    Misses fall back to the persisted snapshot before hashing the file.
+    """
+
+    def __init__(self):
+        self._digests = {}
+        self._lock = threading.Lock()
+        self.version = 0
+
+    def cached(self, path, hash_alg, st):
+        """True if a digest for this exact size/mtime is already held in memory."""
+        with self._lock:
+            value = self._digests.get((os.path.abspath(path), hash_alg))
+        return bool(value) and value[0] == st.st_size and value[1] == st.st_mtime_ns
+
+    def digest(self, path, hash_alg, st=None, on_chunk=None):
+        path = os.path.abspath(path)
+        if st is None or stat.S_ISLNK(st.st_mode):
+            st = os.stat(path)
+        key = (path, hash_alg)
+        with self._lock:
+            cached = self._digests.get(key)
+        if cached and cached[0] == st.st_size and cached[1] == st.st_mtime_ns:
+            STATS.incr("digest_cache_hits")
+            return cached[3]
+        value = SNAPSHOT.digest(path, hash_alg, st) if SNAPSHOT else None
+        if value:
+            STATS.incr("digest_snapshot_hits")
+        else:
+            value = file_digest(path, hash_alg, on_chunk)
+            STATS.incr("digest_cache_misses")
+        with self._lock:
+            self._digests.pop(key, None)
+            if len(self._digests) >= DIGEST_CACHE_MAX:
+                del self._digests[next(iter(self._digests))]
+            self._digests[key] = (st.st_size, st.st_mtime_ns, st.st_mode, value)
+            self.version += 1
+        return value
+
+    def export(self):
+        """(path, alg, size, mtime_ns, mode, digest) for every cached digest."""
+        with self._lock:
+            return [(path, alg) + value for (path, alg), value in self._digests.items()]
+
+DIGESTS = DigestCache()
+
+class SnapshotStore:
+    """Persistent, memory-mapped snapshot of file digests and directory sizes.
+
+    Layout (little endian): header, directory records sorted by path, entry
+    records sorted by name within each directory, digest records, then a
+    heap holding path/name strings and raw digest bytes. Lookups
+    binary-search the mapping directly, so loading costs nothing up front.
+    Everything is revalidated on use: a digest counts only while the file's
+    size and mtime_ns match, a directory size only while the directory's
+    mtime_ns matches.
+    """
+    MAGIC = b"DESNAP01"
+    HEADER = struct.Struct("<8sIII")     # magic, dir count, entry count, digest count
+    DIR = struct.Struct("<QIqqqqqII")    # path off/len, mtime_ns, own bytes/files, total bytes/files, first entry, entry count
+    ENTRY = struct.Struct("<QIIqqII")    # name off/len, mode, size, mtime_ns, first digest, digest count
+    DIGEST = struct.Struct("<QHQH")      # alg off/len, digest off/len
+
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._file = None
+        self._map = None
+        self._counts = (0, 0, 0)
+        self._saved_versions = None
+        self._load()
+
+    def _load(self):
+        try:
+            f = open(self.path, "rb")
+        except OSError:
+            return
+        try:
+            mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            f.close()
+            return
+        magic, dirs, entries, digests = self.HEADER.unpack_from(mapping, 0) if len(mapping) >= self.HEADER.size else (b"", 0, 0, 0)
+        if magic != self.MAGIC:
+            mapping.close()
+            f.close()
+            return
+        with self._lock:
+            old_map, old_file = self._map, self._file
+            self._map, self._file = mapping, f
+            self._counts = (dirs, entries, digests)
+            self._dirs_at = self.HEADER.size
+            self._entries_at = self._dirs_at + dirs * self.DIR.size
+            self._digests_at = self._entries_at + entries * self.ENTRY.size
+            self._heap_at = self._digests_at + digests * self.DIGEST.size
+        if old_map is not None:
+            old_map.close()
+            old_file.close()
+
+    def _heap(self, offset, length):
+        start = self._heap_at + offset
+        return self._map[start:start + length]
+
+    def _dir(self, index):
+        return self.DIR.unpack_from(self._map, self._dirs_at + index * self.DIR.size)
+
+    def _entry(self, index):
+        return self.ENTRY.unpack_from(self._map, self._entries_at + index * self.ENTRY.size)
+
+    def _find_dir(self, key):
+        lo, hi = 0, self._counts[0]
+        while lo < hi:
+            mid = (lo + hi) // 2
+            record = self._dir(mid)
+            name = self._heap(record[0], record[1])
+            if name < key:
+                lo = mid + 1
+            elif name > key:
+                hi = mid
+            else:
+                return record
+        return None
+
+    def _find_entry(self, first, count, key):
+        lo, hi = first, first + count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            record = self._entry(mid)
+            name = self._heap(record[0], record[1])
+            if name < key:
+                lo = mid + 1
+            elif name > key:
+                hi = mid
+            else:
+                return record
+        return None
+
+    def dir_record(self, path):
+        with self._lock:
+            if self._map is None:
+                return None
+            record = self._find_dir(os.fsencode(path))
+            if record is None or record[2] < 0:
+                return None
+            subdirs = []
+            for index in range(record[7], record[7] + record[8]):
+                entry = self._entry(index)
+                if stat.S_ISDIR(entry[2]):
+                    subdirs.append(os.fsdecode(self._heap(entry[0], entry[1])))
+        return {"mtime_ns": record[2], "own_bytes": record[3], "own_files": record[4],
+                "total_bytes": record[5], "total_files": record[6], "subdirs": subdirs}
+
+    def digest(self, path, hash_alg, st):
+        folder, name = os.path.split(path)
+        with self._lock:
+            if self._map is None:
+                return None
+            record = self._find_dir(os.fsencode(folder))
+            if record is None:
+                return None
+            entry = self._find_entry(record[7], record[8], os.fsencode(name))
+            if entry is None or entry[3] != st.st_size or entry[4] != st.st_mtime_ns:
+                return None
+            alg = hash_alg.encode()
+            for index in range(entry[5], entry[5] + entry[6]):
+                alg_off, alg_len, digest_off, digest_len = self.DIGEST.unpack_from(
+                    self._map, self._digests_at + index * self.DIGEST.size)
+                if self._heap(alg_off, alg_len) == alg:
+                    return self._heap(digest_off, digest_len).hex()
+        return None
+
+    def _read_all(self):
+        """Current snapshot contents as {dir: [meta, {name: [mode, size, mtime_ns, {alg: digest}]}]}."""
+        dirs = {}
+        with self._lock:
+            if self._map is None:
+                return dirs
+            for d in range(self._counts[0]):
+                record = self._dir(d)
+                entries = {}
+                for index in range(record[7], record[7] + record[8]):
+                    entry = self._entry(index)
+                    digests = {}
+                    for g in range(entry[5], entry[5] + entry[6]):
+                        alg_off, alg_len, digest_off, digest_len = self.DIGEST.unpack_from(
+                            self._map, self._digests_at + g * self.DIGEST.size)
+                        digests[self._heap(alg_off, alg_len).decode()] = self._heap(digest_off, digest_len).hex()
+                    entries[os.fsdecode(self._heap(entry[0], entry[1]))] = [entry[2], entry[3], entry[4], digests]
+                dirs[os.fsdecode(self._heap(record[0], record[1]))] = [list(record[2:7]), entries]
+        return dirs
+
+    @staticmethod
+    def _prune(dirs):
+        """Drop carried-over records whose directory or file no longer matches the disk."""
+        for path in list(dirs):
+            try:
+                mtime_ns = os.stat(path).st_mtime_ns
+                with os.scandir(path) as it:
+                    present = {e.name: e.stat(follow_symlinks=False) for e in it}
+            except OSError:
+                del dirs[path]
+                continue
+            meta, entries = dirs[path]
+            if meta is not None and meta[0] != mtime_ns:
+                dirs[path][0] = None
+            for name in list(entries):
+                mode, size, mtime_ns, _ = entries[name]
+                st = present.get(name)
+                if st is None or stat.S_ISDIR(mode) != stat.S_ISDIR(st.st_mode):
+                    del entries[name]
+                elif not stat.S_ISDIR(mode) and (st.st_size != size or st.st_mtime_ns != mtime_ns):
+                    del entries[name]
+            if dirs[path][0] is None and not entries:
+                del dirs[path]
+
+    def save(self):
+        """Merge the in-memory caches over the pruned current snapshot and atomically rewrite it."""
+        with self._save_lock:
+            self._save()
+
+    def _save(self):
+        dirs = self._read_all()
+        self._prune(dirs)
+        for path, mtime_ns, own_bytes, own_files, total_bytes, total_files, subdirs in DIRSIZE.export():
+            meta_entries = dirs.setdefault(path, [None, {}])
+            meta_entries[0] = [mtime_ns, own_bytes, own_files, total_bytes, total_files]
+            entries = meta_entries[1]
+            for name in [n for n, e in entries.items() if stat.S_ISDIR(e[0]) and n not in subdirs]:
+                del entries[name]
+            for name in subdirs:
+                entries.setdefault(name, [stat.S_IFDIR, 0, 0, {}])
+        for path, alg, size, mtime_ns, mode, value in DIGESTS.export():
+            folder, name = os.path.split(path)
+            entries = dirs.setdefault(folder, [None, {}])[1]
+            entry = entries.get(name)
+            if entry is None or entry[1] != size or entry[2] != mtime_ns:
+                entry = entries[name] = [mode, size, mtime_ns, {}]
+            entry[3][alg] = value
+
+        heap = bytearray()
+        strings = {}
+        def intern(data):
+            if data not in strings:
+                strings[data] = len(heap)
+                heap.extend(data)
+            return strings[data], len(data)
+        dir_records, entry_records, digest_records = bytearray(), bytearray(), bytearray()
+        n_entries = n_digests = 0
+        for path in sorted(dirs, key=os.fsencode):
+            meta, entries = dirs[path]
+            meta = meta or [-1, 0, 0, -1, -1]
+            first_entry = n_entries
+            for name in sorted(entries, key=os.fsencode):
+                mode, size, mtime_ns, digests = entries[name]
+                first_digest = n_digests
+                for alg, value in sorted(digests.items()):
+                    digest_records += self.DIGEST.pack(*intern(alg.encode()), *intern(bytes.fromhex(value)))
+                    n_digests += 1
+                entry_records += self.ENTRY.pack(*intern(os.fsencode(name)), mode, size, mtime_ns,
+                                                 first_digest, n_digests - first_digest)
+                n_entries += 1
+            dir_records += self.DIR.pack(*intern(os.fsencode(path)), *meta, first_entry, n_entries - first_entry)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(self.path), prefix=os.path.basename(self.path) + ".")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(self.HEADER.pack(self.MAGIC, len(dirs), n_entries, n_digests))
+                f.write(dir_records)
+                f.write(entry_records)
+                f.write(digest_records)
+                f.write(heap)
+            os.replace(tmp, self.path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        self._load()
+        STATS.incr("snapshot_saves")
+
+    def start(self):
+        threading.Thread(target=self._run, name="snapshot", daemon=True).start()
+
+    def save_if_changed(self):
+        with self._save_lock:
+            versions = (DIGESTS.version, DIRSIZE.version)
+            if versions != self._saved_versions:
+                self._save()
+                self._saved_versions = versions
+
+    def _run(self):
+        while True:
+            time.sleep(SNAPSHOT_INTERVAL)
+            try:
+                self.save_if_changed()
+            except Exception:
+                STATS.incr("snapshot_errors")
+
+SNAPSHOT = None   # set by run_server when --snapshot is given
+
+class HashWarmer:
+    """Pre-hashes files in frequently listed folders while the server is idle.
+
+    /list and /api/list hits feed exponentially decaying per-folder scores
+    and per-algorithm counts. A single background thread, reniced and set to
+    idle I/O class, hashes the hottest folders with the most used
+    algorithms into DIGESTS. It only runs once no request has been in flight
+    for WARM_IDLE seconds and stalls between chunks, mid-file, as soon as
+    one arrives.
+    """
+
+    def __init__(self):
+        self._scores = {}
+        self._algs = collections.Counter()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def _score(self, folder, now):
+        score, stamp = self._scores.get(folder, (0.0, now))
+        return score * 0.5 ** ((now - stamp) / WARM_HALF_LIFE)
+
+    def record(self, folder, hash_alg):
+        if hash_alg not in HASH_OPTIONS:
+            return
+        folder, now = os.path.abspath(folder), time.monotonic()
+        with self._lock:
+            self._scores[folder] = (self._score(folder, now) + 1.0, now)
+            self._algs[hash_alg] += 1
+            if len(self._scores) > WARM_TRACKED:
+                del self._scores[min(self._scores, key=lambda f: self._score(f, now))]
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="hash-warmer", daemon=True)
+                self._thread.start()
+
+    def hot(self):
+        """(hottest folders, most used algorithms) right now."""
+        now = time.monotonic()
+        with self._lock:
+            scored = sorted(((self._score(f, now), f) for f in self._scores), reverse=True)
+            algs = [alg for alg, _ in self._algs.most_common(WARM_ALGS)]
+        return [f for score, f in scored[:WARM_FOLDERS] if score >= WARM_MIN_SCORE], algs
+
+    def _lower_priority(self):
+        # On Linux niceness and I/O class are per thread, so only this thread is demoted
+        tid = threading.get_native_id()
+        try:
+            os.setpriority(os.PRIO_PROCESS, tid, WARM_NICE)
+        except (AttributeError, OSError):
+            pass
+        ionice = shutil.which("ionice")
+        if ionice:
+            subprocess.run([ionice, "-c", "3", "-p", str(tid)],
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    def _wait_idle(self, n=0):
+        paused = False
+        while STATS.idle_for() < WARM_IDLE:
+            paused = True
+            time.sleep(WARM_IDLE / 4)
+        if paused:
+            STATS.incr("warm_pauses")
+
+    def _run(self):
+        self._lower_priority()
+        while True:
+            time.sleep(WARM_INTERVAL)
+            try:
+                self._pass()
+            except Exception:
+                STATS.incr("warm_errors")
+
+    def _pass(self):
+        folders, algs = self.hot()
+        for folder in folders:
+            try:
+                with os.scandir(folder) as it:
+                    files = [de for de in it if not de.name.startswith('.') and de.is_file()]
+            except OSError:
+                continue
+            for de in files:
+                for hash_alg in algs:
+                    self._wait_idle()
+                    try:
+                        st = de.stat()
+                        if DIGESTS.cached(de.path, hash_alg, st):
+                            continue
+                        DIGESTS.digest(de.path, hash_alg, st, on_chunk=self._wait_idle)
+                    except OSError:
+                        continue
+                    STATS.incr("warm_files")
+                    STATS.incr("warm_bytes", st.st_size)
+
+WARMER = None   # set by run_server when --warm-hashes is given
+
+# ========== UPLOAD WRITE PATH ==========
+
+def _fsync_path(path):
+    """fsync a file or directory by name; gone or unsupported paths are skipped."""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+def _remaining_size(src):
+    """Bytes left in a seekable upload body, or None if it cannot tell."""
+    try:
+        pos = src.tell()
+        end = src.seek(0, os.SEEK_END)
+        src.seek(pos)
+        return end - pos
+    except (AttributeError, OSError, ValueError):
+        return None
+
+class UploadWriter:
+    """Writes upload bodies to disk under a configurable durability/throughput policy.
+
+    Each upload is written to '<dest>.part' in `chunk`-sized writes and then
+    renamed over dest, so readers never see a half-written file. Options:
+      prealloc    reserve the full size with posix_fallocate first (less
+                  fragmentation, ENOSPC before any data is written)
+      fsync       never: leave it to the page cache; close: fsync the file
+                  and its directory before replying; batched: queue both for
+                  a flusher thread that syncs every UPLOAD_FSYNC_INTERVAL
+      direct_min  uploads at least this large are written with O_DIRECT
+                  from an aligned buffer, bypassing the page cache (Linux);
+                  falls back to buffered writes where the filesystem refuses,
+                  whether at open() or on the first write
+    /stats gets upload_files_<policy>, upload_bytes_<policy>,
+    upload_write_seconds_<policy> and upload_fsync_seconds_<policy>.
+    """
+
+    def __init__(self, chunk=UPLOAD_CHUNK, fsync="never", prealloc=False, direct_min=0):
+        if fsync not in UPLOAD_FSYNC_POLICIES:
+            raise ValueError(f"unknown fsync policy {fsync}")
+        self.direct = direct_min > 0 and hasattr(os, "O_DIRECT") and HAS_FCNTL
+        # O_DIRECT needs the chunk to be a multiple of the alignment
+        self.chunk = max(UPLOAD_DIRECT_ALIGN, chunk // UPLOAD_DIRECT_ALIGN * UPLOAD_DIRECT_ALIGN) if self.direct else max(1, chunk)
+        self.fsync = fsync
+        self.prealloc = prealloc and hasattr(os, "posix_fallocate")
+        self.direct_min = direct_min
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._flusher = None
+
+    def save(self, src, dest):
+        size = _remaining_size(src)
+        part = dest + ".part"
+        start = time.monotonic()
+        direct = self.direct and size is not None and size >= self.direct_min
+        fd = None
+        if direct:
+            try:
+                fd = os.open(part, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | os.O_DIRECT, 0o644)
+                STATS.incr("upload_direct_files")
+            except OSError:
+                STATS.incr("upload_direct_fallbacks")
+                direct = False
+        if fd is None:
+            fd = os.open(part, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            if self.prealloc and size:
+                try:
+                    os.posix_fallocate(fd, 0, size)
+                except OSError as e:
+                    if e.errno == errno.ENOSPC:
+                        raise
+            written = self._copy_direct(src, fd) if direct else self._copy(src, fd)
+            if self.prealloc and size and written < size:
+                os.ftruncate(fd, written)
+            synced = time.monotonic()
+            if self.fsync == "close":
+                os.fsync(fd)
+        except BaseException:
+            os.close(fd)
+            os.remove(part)
+            raise
+        os.close(fd)
+        os.replace(part, dest)
+        folder = os.path.dirname(os.path.abspath(dest))
+        if self.fsync == "close":
+            _fsync_path(folder)
+        elif self.fsync == "batched":
+            self._queue(os.path.abspath(dest), folder)
+        end = time.monotonic()
+        policy = self.fsync
+        STATS.incr(f"upload_files_{policy}")
+        STATS.incr(f"upload_bytes_{policy}", written)
+        STATS.incr(f"upload_write_seconds_{policy}", synced - start)
+        STATS.incr(f"upload_fsync_seconds_{policy}", end - synced)
+        return written
+
+    def _copy(self, src, fd):
+        written = 0
+        while True:
+            data = src.read(self.chunk)
+            if not data:
+                return written
+            view = memoryview(data)
+            while view:
+                n = os.write(fd, view)
+                view = view[n:]
+                written += n
+
+    def _copy_direct(self, src, fd):
+        # An anonymous mmap is page aligned, which is what O_DIRECT wants
+        buf = mmap.mmap(-1, self.chunk)
+        view = memoryview(buf)
+        written = 0
+        try:
+            while True:
+                filled = 0
+                while filled < self.chunk:
+                    data = src.read(self.chunk - filled)
+                    if not data:
+                        break
+                    view[filled:filled + len(data)] = data
+                    filled += len(data)
+                if filled == self.chunk:
+                    direct = self._write_direct(fd, view)
+                    written += filled
+                    if not direct:
+                        return written + self._copy(src, fd)
+                    continue
+                if filled:
+                    # Unaligned tail: write a padded block, then cut the file back
+                    padded = -(-filled // UPLOAD_DIRECT_ALIGN) * UPLOAD_DIRECT_ALIGN
+                    view[filled:padded] = bytes(padded - filled)
+                    self._write_direct(fd, view[:padded])
+                    written += filled
+                    os.ftruncate(fd, written)
+                return written
+        finally:
+            view.release()
+            buf.close()
+
+    def _write_direct(self, fd, view):
+        """Write all of view to an O_DIRECT fd; returns False once O_DIRECT has been dropped.
+
+        Some filesystems accept open(O_DIRECT) and only refuse the write with
+        EINVAL. The flag is cleared on the open fd and the write retried
+        through the page cache, which also covers an unaligned short write.
+        """
+        direct = True
+        while view:
+            try:
+                n = os.write(fd, view)
+            except OSError as e:
+                if e.errno != errno.EINVAL or not direct:
+                    raise
+                flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+                fcntl.fcntl(fd, fcntl.F_SETFL, flags & ~os.O_DIRECT)
+                STATS.incr("upload_direct_fallbacks")
+                direct = False
+                continue
+            if n == 0:
+                raise OSError(errno.EIO, "short write to upload file")
+            view = view[n:]
+        return direct
+
+    def _queue(self, path, folder):
+        with self._lock:
+            self._pending.update((path, folder))
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._run, name="upload-fsync", daemon=True)
+                self._flusher.start()
+
+    def flush(self):
+        """fsync every queued upload, then the directories they were renamed into."""
+        with self._lock:
+            pending, self._pending = self._pending, set()
+        if not pending:
+            return
+        start = time.monotonic()
+        for path in sorted(pending, key=os.path.isdir):
+            _fsync_path(path)
+        STATS.incr("upload_fsync_batches")
+        STATS.incr("upload_fsync_seconds_batched", time.monotonic() - start)
+
+    def _run(self):
+        while True:
+            time.sleep(UPLOAD_FSYNC_INTERVAL)
+            self.flush()
+
+UPLOADS = UploadWriter()   # replaced by run_server with the CLI policy
+
+# ========== CONTENT-ADDRESSED UPLOAD STORE ==========
+
+class CasStore:
+    """Deduplicating upload store: each distinct upload body is kept once under its SHA-256.
+
+    Uploads are hashed while they stream into a temp file inside the store.
+    When the digest already exists the temp file is dropped, so a duplicate
+    upload costs only a link and an index update. The destination becomes a
+    reflink (FICLONE, copy-on-write) of the stored object. Where the
+    filesystem cannot reflink it becomes a hardlink, and as a last resort a
+    plain copy. Links only work within one filesystem, so uploads to a
+    folder on another device bypass the store and are written normally.
+    Hardlinked copies share one inode, so an in-place edit through the share
+    changes the stored object as well. Reference counts live in
+    index.sqlite; an object whose count drops to zero is deleted. Files
+    removed outside the server are not tracked.
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS objects (digest TEXT PRIMARY KEY, size INTEGER, refs INTEGER);
+    CREATE TABLE IF NOT EXISTS links (path TEXT PRIMARY KEY, digest TEXT);
+    """
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        self.tmp_dir = os.path.join(self.root, "tmp")
+        os.makedirs(os.path.join(self.root, "objects"), exist_ok=True)
+        os.makedirs(self.tmp_dir, exist_ok=True)
+        self.device = os.stat(self.root).st_dev
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.executescript(self.SCHEMA)
+
+    def _connect(self):
+        return sqlite3.connect(os.path.join(self.root, "index.sqlite"), timeout=30)
+
+    def object_path(self, digest):
+        return os.path.join(self.root, "objects", digest[:2], digest)
+
+    def store(self, src, dest):
+        """Save src to dest through the store; returns True when the content was already stored."""
+        if os.stat(os.path.dirname(os.path.abspath(dest))).st_dev != self.device:
+            # Could only be a full copy of the object; write it once, directly
+            STATS.incr("cas_cross_device")
+            UPLOADS.save(src, dest)
+            return False
+        h = hashlib.sha256()
+        size = 0
+        fd, tmp = tempfile.mkstemp(dir=self.tmp_dir)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                while True:
+                    chunk = src.read(CAS_CHUNK)
+                    if not chunk:
+                        break
+                    h.update(chunk)
+                    f.write(chunk)
+                    size += len(chunk)
+            digest = h.hexdigest()
+            obj = self.object_path(digest)
+            with self._lock:
+                deduped = os.path.exists(obj)
+                if not deduped:
+                    os.makedirs(os.path.dirname(obj), exist_ok=True)
+                    # Hardlinks share this mode with the uploaded file, so keep the usual one
+                    os.chmod(tmp, 0o644)
+                    os.replace(tmp, obj)
+                    tmp = None
+                STATS.incr(f"cas_link_{self._link(obj, dest)}")
+                self._record(os.path.abspath(dest), digest, size)
+        finally:
+            if tmp:
+                os.remove(tmp)
+        if deduped:
+            STATS.incr("cas_dedup_hits")
+            STATS.incr("cas_bytes_saved", size)
+        else:
+            STATS.incr("cas_objects_stored")
+        return deduped
+
+    def _link(self, obj, dest):
+        part = dest + ".cas-part"
+        if os.path.lexists(part):
+            os.remove(part)
+        try:
+            self._reflink(obj, part)
+            method = "reflink"
+        except OSError:
+            if os.path.lexists(part):
+                os.remove(part)
+            try:
+                os.link(obj, part)
+                method = "hardlink"
+            except OSError:
+                shutil.copyfile(obj, part)
+                method = "copy"
+        os.replace(part, dest)
+        # rename() is a no-op when both names already link the same inode
+        if os.path.lexists(part):
+            os.remove(part)
+        return method
+
+    @staticmethod
+    def _reflink(src, dest):
+        if not HAS_FCNTL or platform.system() != "Linux":
+            raise OSError("reflink not supported on this platform")
+        with open(src, "rb") as s, open(dest, "wb") as d:
+            fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+
+    def _record(self, path, digest, size):
+        conn = self._connect()
+        try:
+            with conn:
+                old = conn.execute("SELECT digest FROM links WHERE path=?", (path,)).fetchone()
+                if old and old[0] == digest:
+                    return
+                if old:
+                    conn.execute("UPDATE objects SET refs = refs - 1 WHERE digest=?", old)
+                    if conn.execute("SELECT refs FROM objects WHERE digest=?", old).fetchone()[0] <= 0:
+                        conn.execute("DELETE FROM objects WHERE digest=?", old)
+                        try:
+                            os.remove(self.object_path(old[0]))
+                        except OSError:
+                            pass
+                conn.execute("INSERT INTO objects (digest, size, refs) VALUES (?, ?, 1) "
+                             "ON CONFLICT(digest) DO UPDATE SET refs = refs + 1", (digest, size))
+                conn.execute("INSERT OR REPLACE INTO links (path, digest) VALUES (?, ?)", (path, digest))
+        finally:
+            conn.close()
+
+CAS_STORE = None   # set by run_server when --cas-dir is given
+
+# ========== DEBUG ENDPOINTS ==========
+
+DEBUG_TOKEN = None   # set by run_server when --debug-token is given
+
+def sample_stacks(seconds, interval=PROFILE_INTERVAL):
+    """Sample every other thread's stack for `seconds`; return collapsed stacks for flamegraph.pl.
+
+    Each line is 'thread;outer (file:line);...;inner (file:line) count'.
+    Sampling only reads sys._current_frames(), so the server threads are
+    never paused or instrumented.
+    """
+    me = threading.get_ident()
+    counts = collections.Counter()
+    deadline = time.monotonic() + seconds
+    samples = 0
+    while time.monotonic() < deadline:
+        names = {t.ident: t.name for t in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            stack.append(names.get(ident, str(ident)))
+            counts[";".join(reversed(stack))] += 1
+        samples += 1
+        time.sleep(interval)
+    lines = [f"{stack} {count}" for stack, count in counts.most_common()]
+    STATS.incr("debug_profile_samples", samples)
+    return "\n".join(lines) + "\n"
+
+MEMORY_LOCK = threading.Lock()
+MEMORY_USERS = 0             # /debug/memory requests currently inside their window
+MEMORY_OWNS_TRACING = False  # True when tracing was started here rather than by -X tracemalloc
+
+def memory_diff(seconds, top=MEMORY_TOP):
+    """tracemalloc snapshot diff over `seconds`, top allocations by growth.
+
+    Tracing is started if needed and stopped again once the last concurrent
+    request finishes, so it only costs anything while a request is running.
+    """
+    global MEMORY_USERS, MEMORY_OWNS_TRACING
+    with MEMORY_LOCK:
+        if MEMORY_USERS == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            MEMORY_OWNS_TRACING = True
+        MEMORY_USERS += 1
+    try:
+        before = tracemalloc.take_snapshot()
+        time.sleep(seconds)
+        after = tracemalloc.take_snapshot()
+    finally:
+        with MEMORY_LOCK:
+            MEMORY_USERS -= 1
+            if MEMORY_USERS == 0 and MEMORY_OWNS_TRACING:
+                tracemalloc.stop()
+                MEMORY_OWNS_TRACING = False
+    ignore = [tracemalloc.Filter(False, tracemalloc.__file__)]
+    stats = after.filter_traces(ignore).compare_to(before.filter_traces(ignore), 'lineno')
+    traced, growth = sum(s.size for s in stats), sum(s.size_diff for s in stats)
+    lines = [f"# {seconds:g}s window, top {top} by growth; traced {traced / 1024:.1f} KiB, net {growth / 1024:+.1f} KiB"]
+    lines.extend(str(stat) for stat in stats[:max(1, top)])
+    return "\n".join(lines) + "\n"
+
+# ========== POOLED SERVER MODE ==========
+
+REJECT_RESPONSE = (b"HTTP/1.1 503 Service Unavailable\r\n"
+                   b"Content-Type: text/plain\r\n"
+                   b"Content-Length: 20\r\n"
+                   b"Retry-After: 1\r\n"
+                   b"Connection: close\r\n\r\n"
+                   b"Server is saturated\n")
+
+class DeadlineWatchdog:
+    """One timer thread that shuts down sockets whose read deadline has passed.
+
+    A socket timeout only bounds a single recv(), so a client trickling one
+    byte at a time never trips it. Shutting the socket down unblocks the
+    pending read however it is buffered.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._heap = []
+        self._armed = set()
+        self._tokens = itertools.count()
+        threading.Thread(target=self._run, name="deadline-watchdog", daemon=True).start()
+
+    def arm(self, sock, seconds):
+        token = next(self._tokens)
+        with self._cond:
+            heapq.heappush(self._heap, (time.monotonic() + seconds, token, sock))
+            self._armed.add(token)
+            self._cond.notify()
+        return token
+
+    def disarm(self, token):
+        with self._cond:
+            self._armed.discard(token)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._heap:
+                    self._cond.wait()
+                    continue
+                when, token, sock = self._heap[0]
+                delay = when - time.monotonic()
+                if delay > 0:
+                    self._cond.wait(delay)
+                    continue
+                heapq.heappop(self._heap)
+                if token not in self._armed:
+                    continue
+                self._armed.discard(token)
+            STATS.incr("deadline_expired")
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+class _DeadlineBody:
+    """rfile proxy that calls on_done once Content-Length bytes were consumed."""
+
+    def __init__(self, rfile, length, on_done):
+        self._rfile = rfile
+        self._remaining = length
+        self._on_done = on_done
+
+    def _consumed(self, n):
+        self._remaining -= n
+        if self._remaining <= 0 and self._on_done:
+            self._on_done()
+            self._on_done = None
+
+    def read(self, size=-1):
+        data = self._rfile.read(size)
+        self._consumed(len(data))
+        return data
+
+    def readline(self, size=-1):
+        data = self._rfile.readline(size)
+        self._consumed(len(data))
+        return data
+
+    def readinto(self, buf):
+        n = self._rfile.readinto(buf)
+        self._consumed(n or 0)
+        return n
+
+    def __getattr__(self, name):
+        return getattr(self._rfile, name)
+
+class PooledRequestHandler(DarkEntropyFileServerHandler):
+    """Handler used by PooledHTTPServer: keep-alive plus header/body deadlines."""
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        self._served = 0
+
+    def handle_one_request(self):
+        srv = self.server
+        # Wait for the first byte of the next request; an idle keep-alive
+        # connection gives its worker back after keepalive_timeout.
+        self.connection.settimeout(srv.keepalive_timeout if self._served else srv.header_timeout)
+        try:
+            if not self.rfile.peek(1):
+                self.close_connection = True
+                return
+        except OSError:
+            if self._served:
+                STATS.incr("keepalive_idle_closed")
+            self.close_connection = True
+            return
+        self.connection.settimeout(srv.header_timeout)
+        self._deadline = srv.watchdog.arm(self.connection, srv.header_timeout)
+        self._sent_length = False
+        rfile = self.rfile
+        try:
+            super().handle_one_request()
+        finally:
+            srv.watchdog.disarm(self._deadline)
+            self.rfile = rfile
+        self._served += 1
+
+    def parse_request(self):
+        ok = super().parse_request()
+        srv = self.server
+        srv.watchdog.disarm(self._deadline)
+        if ok:
+            self.connection.settimeout(srv.body_timeout)
+            try:
+                length = int(self.headers.get('Content-Length') or 0)
+            except ValueError:
+                length = 0
+            if length > 0:
+                token = self._deadline = srv.watchdog.arm(self.connection, srv.body_timeout)
+                self.rfile = _DeadlineBody(self.rfile, length, lambda: srv.watchdog.disarm(token))
+        return ok
+
+    def send_header(self, keyword, value):
+        if keyword.lower() in ('content-length', 'transfer-encoding'):
+            self._sent_length = True
+        super().send_header(keyword, value)
+
+    def end_headers(self):
+        # Responses written without a length are delimited by closing the socket.
+        if not self._sent_length and not self.close_connection:
+            self.send_header("Connection", "close")
+        super().end_headers()
+
+class PooledHTTPServer(socketserver.TCPServer):
+    """Fixed worker pool fed by a bounded accept queue.
+
+    Accepted sockets wait in the queue for a free worker. When the queue is
+    full the connection gets an immediate 503 instead of a new thread.
+    """
+
+    def __init__(self, server_address, handler, workers=8, queue_size=DEFAULT_QUEUE_SIZE,
+                 header_timeout=DEFAULT_HEADER_TIMEOUT, body_timeout=DEFAULT_BODY_TIMEOUT,
+                 keepalive_timeout=DEFAULT_KEEPALIVE_TIMEOUT):
+        if queue_size < 1:
+            # Queue(maxsize=0) is unbounded, which would disable admission control.
+            raise ValueError(f"queue_size must be at least 1, got {queue_size}")
+        self.workers = workers
+        self.header_timeout = header_timeout
+        self.body_timeout = body_timeout
+        self.keepalive_timeout = keepalive_timeout
+        self.pending = queue.Queue(maxsize=queue_size)
+        self.watchdog = DeadlineWatchdog()
+        self._busy = 0
+        self._queue_high_water = 0
+        self._lock = threading.Lock()
+        super().__init__(server_address, handler)
+        for i in range(workers):
+            threading.Thread(target=self._worker, name=f"worker-{i}", daemon=True).start()
+
+    def process_request(self, request, client_address):
+        try:
+            self.pending.put_nowait((request, client_address))
+        except queue.Full:
+            STATS.incr("rejected_503")
+            self._reject(request)
+            return
+        STATS.incr("accepted")
+        depth = self.pending.qsize()
+        with self._lock:
+            if depth > self._queue_high_water:
+                self._queue_high_water = depth
+
+    def _reject(self, request):
+        try:
+            request.setblocking(False)
+            request.send(REJECT_RESPONSE)
+        except OSError:
+            pass
+        self.shutdown_request(request)
+
+    def _worker(self):
+        while True:
+            request, client_address = self.pending.get()
+            with self._lock:
+                self._busy += 1
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+                with self._lock:
+                    self._busy -= 1
+
+    def gauges(self):
+        with self._lock:
+            return {
+                "pool_workers": self.workers,
+                "pool_busy": self._busy,
+                "queue_depth": self.pending.qsize(),
+                "queue_capacity": self.pending.maxsize,
+                "queue_high_water": self._queue_high_water,
+            }
+
+# ========== FETCH CLIENT ==========
+
+def parse_byte_range(header, size):
+    """(start, end) for a single 'bytes=' range, None if unsatisfiable; ValueError if unusable."""
+    unit, _, spec = header.partition('=')
+    if unit.strip().lower() != 'bytes' or ',' in spec:
+        raise ValueError(header)
+    first, _, last = spec.strip().partition('-')
+    if not first:
+        suffix = int(last)
+        if suffix <= 0 or size == 0:
+            return None
+        return max(0, size - suffix), size - 1
+    start = int(first)
+    if last and int(last) < start:
+        # Invalid rather than unsatisfiable (RFC 9110 14.2): ignore it and send the whole file
+        raise ValueError(header)
+    if start >= size:
+        return None
+    end = min(int(last), size - 1) if last else size - 1
+    return start, end
+
+class FetchError(Exception):
+    pass
+
+def _http_connection(url, timeout=FETCH_TIMEOUT):
+    parts = urlsplit(url)
+    cls = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+    target = parts.path or '/'
+    if parts.query:
+        target += '?' + parts.query
+    return cls(parts.netloc, timeout=timeout), target
+
+def _fetch_output_name(url, response):
+    disposition = response.getheader('Content-Disposition') or ''
+    match = re.search(r'filename="?([^";]+)"?', disposition)
+    if match:
+        return os.path.basename(match.group(1))
+    parts = urlsplit(url)
+    file_param = parse_qs(parts.query).get('file', [None])[0]
+    return os.path.basename(file_param or parts.path) or 'download'
+
+def _pwrite(f, lock, data, offset):
+    if hasattr(os, 'pwrite'):
+        os.pwrite(f.fileno(), data, offset)
+    else:
+        with lock:
+            f.seek(offset)
+            f.write(data)
+
+def _server_digest(url):
+    """SHA-256 from the DarkEntropy /hash endpoint for a /download URL, else None."""
+    parts = urlsplit(url)
+    if parts.path != '/download':
+        return None
+    file_param = parse_qs(parts.query).get('file', [None])[0]
+    conn, _ = _http_connection(url, FETCH_HASH_TIMEOUT)
+    try:
+        conn.request('GET', '/hash?' + urlencode({'file': file_param, 'alg': 'sha256'}))
+        response = conn.getresponse()
+        body = response.read()
+        return json.loads(body).get('digest') if response.status == 200 else None
+    finally:
+        conn.close()
+
+class SegmentedDownload:
+    """Parallel byte-range download into a preallocated file, resumable via a sidecar state file.
+
+    HEAD gives size, ETag and range support. The file is split into one
+    segment per connection, each written in place with pwrite and retried
+    independently. Progress is saved in <out>.fetch-state, so a rerun
+    continues where it stopped, as long as the server's size and ETag still
+    match. If-Range makes the server answer 200 instead of 206 when the file
+    changed mid-download, which aborts instead of mixing versions.
+    """
+
+    def __init__(self, url, out=None, connections=FETCH_CONNECTIONS):
+        self.url = url
+        self.out = out
+        self.connections = max(1, connections)
+        self.size = None
+        self.etag = None
+        self.segments = []   # [start, end, done]
+        self._lock = threading.Lock()
+        self._failed = None
+
+    @property
+    def state_path(self):
+        return self.out + '.fetch-state'
+
+    def probe(self):
+        conn, target = _http_connection(self.url)
+        try:
+            conn.request('HEAD', target)
+            response = conn.getresponse()
+            response.read()
+        finally:
+            conn.close()
+        if response.status != 200:
+            raise FetchError(f"HEAD {self.url}: HTTP {response.status}")
+        if self.out is None:
+            self.out = _fetch_output_name(self.url, response)
+        length = response.getheader('Content-Length')
+        self.size = int(length) if length is not None else None
+        self.etag = response.getheader('ETag')
+        return (response.getheader('Accept-Ranges') or '').lower() == 'bytes' and self.size is not None
+
+    def _plan(self):
+        try:
+            with open(self.state_path) as f:
+                state = json.load(f)
+            if (state['url'], state['size'], state['etag']) == (self.url, self.size, self.etag) and os.path.exists(self.out):
+                self.segments = state['segments']
+                return True
+        except (OSError, ValueError, KeyError):
+            pass
+        step = -(-self.size // self.connections) or 1
+        self.segments = [[start, min(start + step, self.size) - 1, 0] for start in range(0, self.size, step)]
+        return False
+
+    def _save_state(self):
+        with self._lock:
+            state = {'url': self.url, 'size': self.size, 'etag': self.etag, 'segments': self.segments}
+        tmp = self.state_path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp, self.state_path)
+
+    def done_bytes(self):
+        with self._lock:
+            return sum(seg[2] for seg in self.segments)
+
+    def _segment_worker(self, seg, f):
+        attempts = 0
+        while seg[0] + seg[2] <= seg[1] and self._failed is None:
+            conn, target = _http_connection(self.url)
+            try:
+                headers = {'Range': f'bytes={seg[0] + seg[2]}-{seg[1]}'}
+                if self.etag:
+                    headers['If-Range'] = self.etag
+                conn.request('GET', target, headers=headers)
+                response = conn.getresponse()
+                if response.status == 200:
+                    raise FetchError("server ignored the range or the file changed; restart the download")
+                if response.status != 206:
+                    raise OSError(f"HTTP {response.status}")
+                while seg[0] + seg[2] <= seg[1]:
+                    chunk = response.read(min(FETCH_CHUNK, seg[1] - seg[0] - seg[2] + 1))
+                    if not chunk:
+                        raise OSError("connection closed mid-segment")
+                    _pwrite(f, self._lock, chunk, seg[0] + seg[2])
+                    with self._lock:
+                        seg[2] += len(chunk)
+                attempts = 0
+            except FetchError as e:
+                self._failed = e
+            except (OSError, http.client.HTTPException) as e:
+                attempts += 1
+                if attempts >= FETCH_RETRIES:
+                    self._failed = FetchError(f"segment {seg[0]}-{seg[1]} failed {attempts} times: {e}")
+                else:
+                    time.sleep(min(8, 2 ** attempts / 2))
+            finally:
+                conn.close()
+
+    def run(self, progress=None):
+        if not self.probe():
+            return self._single_stream(progress)
+        resumed = self._plan()
+        with open(self.out, 'r+b' if resumed else 'w+b') as f:
+            if not resumed:
+                if hasattr(os, 'posix_fallocate') and self.size:
+                    try:
+                        os.posix_fallocate(f.fileno(), 0, self.size)
+                    except OSError:
+                        f.truncate(self.size)
+                else:
+                    f.truncate(self.size)
+            workers = [threading.Thread(target=self._segment_worker, args=(seg, f), daemon=True)
+                       for seg in self.segments if seg[0] + seg[2] <= seg[1]]
+            for worker in workers:
+                worker.start()
+            while any(worker.is_alive() for worker in workers):
+                time.sleep(1)
+                self._save_state()
+                if progress:
+                    progress(self.done_bytes(), self.size)
+            for worker in workers:
+                worker.join()
+        if self._failed:
+            self._save_state()
+            raise self._failed
+        if os.path.exists(self.state_path):
+            os.remove(self.state_path)
+        if progress:
+            progress(self.size, self.size)
+        return self.out
+
+    def _single_stream(self, progress=None):
+        conn, target = _http_connection(self.url)
+        try:
+            conn.request('GET', target)
+            response = conn.getresponse()
+            if response.status != 200:
+                raise FetchError(f"GET {self.url}: HTTP {response.status}")
+            done = 0
+            with open(self.out, 'wb') as f:
+                while True:
+                    chunk = response.read(FETCH_CHUNK)
+                    if not chunk:
+                        break
+                    f.write(chunk)
+                    done += len(chunk)
+                    if progress:
+                        progress(done, self.size)
+        finally:
+            conn.close()
+        return self.out
+
+def fetch_main(argv):
+    parser = argparse.ArgumentParser(prog="DarkEntropyFileServer.py fetch",
+                                     description="Parallel ranged download with resume and SHA-256 verification")
+    parser.add_argument("url")
+    parser.add_argument("-c", "--connections", type=int, default=FETCH_CONNECTIONS, help="Parallel connections (default 8)")
+    parser.add_argument("-o", "--output", help="Output file (default: name from the server)")
+    parser.add_argument("--sha256", help="Expected SHA-256 (default: ask the server's /hash endpoint)")
+    parser.add_argument("--no-verify", action="store_true", help="Skip the final digest check")
+    args = parser.parse_args(argv)
+
+    def progress(done, total):
+        if total:
+            print(f"\r{done / total:6.1%}  {done / 1024 / 1024:.1f} / {total / 1024 / 1024:.1f} MB", end="", file=sys.stderr)
+
+    download = SegmentedDownload(args.url, args.output, args.connections)
+    try:
+        out = download.run(progress)
+    except (FetchError, OSError, http.client.HTTPException) as e:
+        print(f"\nDownload failed: {e}", file=sys.stderr)
+        if download.out and os.path.exists(download.state_path):
+            print("Run the same command again to resume.", file=sys.stderr)
+        return 1
+    print(f"\nSaved {out}", file=sys.stderr)
+    if args.no_verify:
+        return 0
+    try:
+        expected = args.sha256 or _server_digest(args.url)
+    except (OSError, http.client.HTTPException, ValueError) as e:
+        print(f"Server digest unavailable ({e}); not verified.", file=sys.stderr)
+        return 0
+    if not expected:
+        print("No server digest available; not verified.", file=sys.stderr)
+        return 0
+    actual = file_digest(out, 'sha256')
+    if actual != expected.lower():
+        print(f"SHA-256 MISMATCH: expected {expected}, got {actual}", file=sys.stderr)
+        return 2
+    print(f"SHA-256 verified: {actual}", file=sys.stderr)
+    return 0
+
 def kill_pid_on_port(port):
     if platform.system() == 'Linux':
         try:
@@ -656,14 +3224,44 @@ def kill_pid_on_port(port):
     else:
         print("Kill by port not implemented for this OS.")
 
-def run_server(bind_addr, port, show_hidden):
-    handler = DarkEntropyFileServerHandler
-    handler.show_hidden = show_hidden
-    with socketserver.ThreadingTCPServer((bind_addr, port), handler) as httpd:
+def run_server(bind_addr, port, show_hidden, pool=None, index_db=None, cas_dir=None, debug_token=None,
+               snapshot=None, warm_hashes=False, upload=None):
+    global CONTENT_INDEX, CAS_STORE, DEBUG_TOKEN, SNAPSHOT, WARMER, UPLOADS
+    DEBUG_TOKEN = debug_token
+    if upload:
+        UPLOADS = UploadWriter(**upload)
+    if warm_hashes:
+        WARMER = HashWarmer()
+    if snapshot:
+        SNAPSHOT = SnapshotStore(snapshot)
+        SNAPSHOT.start()
+    if snapshot or UPLOADS.fsync == "batched":
+        # /kill sends SIGTERM; turn it into a normal shutdown so state is flushed
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    if cas_dir:
+        CAS_STORE = CasStore(cas_dir)
+        if CAS_STORE.device != os.stat('.').st_dev:
+            print(f"CAS disabled: {cas_dir} is not on the same filesystem as the share, "
+                  "so every object would be stored twice")
+            CAS_STORE = None
+    if index_db:
+        CONTENT_INDEX = ContentIndex('.', index_db, show_hidden)
+        CONTENT_INDEX.start()
+    if pool and pool.get("workers", 0) > 0:
+        handler = PooledRequestHandler
+        handler.show_hidden = show_hidden
+        httpd = PooledHTTPServer((bind_addr, port), handler, **pool)
+    else:
+        handler = DarkEntropyFileServerHandler
+        handler.show_hidden = show_hidden
+        httpd = socketserver.ThreadingTCPServer((bind_addr, port), handler)
+    with httpd:
         sa = httpd.socket.getsockname()
         print("[DarkEntropy File Share]")
         print(f"PID: {os.getpid()}")
         print(f"Port: {sa[1]}")
+        if isinstance(httpd, PooledHTTPServer):
+            print(f"Pool: {httpd.workers} workers, queue {httpd.pending.maxsize}")
         print("\nLinks:")
         print(f"  http://127.0.0.1:{sa[1]}/")
         try:
@@ -675,20 +3273,61 @@ def run_server(bind_addr, port, show_hidden):
         print(f"\n(Press Ctrl+C to quit or use 'kill {os.getpid()}')")
         try:
             httpd.serve_forever()
-        except KeyboardInterrupt:
+        except (KeyboardInterrupt, SystemExit):
             print("\nShutting down...")
             httpd.server_close()
+        finally:
+            UPLOADS.flush()
+            if SNAPSHOT:
+                SNAPSHOT.save_if_changed()
 
 if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "fetch":
+        sys.exit(fetch_main(sys.argv[2:]))
+
     parser = argparse.ArgumentParser(description="DarkEntropy Cyber-Themed File Share Server")
     parser.add_argument("-p", "--port", type=int, default=DEFAULT_PORT, help="Port to bind (default 9000)")
     parser.add_argument("-b", "--bind", default="0.0.0.0", help="Address to bind (default 0.0.0.0)")
     parser.add_argument("-k", "--kill", type=int, help="Kill process using this port and exit")
     parser.add_argument("-s", "--show-hidden", action="store_true", help="Show hidden files in listings")
+    parser.add_argument("--index-content", action="store_true", help="Index text file contents in the background for /grep")
+    parser.add_argument("--index-db", default=INDEX_DB_NAME, help=f"Content index database (default ./{INDEX_DB_NAME})")
+    parser.add_argument("--snapshot", help="Persist digests and directory sizes to this file for fast listings after restart")
+    parser.add_argument("--warm-hashes", action="store_true", help="Pre-hash frequently listed folders in the background while idle")
+    parser.add_argument("--upload-chunk", type=int, default=UPLOAD_CHUNK, help="Upload write size in bytes (default 1 MiB)")
+    parser.add_argument("--upload-prealloc", action="store_true", help="Reserve upload space up front with posix_fallocate")
+    parser.add_argument("--upload-fsync", choices=UPLOAD_FSYNC_POLICIES, default="never", help="When uploads are fsynced: never, on close, or batched in the background (default never)")
+    parser.add_argument("--upload-direct-min", type=int, default=0, help="Write uploads of at least this many bytes with O_DIRECT (default 0 = off)")
+    parser.add_argument("--cas-dir", help="Deduplicate uploads into a content-addressed store at this path (same filesystem as the share)")
+    parser.add_argument("--debug-token", help="Enable /debug/profile and /debug/memory for requests sending this token in X-Debug-Token")
+    parser.add_argument("-w", "--workers", type=int, default=DEFAULT_WORKERS, help="Serve with a fixed pool of N workers (default 0 = thread per connection)")
+    parser.add_argument("--queue-size", type=int, default=DEFAULT_QUEUE_SIZE, help="Pooled mode: connections allowed to wait for a worker before 503 (default 64)")
+    parser.add_argument("--header-timeout", type=float, default=DEFAULT_HEADER_TIMEOUT, help="Pooled mode: seconds allowed for request line and headers (default 10)")
+    parser.add_argument("--body-timeout", type=float, default=DEFAULT_BODY_TIMEOUT, help="Pooled mode: seconds allowed for reading a request body (default 300)")
+    parser.add_argument("--keepalive-timeout", type=float, default=DEFAULT_KEEPALIVE_TIMEOUT, help="Pooled mode: idle seconds allowed between keep-alive requests (default 5)")
     args = parser.parse_args()
 
     if args.kill:
         kill_pid_on_port(args.kill)
         sys.exit(0)
 
-    run_server(args.bind, args.port, args.show_hidden)
+    pool = {
+        "workers": args.workers,
+        "queue_size": args.queue_size,
+        "header_timeout": args.header_timeout,
+        "body_timeout": args.body_timeout,
+        "keepalive_timeout": args.keepalive_timeout,
+    }
+    upload = {
+        "chunk": args.upload_chunk,
+        "fsync": args.upload_fsync,
+        "prealloc": args.upload_prealloc,
+        "direct_min": args.upload_direct_min,
+    }
+    if args.workers and args.queue_size < 1:
+        parser.error("--queue-size must be at least 1")
+    if (args.index_content or args.cas_dir) and not HAS_SQLITE:
+        parser.error("--index-content and --cas-dir need Python built with sqlite3")
+    run_server(args.bind, args.port, args.show_hidden, pool,
+               args.index_db if args.index_content else None, args.cas_dir, args.debug_token, args.snapshot,
+               args.warm_hashes, upload)